@@ -3,8 +3,8 @@
 // Description: Define the dashboard page of our application and its functionality
 // Programmers: Nifemi Lawal, Blake Carlson, Jack Bauer
 // Creation date: 10/24/25
-// Last revision date: 12/03/25
-// Revisions: 1.4
+// Last revision date: 10/19/26
+// Revisions: 1.5
 // Pre/post conditions
 //   - Pre: None.
 //   - Post: None.
@@ -36,6 +36,13 @@ import "../components/Tracks.css";
 import "../components/SongOfTheDay.css";
 import {useParams, Navigate} from "react-router-dom"
 
+// Identify a single play by track and time. Spotify returns "2025-12-03T18:04:05.123Z" and the
+// database route returns "2025-12-03 18:04:05.123000+00:00", so compare the parsed instant.
+function playKey(track) {
+  const playedAt = Date.parse(String(track.played_at).replace(" ", "T"));
+  return `${track.id}@${Number.isNaN(playedAt) ? track.played_at : playedAt}`;
+}
+
 async function refreshUserToken() {
   // Refresh the user's token
   const response = await fetch("http://127.0.0.1:5000/refresh-user-token", {
@@ -52,21 +59,14 @@ async function refreshUserToken() {
   return [responseCode, responseMessage];
 }
 
-// Function to retrieve user information frome the backend API
+// Function to retrieve everything the dashboard shows from the backend API in one request:
+// the logged-in user's info, the viewed user's info, listening history and scores, and the song of the day
 // - Should not block the main thread
-async function fetchUserInfo() {
+async function fetchDashboard(viewedUserId) {
   try {
-    // Send GET request to backend API to get user information
-    const response = await fetch("http://127.0.0.1:5000/get-user-info", {
-      credentials: "include",
-      mode: "cors",
-    });
-    const updateDivScore = await fetch("http://127.0.0.1:5000/get-user-diversity-score", {
-      credentials: "include",
-      mode: "cors",
-    });
-
-    const updateTasteScore = await fetch("http://127.0.0.1:5000/get-user-taste-score", {
+    // Without a valid id in the url, the backend returns the logged-in user's own dashboard
+    const path = /^\d+$/.test(viewedUserId ?? "") ? `/dashboard/${viewedUserId}` : "/dashboard";
+    const response = await fetch(`http://127.0.0.1:5000${path}`, {
       credentials: "include",
       mode: "cors",
     });
@@ -79,67 +79,8 @@ async function fetchUserInfo() {
     if (responseCode === 200) {
       return [
         {
-          message: "User information successfully retrieved",
-          user_info: data.user_info,
-        },
-        responseCode,
-      ];
-    }
-
-    // Unauthorized response
-    else if (responseCode === 401) {
-      // Return error message and redirect to login
-      const responseErrorMessage = data.error;
-      const needsRefresh = data.needs_refresh;
-
-      // If user token is expired, try to refresh
-      if (needsRefresh === true) {
-        const [refreshResponseCode, refreshResponseErrorMessage] =
-          await refreshUserToken();
-        if (refreshResponseCode === 200) {
-          // Retry the original request with the new token
-          return await fetchUserInfo();
-        } else {
-          return [{ error: refreshResponseErrorMessage }, refreshResponseCode];
-        }
-      } else {
-        window.location.href = "http://127.0.0.1:3000/login";
-        return [
-          {
-            error: responseErrorMessage,
-          },
-          responseCode,
-        ];
-      }
-    }
-    // Unknown error response
-    else {
-      return [{ error: "Unknown error" }, responseCode];
-    }
-  } catch (error) {
-    console.error("Error fetching user information:", error);
-    return [{ error: "Error fetching user information" }, 500];
-  }
-}
-
-async function fetchOtherUserInfo(user_id) {
-  try {
-    // Send GET request to backend API to get user information
-    const response = await fetch(`http://127.0.0.1:5000/get-user-info-by-id/${user_id}`, {
-      credentials: "include",
-      mode: "cors",
-    });
-    // Get response code from response
-    const responseCode = response.status;
-    // Jsonify response from backend API
-    const data = await response.json();
-    console.log(data)
-    // OK response
-    if (responseCode === 200) {
-      return [
-        {
-          message: "User information successfully retrieved",
-          user_info: data.user_info
+          message: "Dashboard successfully retrieved",
+          ...data,
         },
         responseCode,
       ];
@@ -157,7 +98,7 @@ async function fetchOtherUserInfo(user_id) {
           await refreshUserToken();
         if (refreshResponseCode === 200) {
           // Retry the original request with the new token
-          return await fetchUserInfo();
+          return await fetchDashboard(viewedUserId);
         } else {
           return [{ error: refreshResponseErrorMessage }, refreshResponseCode];
         }
@@ -176,65 +117,11 @@ async function fetchOtherUserInfo(user_id) {
       return [{ error: "Unknown error" }, responseCode];
     }
   } catch (error) {
-    console.error("Error fetching user information:", error);
-    return [{ error: "Error fetching user information" }, 500];
+    console.error("Error fetching dashboard:", error);
+    return [{ error: "Error fetching dashboard" }, 500];
   }
 }
 
-async function getUserListeningHistory(viewedUserId) {
-  try {
-    const response = await fetch(
-      `http://127.0.0.1:5000/get-user-listening-history-by-id/${viewedUserId}`,
-      {
-        credentials: "include",
-        mode: "cors",
-      },
-    );
-    // Get response code from response
-    const responseCode = response.status;
-    // Jsonify response from backend API
-    const data = await response.json();
-    console.log(data);
-
-    // OK response
-    if (responseCode === 200) {
-      return [
-        {
-          message: "User listening history successfully retrieved",
-          user_listening_history: data.user_listening_history,
-        },
-        responseCode,
-      ];
-    }
-    // Unauthorized response
-    else if (responseCode === 401) {
-      const responseErrorMessage = data.error;
-      const needsRefresh = data.needs_refresh;
-
-      // If user token is expired, try to refresh
-      if (needsRefresh === true) {
-        const [refreshResponseCode, refreshResponseErrorMessage] =
-          await refreshUserToken();
-        if (refreshResponseCode === 200) {
-          // Retry the original request with the new token
-          return await getUserListeningHistory(viewedUserId);
-        } else {
-          return [{ error: refreshResponseErrorMessage }, refreshResponseCode];
-        }
-      } else {
-        window.location.href = "http://127.0.0.1:3000/login";
-        return [{ error: responseErrorMessage }, responseCode];
-      }
-    }
-    // Unknown error response
-    else {
-      return [{ error: "Unknown error" }, responseCode];
-    }
-  } catch (error) {
-    console.error("Error fetching user listening history:", error);
-    return [{ error: "Error fetching user listening history" }, 500];
-  }
-}
 // Function that fetches the listening history of a user given their stored internal id retrieved from url.
 async function fetchUserListeningHistory(viewingId) {
   try {
@@ -291,90 +178,6 @@ async function fetchUserListeningHistory(viewingId) {
   }
 }
 
-// Function to retrieve user diversity score from the backend API
-async function fetchUserDiversityScore(viewingId) {
-  const response = await fetch(
-    `http://127.0.0.1:5000/get-user-diversity-score-by-id/${viewingId}`,
-    {
-      credentials: "include",
-      mode: "cors",
-    },
-  );
-  const data = await response.json();
-  data.diversity_score = (data.diversity_score * 100).toFixed(2);
-  return data.diversity_score;
-}
-
-// Function to retrieve user taste score from the backend API
-async function fetchUserTasteScore(viewingSpotifyId) {
-  const response = await fetch(
-    `http://127.0.0.1:5000/get-user-taste-score-by-id/${viewingSpotifyId}`,
-    {
-      credentials: "include",
-      mode: "cors",
-    },
-  );
-  const data = await response.json();
-  data.taste_score = (data.taste_score * 100).toFixed(2);
-  return data.taste_score;
-}
-
-// Function to fetch song of the day from the backend API
-async function fetchSongOfTheDay() {
-  try {
-    const response = await fetch(
-      "http://127.0.0.1:5000/get-song-of-the-day",
-      {
-        credentials: "include",
-        mode: "cors",
-      },
-    );
-
-    // Get response code from response
-    const responseCode = response.status;
-    // Jsonify response from backend API
-    const data = await response.json();
-
-    // OK response
-    if (responseCode === 200) {
-      return [
-        {
-          message: "Song of the day successfully retrieved",
-          song_of_the_day: data.song_of_the_day,
-        },
-        responseCode,
-      ];
-    }
-    // Unauthorized response
-    else if (responseCode === 401) {
-      const responseErrorMessage = data.error;
-      const needsRefresh = data.needs_refresh;
-
-      // If user token is expired, try to refresh
-      if (needsRefresh === true) {
-        const [refreshResponseCode, refreshResponseErrorMessage] =
-          await refreshUserToken();
-        if (refreshResponseCode === 200) {
-          // Retry the original request with the new token
-          return await fetchSongOfTheDay();
-        } else {
-          return [{ error: refreshResponseErrorMessage }, refreshResponseCode];
-        }
-      } else {
-        window.location.href = "http://127.0.0.1:3000/login";
-        return [{ error: responseErrorMessage }, responseCode];
-      }
-    }
-    // Unknown error response
-    else {
-      return [{ error: "Unknown error" }, responseCode];
-    }
-  } catch (error) {
-    console.error("Error fetching song of the day:", error);
-    return [{ error: "Error fetching song of the day" }, 500];
-  }
-}
-
 
 function calculateTracksPerPage() { }
 
@@ -496,39 +299,18 @@ function Dashboard() {
     }
 
     if (fetchCode === 200) {
-      // If we've sucessfully fetched listening history from Spotify, we need to check
-      // if its different than what we currently have in the frontend and if so, update it.  
-      let listening_history_len = fetchResponse['user_listening_history'].length
-      let listening_history_to_compare = []
-      for (let i = 0; i < listening_history_len; i+= 1) {
-        // We fetch much less listening history from spotify than we have in the database, so 
-        // ensure that we only compare the recent data. 
-        listening_history_to_compare.push(userListeningHistory[i])
-      }
-      let combinedListeningHistory = null
-
-      // Iterate through both lists to see if the received listening history is the same
-      // We'll just make sure track name's match, that should be sufficient. 
-      let same = true;
-      for (let i = 0; i < listening_history_len; i+= 1) {
-        if (listening_history_to_compare[i].track_name !== fetchResponse['user_listening_history'][i].track_name) {
-          same = false; 
-          console.log("Failed at:", i, listening_history_to_compare[i].track_name, fetchResponse['user_listening_history'][i].track_name);
-        }
+      // The server only returns plays newer than the last sync, so put them in front of what we
+      // already have while the database job runs in the background on the server. A play that is
+      // already in the list (e.g. from an overlapping fetch) is only kept once.
+      const currentHistory = userListeningHistory || [];
+      const knownPlays = new Set(currentHistory.map(playKey));
+      const newPlays = fetchResponse['user_listening_history'].filter(
+        (track) => !knownPlays.has(playKey(track)),
+      );
+      if (newPlays.length > 0) {
+        setUserListeningHistory(newPlays.concat(currentHistory));
       }
 
-      // If listening histories between the new data from Spotify and what we already have are the same, then we keep everything the same.
-      // Otherwise, we add the new data to our client's internal listening history list while the database job runs in the background on the server.
-      if (same) {
-        console.log("listening histories are equivalent")
-        combinedListeningHistory = userListeningHistory
-      }
-      else {
-        console.log("listening histories are NOT equivalent")
-        combinedListeningHistory = fetchResponse['user_listening_history'].concat(userListeningHistory)
-      }
-      setUserListeningHistory(combinedListeningHistory);
-      
     } else {
       // If we run into an error, say so
       console.error(
@@ -551,91 +333,42 @@ function Dashboard() {
       await new Promise((resolve) => setTimeout(resolve, 700));
       
       try {
-        // Fetch user info 
-        const [userInfoResult] = await Promise.all([
-          fetchUserInfo(),
-        ]);
-
-        const [otherResult, otherCode] = await fetchOtherUserInfo(viewedUserId);
+        // One request for the whole dashboard
+        const [dashboard, dashboardCode] = await fetchDashboard(viewedUserId);
 
-        if (otherCode === 200) {
-          const otherUser = otherResult.user_info[0];
-          setOtherUserInfo(otherUser);
-        }
-
-        // Fetch listening history 
-        // (we have to do this sequentially unfortunately since listening history depends on spotify_id)
-        const [listeningHistoryResult] = await Promise.all([
-          getUserListeningHistory(viewedUserId),
-        ]);
-
-        // Destructure results
-        const [userInfoResponse, userInfoResponseCode] = userInfoResult;
-        const [listeningHistoryResponse, listeningHistoryResponseCode] =
-          listeningHistoryResult;
-
-        if (userInfoResponseCode === 200) {
-          setUserInfo(userInfoResponse["user_info"]);
+        if (dashboardCode === 200 && dashboard.user_info) {
+          setUserInfo(dashboard.user_info);
         } else {
           // If user info fetch fails, redirect to login
           window.location.href = "http://127.0.0.1:3000/login";
           return;
         }
-        // Handle listening history response (can fail independently)
-        if (listeningHistoryResponseCode === 200) {
-          setUserListeningHistory(
-            listeningHistoryResponse["user_listening_history"],
-          );
-        } else {
-          // Log error but don't block dashboard since user info is more critical
-          console.error(
-            "Failed to fetch listening history:",
-            listeningHistoryResponse["error"],
-          );
-          setUserListeningHistory([]); // Set empty array on failure
-          setSongOfTheDay(null); // Set null when history fails
-        }
 
-        // Fetch diversity score
-        try {
-          const diversity = await fetchUserDiversityScore(viewedUserId);
-          setDiversityScore(diversity);
-        } catch (err) {
-          console.error("Failed to fetch diversity score:", err);
-          setDiversityScore(null);
+        // Missing for an unknown id, which sends us to our own dashboard
+        if (dashboard.viewed_user_info) {
+          setOtherUserInfo(dashboard.viewed_user_info);
         }
 
-        // Fetch taste score
-        try {
-          const taste = await fetchUserTasteScore(viewedUserId);
-          setTasteScore(taste);
-        } catch (err) {
-          console.error("Failed to fetch taste score:", err);
-          setTasteScore(null);
+        // Listening history (can fail independently)
+        if (dashboard.user_listening_history) {
+          setUserListeningHistory(dashboard.user_listening_history);
+        } else {
+          // Log error but don't block dashboard since user info is more critical
+          console.error("Failed to fetch listening history");
+          setUserListeningHistory([]); // Set empty array on failure
         }
 
-        // Fetch song of the day from backend
-        try {
-          const [songOfTheDayResult] = await Promise.all([
-            fetchSongOfTheDay(),
-          ]);
-          const [songOfTheDayResponse, songOfTheDayResponseCode] = songOfTheDayResult;
-          
-          // Set song of the day on success and song of the day existing
-          if (songOfTheDayResponseCode === 200 && songOfTheDayResponse.song_of_the_day) {
-            setSongOfTheDay(songOfTheDayResponse.song_of_the_day);
-            console.log("Successfully fetched Song-of-the-Day from backend.");
-          } else {
-            console.log("No song of the day available or error occurred.");
-            setSongOfTheDay(null);
-          }
-        } catch (err) {
-          console.error("Failed to fetch song of the day:", err);
-          setSongOfTheDay(null);
-        } finally {
-          // Mark SOTD as loaded regardless of success/failure
-          setSotdLoaded(true);
-        }
+        // Scores are stored as fractions; show them as percentages
+        setDiversityScore(
+          dashboard.diversity_score != null ? (dashboard.diversity_score * 100).toFixed(2) : null,
+        );
+        setTasteScore(
+          dashboard.taste_score != null ? (dashboard.taste_score * 100).toFixed(2) : null,
+        );
+
+        // Song of the day (null when there is none yet)
+        setSongOfTheDay(dashboard.song_of_the_day ?? null);
+        setSotdLoaded(true);
       } catch (error) {
         console.error("Error loading dashboard data:", error);
         window.location.href = "http://127.0.0.1:3000/login";
@@ -807,7 +540,7 @@ function Dashboard() {
               currentTracks.length > 0 ? (
               <div className="tracks-list">
                 {currentTracks.map((track) => (
-                  <div key={track.id} className="track-card">
+                  <div key={playKey(track)} className="track-card">
                     {track.album_image && (
                       <img
                         src={track.album_image}
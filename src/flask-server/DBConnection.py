@@ -12,40 +12,69 @@
 # Import needed libraries
 import atexit
 import os
-from flask import Flask, redirect, request, jsonify, session
 import json
 from dotenv import dotenv_values
-import requests
 import signal
 import subprocess
 import time
 from contextlib import closing
 import os
-from icecream import ic
-from server_utils import clean_db_listening_history, normalize_spotify_date
+from server_utils import build_history_rows, clean_db_listening_history
 import signal
 import socket
 import subprocess
 import sys
+import threading
+from datetime import date, datetime
 
 import psycopg2
 from psycopg2 import Error, sql
-from psycopg2.extras import execute_values
+from psycopg2.extras import Json, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
 from mb_api import mb_lookup_by_name, mb_lookup_by_spotify_id, mb_get_genres
+from helpers.identity_cache import IdentityCache
+from helpers.ttl_cache import TTLCache
+from helpers.slow_query_log import SlowQueryLog
+from app_logging import get_logger
+from metrics import current_endpoint, fingerprint_sql, record_db_query, sql_text, timed_request
+
+log = get_logger("db")
 
 
 def exit_handler():
     subprocess.call("killall cloudflared")
 
 
+# Advisory lock key that serializes song of the day rollovers across every server process
+SONG_OF_THE_DAY_LOCK_ID = 5810001
+
+# Advisory lock key that lets one server process at a time roll up and pre-create listening_history partitions
+LISTENING_HISTORY_MAINTENANCE_LOCK_ID = 5810002
+
+# Randomly pick one candidate that has never been the song of the day (anti-join against previous picks)
+PICK_SONG_OF_THE_DAY_CANDIDATE_CMD = """
+    SELECT c.track_id, c.track_name, c.song_img_url, c.album_name, c.artist_names, c.artist_ids
+    FROM song_of_the_day_candidates c
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM song_of_the_day sotd
+        WHERE sotd.track_id = c.track_id
+    )
+    ORDER BY random()
+    LIMIT 1;
+"""
+
+
 class DBConnection:
     def __init__(self):
 
-        # Read secure config keys / values from a .env file that is not included with git
-        config = dotenv_values(".env")
+        # Read secure config keys / values from a .env file that is not included with git.
+        # Environment variables take precedence over .env (same as load_dotenv in server.py).
+        config = {**dotenv_values(".env"), **os.environ}
         self.connected = False
-        self.SERVICE_TOKEN_ID = config["SERVICE_TOKEN_ID"]
-        self.SERVICE_TOKEN_SECRET = config["SERVICE_TOKEN_SECRET"]
+        self.SERVICE_TOKEN_ID = config.get("SERVICE_TOKEN_ID")
+        self.SERVICE_TOKEN_SECRET = config.get("SERVICE_TOKEN_SECRET")
         self.DB_PASSWORD = config["DB_PASSWORD"]
         self.DB_USER = config["DB_USER"]
 
@@ -53,7 +82,18 @@ class DBConnection:
         self.HOSTNAME = "581db.d3llie.tech"
         self.LOCAL_HOST = "127.0.0.1"
         self.LOCAL_PORT = 54321
-        self.DB_NAME = "spotifydb"
+        self.DB_NAME = config.get("DB_NAME") or "spotifydb"
+
+        # DB_HOST connects straight to a Postgres server (local development, benchmarks)
+        # instead of tunnelling to the hosted database through cloudflared
+        self.DIRECT_HOST = config.get("DB_HOST")
+        if self.DIRECT_HOST:
+            self.LOCAL_HOST = self.DIRECT_HOST
+            self.LOCAL_PORT = int(config.get("DB_PORT") or 5432)
+        self.proc = None
+
+        # Spotify Web API base URL (overridable so benchmarks can point at a stand-in server)
+        self.SPOTIFY_API_BASE_URL = config.get("SPOTIFY_API_BASE_URL") or "https://api.spotify.com/v1"
 
         # List of updates currently being made to user histories
         # Should be a list of spotify_ids
@@ -62,6 +102,41 @@ class DBConnection:
         # Set a timeout value for external connections
         self.STARTUP_TIMEOUT = 20
 
+        # Maximum number of pooled connections; callers wait for a free one beyond that
+        self.DB_POOL_SIZE = int(config.get("DB_POOL_SIZE") or 8)
+        self.pool_slots = threading.BoundedSemaphore(self.DB_POOL_SIZE)
+
+        # Months of raw listening history to keep before rolling it up into daily aggregates
+        self.LISTENING_HISTORY_RETENTION_MONTHS = int(config.get("LISTENING_HISTORY_RETENTION_MONTHS") or 12)
+
+        # Monthly listening_history partitions we already know exist, as (year, month) tuples
+        self.listening_history_partitions = set()
+
+        # Song of the day candidate pool (materialized view) refresh bookkeeping.
+        # New listening history marks the pool stale; it is refreshed at most once per interval.
+        self.SONG_CANDIDATES_REFRESH_SECONDS = int(config.get("SONG_CANDIDATES_REFRESH_SECONDS") or 3600)
+        self.song_candidates_stale = False
+        self.song_candidates_refreshed_at = 0.0
+
+        # Developer baseline (average developer diversity score) used by taste scoring.
+        # Cached per set of developer IDs; dropped when a developer's diversity score changes.
+        self.DEVELOPER_BASELINE_TTL_SECONDS = int(config.get("DEVELOPER_BASELINE_TTL_SECONDS") or 600)
+        self.developer_baseline_cache = TTLCache(ttl=self.DEVELOPER_BASELINE_TTL_SECONDS, maxsize=16)
+        self.developer_baseline_ids = set()
+
+        # spotify_id <-> user_id, filled by add_user and by lookups; a user's pair never changes
+        self.identities = IdentityCache(int(config.get("IDENTITY_CACHE_SIZE") or 10000))
+
+        # Slow query log: statements over SLOW_QUERY_MS (0 = off) are grouped by fingerprint into
+        # SLOW_QUERY_REPORT with redacted parameters; slow reads get a sampled EXPLAIN ANALYZE plan
+        self.SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(config.get("SLOW_QUERY_EXPLAIN_TIMEOUT_MS") or 10000)
+        self.slow_query_log = SlowQueryLog(
+            threshold_ms=float(config.get("SLOW_QUERY_MS") or 250),
+            report_path=config.get("SLOW_QUERY_REPORT") or "slow_queries.json",
+            explain_interval=int(config.get("SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS") or 600),
+        )
+        self.explain_slots = threading.BoundedSemaphore(1)
+
         # The command that will be used to connect to the database through the cloudflare tunnel
         self.cloudflared_cmd = [
             "cloudflared", "access", "tcp",
@@ -71,39 +146,41 @@ class DBConnection:
             "--service-token-secret", self.SERVICE_TOKEN_SECRET,
         ]
 
-        # Output status information
-        print(f"Starting Cloudflare proxy on {self.LOCAL_HOST}:{self.LOCAL_PORT} → {self.HOSTNAME} ...")
+        if not self.DIRECT_HOST:
+            # Output status information
+            log.info("Starting Cloudflare proxy on %s:%s -> %s", self.LOCAL_HOST, self.LOCAL_PORT, self.HOSTNAME)
 
-        # Make the actual subprocess to handle our connection
-        self.proc = subprocess.Popen(
-            self.cloudflared_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        # Wait briefly for the tunnel to come up
-        time.sleep(0.5)
+            # Make the actual subprocess to handle our connection
+            self.proc = subprocess.Popen(
+                self.cloudflared_cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            # Wait briefly for the tunnel to come up
+            time.sleep(0.5)
 
-        if self.proc.poll() is not None:
-            stderr = self.proc.stderr.read()
-            raise RuntimeError(f"cloudflared exited early:\n{stderr}")
+            if self.proc.poll() is not None:
+                stderr = self.proc.stderr.read()
+                raise RuntimeError(f"cloudflared exited early:\n{stderr}")
 
         # The main connection initialization block
         try:
 
-            # Establish a connection to the PostgreSQL database
-            self.conn = psycopg2.connect(
+            # Establish a pool of connections to the PostgreSQL database so that
+            # multi-statement transactions never interleave with other threads' queries
+            self.pool = ThreadedConnectionPool(
+                1, self.DB_POOL_SIZE,
                 host=self.LOCAL_HOST, port=self.LOCAL_PORT,
                 user=self.DB_USER, password=self.DB_PASSWORD, dbname=self.DB_NAME,
                 connect_timeout=10,
             )
             self.connected = True
-            print(f"Established connection! {self.conn}")
+            log.info("Established connection pool", extra={"pool_size": self.DB_POOL_SIZE})
         except Exception as e:
             self.connected = False
-            print(
-                f"Failed to establish SQL connection!\nFailed with exception: {e}")
-            if self.proc.poll() is None:
+            log.error("Failed to establish SQL connection: %s", e)
+            if self.proc is not None and self.proc.poll() is None:
                 self.proc.send_signal(signal.SIGINT)  # Tell it to close
                 try:
                     # Give it the chance to exit gracefully
@@ -111,72 +188,190 @@ class DBConnection:
                 except subprocess.TimeoutExpired:
                     self.proc.kill()  # Kill it if it takes too long
 
+        # Make sure listening history is partitioned (old months are rolled up by maintain_listening_history)
+        if self.connected:
+            try:
+                self.create_listening_history_tables()
+                self.create_user_sync_state_table()
+            except Exception:
+                log.exception("Error preparing listening_history partitions")
+            try:
+                self.create_user_metrics_columns()
+                self.create_user_similarity_table()
+            except Exception:
+                log.exception("Error preparing user_metrics columns")
+            try:
+                self.create_song_of_the_day_table()
+                self.create_song_candidates_view()
+            except Exception:
+                log.exception("Error preparing song of the day candidates")
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool, waiting if all of them are in use."""
+        self.pool_slots.acquire()
+        conn = None
+        try:
+            conn = self.pool.getconn()
+            yield conn
+        finally:
+            if conn is not None:
+                self.pool.putconn(conn, close=bool(conn.closed))
+            self.pool_slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """Yield a cursor whose statements all run in one transaction (rolled back on error)."""
+        with self.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    yield cur
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
     def execute_vals(self, cmd, rows, fetch=False):
         """Executes a batch SQL command using execute_values for efficiency."""
-        try:
-            with self.conn.cursor() as cur:
-                execute_values(cur, cmd, rows)
-                result = []
-                if fetch:
-                    try:
-                        result = cur.fetchall()
-                    except psycopg2.ProgrammingError:
-                        pass
-                self.conn.commit()
-                # print(f"successfully executed command:\n\t{command}\nWith result:\n\t{result}")
-                return result
-        except psycopg2.ProgrammingError as e:
-            self.conn.commit()
-            # print(f"Failed to execute command:\n\t{command}\nWith error:\n\t{e}")
-            raise e
+        with self.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    fingerprint, query = fingerprint_sql(sql_text(cmd, conn))
+                    start = time.perf_counter()
+                    execute_values(cur, cmd, rows)
+                    result = []
+                    if fetch:
+                        try:
+                            result = cur.fetchall()
+                        except psycopg2.ProgrammingError:
+                            pass
+                    executed = time.perf_counter()
+                    conn.commit()
+                    record_db_query(fingerprint, executed - start, time.perf_counter() - executed,
+                                    len(result) if fetch else max(cur.rowcount, 0))
+                    if self.slow_query_log.is_slow(executed - start):
+                        self.log_slow_query(cmd, rows, fingerprint, query, executed - start,
+                                            sys._getframe(1).f_code.co_name)
+                    # print(f"successfully executed command:\n\t{command}\nWith result:\n\t{result}")
+                    return result
+            except psycopg2.ProgrammingError as e:
+                conn.commit()
+                # print(f"Failed to execute command:\n\t{command}\nWith error:\n\t{e}")
+                raise e
+            except Exception:
+                # Never hand an aborted transaction back to the pool
+                conn.rollback()
+                raise
 
     def execute_cmd(self, command, params, fetch=False):
         """Execute an arbitrary SQL command with parameters."""
         # function that executes an arbitrary SQL command
         # fetch flag - if false, we do not expect any results to be returned by SQL - used insert, update, or delete
+        with self.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    fingerprint, query = fingerprint_sql(sql_text(command, conn))
+                    start = time.perf_counter()
+                    cur.execute(command, params)
+                    result = []
+                    if fetch == True:
+                        try:
+                            result = cur.fetchall()
+                        except psycopg2.ProgrammingError:
+                            pass
+                    executed = time.perf_counter()
+                    conn.commit()
+                    record_db_query(fingerprint, executed - start, time.perf_counter() - executed,
+                                    len(result) if fetch else max(cur.rowcount, 0))
+                    if self.slow_query_log.is_slow(executed - start):
+                        self.log_slow_query(command, params, fingerprint, query, executed - start,
+                                            sys._getframe(1).f_code.co_name)
+                    # print(f"successfully executed command:\n\t{command}\nWith result:\n\t{result}")
+                    return result
+            except psycopg2.ProgrammingError as e:
+                conn.commit()
+                # print(f"Failed to execute command:\n\t{command}\nWith error:\n\t{e}")
+                raise e
+            except Exception:
+                # Never hand an aborted transaction back to the pool
+                conn.rollback()
+                raise
+
+    def log_slow_query(self, command, params, fingerprint, query, seconds, caller):
+        """Add a slow statement to the slow query log and, when due, sample its plan in the background"""
+        if self.slow_query_log.record(fingerprint, query, seconds, params, caller, current_endpoint()):
+            if self.explain_slots.acquire(blocking=False):
+                threading.Thread(target=self.capture_query_plan, args=(command, params, fingerprint),
+                                 daemon=True).start()
+
+    def capture_query_plan(self, command, params, fingerprint):
+        """Run EXPLAIN (ANALYZE, BUFFERS) on a read-only statement and roll it back"""
         try:
-            with self.conn.cursor() as cur:
-                cur.execute(command, params)
-                result = []
-                if fetch == True:
-                    try:
-                        result = cur.fetchall()
-                    except psycopg2.ProgrammingError:
-                        pass
-                self.conn.commit()
-                # print(f"successfully executed command:\n\t{command}\nWith result:\n\t{result}")
-                return result
-        except psycopg2.ProgrammingError as e:
-            self.conn.commit()
-            # print(f"Failed to execute command:\n\t{command}\nWith error:\n\t{e}")
-            raise e
+            explain = sql.SQL("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ")
+            command = explain + (sql.SQL(command) if isinstance(command, str) else command)
+            with self.connection() as conn:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("SET LOCAL statement_timeout = %s", (self.SLOW_QUERY_EXPLAIN_TIMEOUT_MS,))
+                        cur.execute(command, params)
+                        plan = cur.fetchone()[0]
+                finally:
+                    # EXPLAIN ANALYZE really runs the statement; never keep anything it did
+                    conn.rollback()
+            self.slow_query_log.add_plan(fingerprint, plan)
+        except Exception as e:
+            log.warning("Could not capture plan for slow query %s: %s", fingerprint, e)
+        finally:
+            self.explain_slots.release()
 
     def add_user(self, user_info_json: str, access_token: str, refresh_token: str):
-        """Add a new user to the database"""
+        """
+        Add a new user to the database, or update their profile and tokens if any of them changed
+        (an unchanged row is not rewritten). Returns the user's user_id either way.
+        """
 
         # based on endpoint: https://developer.spotify.com/documentation/web-api/reference/get-current-users-profile
-        print("running add user")
+        log.debug("Adding user")
         user_info = json.loads(user_info_json)
         spotify_id = user_info['id']
         user_name = user_info['display_name']
         diversity_score = 0.0
         try:
             profile_image_url = user_info['images'][0]['url']
-        except Error as _:
-            print("user does not have profilepicture, defaulting")
+        except (KeyError, IndexError, TypeError) as _:
+            log.debug("User has no profile picture, using the default")
             profile_image_url = "https://external-content.duckduckgo.com/iu/?u=https%3A%2F%2Fi.pinimg.com%2F736x%2Ff6%2Fbc%2F9a%2Ff6bc9a75409c4db0acf3683bab1fab9c.jpg&f=1&nofb=1&ipt=c48e5082d31a5e88acc29db27870ce17134db62d49a799dd7a7d41fd938c0a98"
+        # The conditional DO UPDATE returns nothing for an unchanged row, so fall back to reading its
+        # user_id (the SELECT sees the row as it was before this statement, which is all we need)
         cmd = """
-            INSERT INTO users (spotify_id, user_name, access_token, refresh_token, profile_image_url, diversity_score)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (spotify_id)
-            DO UPDATE SET
-                access_token = EXCLUDED.access_token,
-                refresh_token = EXCLUDED.refresh_token;
+            WITH upserted AS (
+                INSERT INTO users (spotify_id, user_name, access_token, refresh_token, profile_image_url, diversity_score)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (spotify_id)
+                DO UPDATE SET
+                    user_name = EXCLUDED.user_name,
+                    access_token = EXCLUDED.access_token,
+                    refresh_token = EXCLUDED.refresh_token,
+                    profile_image_url = EXCLUDED.profile_image_url
+                WHERE (users.user_name, users.access_token, users.refresh_token, users.profile_image_url)
+                    IS DISTINCT FROM
+                    (EXCLUDED.user_name, EXCLUDED.access_token, EXCLUDED.refresh_token, EXCLUDED.profile_image_url)
+                RETURNING user_id
+            )
+            SELECT user_id FROM upserted
+            UNION ALL
+            SELECT user_id FROM users
+            WHERE spotify_id = %s AND NOT EXISTS (SELECT 1 FROM upserted);
             """
         params = (spotify_id, user_name, access_token,
-                  refresh_token, profile_image_url, diversity_score)
+                  refresh_token, profile_image_url, diversity_score, spotify_id)
 
-        self.execute_cmd(cmd, params, fetch=False)
+        rows = self.execute_cmd(cmd, params, fetch=True)
+        if not rows:
+            # A concurrent first login inserted the same row after our snapshot; read it back
+            return self.get_user_id_by_spotify_id(spotify_id)
+        self.identities.remember(spotify_id, rows[0][0])
+        return rows[0][0]
 
     def get_user_profile(self, user_id):
         """Return username and profile image for the user with parameter user_id"""
@@ -227,14 +422,25 @@ class DBConnection:
     def get_user_genres(self, spotify_id):
         """Return genres for the user with parameter spotify_id"""
 
+        # Each track the user has played counts once, as it did before partitioning. Plays older
+        # than the retention window only survive as daily aggregates; UNION dedups across both.
+        # The played_at bound lets the planner skip partitions that have been rolled up.
         cmd = """
             SELECT a.genres
-            FROM listening_history lh
+            FROM (
+                SELECT track_id
+                FROM listening_history
+                WHERE spotify_id = %s
+                AND played_at >= %s
+                UNION
+                SELECT track_id
+                FROM listening_history_daily
+                WHERE spotify_id = %s
+            ) lh
             JOIN tracks t ON lh.track_id = t.spotify_track_id
             JOIN artists a ON t.spotify_artist_id = a.spotify_artist_id
-            WHERE lh.spotify_id = %s
         """
-        params = (spotify_id,)
+        params = (spotify_id, self.listening_history_cutoff(), spotify_id)
         return self.execute_cmd(cmd, params, fetch=True)
     
     def get_many_user_profiles(self, limit=25):
@@ -253,8 +459,17 @@ class DBConnection:
         params = [limit]
         return self.execute_cmd(cmd, params, fetch=True)
     
-    def update_user_diversity_score(self, user_id, spotify_id, div_score):
-        """Update diversity score for the user with parameter user_id"""
+    def create_user_metrics_columns(self):
+        """Add the columns newer scoring code needs to user_metrics if they don't exist yet"""
+
+        # Per-bucket genre counts (ROOTS order) behind the diversity score, used for taste scoring
+        self.execute_cmd(
+            "ALTER TABLE user_metrics ADD COLUMN IF NOT EXISTS genre_counts DOUBLE PRECISION[];",
+            (),
+        )
+
+    def update_user_diversity_score(self, user_id, spotify_id, div_score, genre_counts=None):
+        """Update diversity score (and optionally the genre counts behind it) for the user with parameter user_id"""
         # Check if user has entries in the metrics table (this is necessary since add_user does not
         # initialize these records by default)
         check_cmd = """SELECT 1 
@@ -276,26 +491,31 @@ class DBConnection:
         if len(list(check_result)) <= 0:
             # We need to insert a new record. We'll initialize the taste score to zero.
             # We don't need to worry about updating last_updated because it is automatically set to now by default
-            cmd = """INSERT INTO user_metrics (user_id, spotify_id, diversity_score, taste_score)
-                     VALUES (%s, %s, %s, %s);
+            cmd = """INSERT INTO user_metrics (user_id, spotify_id, diversity_score, taste_score, genre_counts)
+                     VALUES (%s, %s, %s, %s, %s);
                   """
             # Setup our parameters (remember: defaulting taste score to zero for now since we're inserting a new record)
-            params = [user_id, spotify_id, div_score, 0]
+            params = [user_id, spotify_id, div_score, 0, genre_counts]
         else:
-            # We can just update an old record
+            # We can just update an old record (keeping stored genre counts if none were given)
             cmd = """UPDATE user_metrics
-                     SET diversity_score = %s, last_updated = DEFAULT
+                     SET diversity_score = %s, genre_counts = COALESCE(%s, genre_counts), last_updated = DEFAULT
                      WHERE spotify_id = %s
                      AND user_id = %s;"""
             # Set the params. Note the different order than previously
-            params = [div_score, spotify_id, user_id]
+            params = [div_score, genre_counts, spotify_id, user_id]
 
         # Raise an error if we haven't set the command or parameters correctly
         if len(cmd) <= 0 or len(params) <= 0:
             # This should be impossible to hit but is left for redundancy
             raise ValueError("Cannot run an empty command or run a command with no parameters.")
 
-        return self.execute_cmd(cmd, params)
+        result = self.execute_cmd(cmd, params)
+
+        # A developer's score changed -> the cached taste score baseline is out of date
+        if spotify_id in self.developer_baseline_ids:
+            self.developer_baseline_cache.clear()
+        return result
 
     def update_user_taste_score(self, user_id, spotify_id, taste_score):
         """Update taste score for the user with parameter user_id"""
@@ -358,7 +578,7 @@ class DBConnection:
     def get_user_info_by_id(self, user_id: int):
         """Returns user info for the user with the given user_id"""
 
-        print("getting user info by id:", user_id)
+        log.debug("Getting user info", extra={"user_id": user_id})
         query = """
             SELECT user_id, spotify_id, user_name, profile_image_url,
                 access_token, refresh_token, diversity_score
@@ -376,19 +596,22 @@ class DBConnection:
     def get_spotify_id_by_user_id(self, user_id):
         """Returns spotify_id for the user with parameter user_id"""
 
+        spotify_id = self.identities.spotify_id(user_id)
+        if spotify_id is not None:
+            return spotify_id
+
         cmd = "SELECT spotify_id FROM users WHERE user_id = %s;"
         params = [user_id]
-        user_id = self.execute_cmd(cmd, params, fetch=True)
-        if user_id == []:
+        spotify_id = self.execute_cmd(cmd, params, fetch=True)
+        if spotify_id == []:
             raise Error("User is not present in database")
-        else:
-            return user_id
+        self.identities.remember(spotify_id[0][0], user_id)
+        return spotify_id[0][0]
 
     def get_listening_history_by_user_id(self, user_id: int):
         """Returns the entire listening history of the user with parameter user_id"""
 
         spotify_id = self.get_spotify_id_by_user_id(user_id)
-        spotify_id = spotify_id[0][0]
 
         # Same listening history command as non-user_id path
         get_listening_history = """
@@ -408,6 +631,7 @@ class DBConnection:
             JOIN artists a
                 ON at.artist_id = a.spotify_artist_id
             WHERE lh.spotify_id = %s
+            AND lh.played_at >= %s
             GROUP BY
                 lh.played_at,
                 lh.context,
@@ -416,19 +640,23 @@ class DBConnection:
                 t.song_img_url
             ORDER BY lh.played_at DESC;
         """
-        params = [spotify_id]
+        params = [spotify_id, self.listening_history_cutoff()]
         return clean_db_listening_history(self.execute_cmd(get_listening_history, params, fetch=True))
 
     def get_user_id_by_spotify_id(self, spotify_id):
         """Returns user_id for the user with parameter spotify_id"""
 
+        user_id = self.identities.user_id(spotify_id)
+        if user_id is not None:
+            return user_id
+
         cmd = "SELECT user_id FROM users WHERE spotify_id = %s;"
         params = [spotify_id]
         user_id = self.execute_cmd(cmd, params, fetch=True)
         if user_id == []:
             raise Error("User is not present in database")
-        else:
-            return user_id[0][0]
+        self.identities.remember(spotify_id, user_id[0][0])
+        return user_id[0][0]
         
     def get_diversity_score_by_spotify_id(self, spotify_id):
         """Returns diversity_score for the user with parameter spotify_id"""
@@ -441,20 +669,333 @@ class DBConnection:
         else:
             return diversity_score[0][0]
         
+    def get_diversity_scores_by_spotify_ids(self, spotify_ids):
+        """Returns {spotify_id: diversity_score} for every listed user that has a score, in one query"""
+
+        cmd = """SELECT spotify_id, diversity_score
+                 FROM user_metrics
+                 WHERE spotify_id = ANY(%s)
+                 AND diversity_score IS NOT NULL;"""
+        params = [list(spotify_ids)]
+        return {spotify_id: score for (spotify_id, score) in self.execute_cmd(cmd, params, fetch=True)}
+
+    def get_developer_baseline(self, developer_ids):
+        """
+        Returns the developers' average diversity score on a 0-100 scale, or None if none of
+        them have a score yet. Cached until the TTL expires or a developer's score changes.
+        """
+        key = tuple(sorted(developer_ids))
+        baseline = self.developer_baseline_cache.get(key)
+        if baseline is not None:
+            return baseline
+
+        # Remember who counts as a developer so their score updates invalidate the cache
+        self.developer_baseline_ids.update(key)
+
+        scores = self.get_diversity_scores_by_spotify_ids(key)
+        if len(scores) == 0:
+            return None
+
+        # Normalize from 0-1 to 0-100 and average
+        baseline = sum(score * 100 for score in scores.values()) / len(scores)
+        self.developer_baseline_cache.set(key, baseline)
+        return baseline
+
+    def get_genre_counts_by_spotify_id(self, spotify_id):
+        """Returns the stored per-bucket genre counts for the user with parameter spotify_id, or None"""
+
+        cmd = "SELECT genre_counts FROM user_metrics WHERE spotify_id = %s;"
+        result = self.execute_cmd(cmd, [spotify_id], fetch=True)
+        if result == [] or result[0][0] is None:
+            return None
+        return result[0][0]
+
+    def get_developer_genre_counts(self, developer_ids):
+        """
+        Returns the developers' per-bucket genre counts as a tuple of tuples (one per developer
+        that has them). Cached and invalidated alongside the developer baseline.
+        """
+        key = ("genre_counts",) + tuple(sorted(developer_ids))
+        cohort = self.developer_baseline_cache.get(key)
+        if cohort is not None:
+            return cohort
+
+        # Remember who counts as a developer so their score updates invalidate the cache
+        self.developer_baseline_ids.update(key[1:])
+
+        cmd = """SELECT genre_counts
+                 FROM user_metrics
+                 WHERE spotify_id = ANY(%s)
+                 AND genre_counts IS NOT NULL
+                 ORDER BY spotify_id;"""
+        rows = self.execute_cmd(cmd, [list(key[1:])], fetch=True)
+        cohort = tuple(tuple(counts) for (counts,) in rows)
+        self.developer_baseline_cache.set(key, cohort)
+        return cohort
+
+    def get_all_genre_counts(self):
+        """Returns (user_id, spotify_id, genre_counts) for every user with stored genre counts"""
+
+        cmd = """SELECT user_id, spotify_id, genre_counts
+                 FROM user_metrics
+                 WHERE genre_counts IS NOT NULL;"""
+        return self.execute_cmd(cmd, (), fetch=True)
+
+    def update_taste_scores(self, rows):
+        """Batch update taste scores from (user_id, taste_score) rows, taste scores on a 0-100 scale"""
+
+        cmd = """
+            UPDATE user_metrics
+            SET taste_score = data.taste_score, last_updated = DEFAULT
+            FROM (VALUES %s) AS data(user_id, taste_score)
+            WHERE user_metrics.user_id = data.user_id;
+        """
+        # Taste score must be between 0 and 1 for the database
+        rows = [(user_id, round(taste_score / 100, 4)) for (user_id, taste_score) in rows]
+        self.execute_vals(cmd, rows)
+
+    def create_user_similarity_table(self):
+        """Create the user_similarity table (each user's top-K most similar listeners) if it doesn't exist"""
+
+        cmd = """
+            CREATE TABLE IF NOT EXISTS user_similarity (
+                user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+                rank SMALLINT NOT NULL,
+                neighbor_user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+                similarity REAL NOT NULL,
+                PRIMARY KEY (user_id, rank)
+            );
+        """
+        self.execute_cmd(cmd, (), fetch=False)
+
+        # Lets an incremental update find every list a changed user appears in
+        self.execute_cmd(
+            """CREATE INDEX IF NOT EXISTS user_similarity_neighbor_user_id_idx
+               ON user_similarity (neighbor_user_id);""",
+            (),
+            fetch=False,
+        )
+
+    def replace_user_similarity(self, rows):
+        """Replace the whole user_similarity table with (user_id, neighbor_user_id, similarity, rank) rows"""
+
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM user_similarity;")
+            if rows:
+                execute_values(
+                    cur,
+                    "INSERT INTO user_similarity (user_id, neighbor_user_id, similarity, rank) VALUES %s;",
+                    rows,
+                )
+
+    def replace_user_neighbors(self, user_ids, rows):
+        """Replace the given users' neighbours with (user_id, neighbor_user_id, similarity, rank) rows"""
+
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM user_similarity WHERE user_id = ANY(%s);", (list(user_ids),))
+            if rows:
+                execute_values(
+                    cur,
+                    "INSERT INTO user_similarity (user_id, neighbor_user_id, similarity, rank) VALUES %s;",
+                    rows,
+                )
+
+    def get_users_listing_neighbor(self, neighbor_user_id):
+        """Return the user_ids whose stored neighbours include neighbor_user_id"""
+
+        cmd = "SELECT user_id FROM user_similarity WHERE neighbor_user_id = %s;"
+        return [user_id for (user_id,) in self.execute_cmd(cmd, (neighbor_user_id,), fetch=True)]
+
+    def get_similarity_floors(self, k):
+        """
+        Return (user_id, floor) for every user with stored neighbours, where floor is the similarity
+        a new neighbour has to beat: the k-th best when the user has k neighbours, otherwise 0
+        """
+        cmd = """SELECT user_id, CASE WHEN COUNT(*) >= %s THEN MIN(similarity) ELSE 0 END
+                 FROM user_similarity
+                 GROUP BY user_id;"""
+        return self.execute_cmd(cmd, (k,), fetch=True)
+
+    def get_similar_users(self, user_id, limit=10):
+        """Return (user_id, spotify_id, user_name, profile_image_url, similarity) for the user's most similar listeners"""
+
+        cmd = """SELECT u.user_id, u.spotify_id, u.user_name, u.profile_image_url, us.similarity
+                 FROM user_similarity us
+                 JOIN users u ON us.neighbor_user_id = u.user_id
+                 WHERE us.user_id = %s
+                 ORDER BY us.rank
+                 LIMIT %s;"""
+        params = (user_id, limit)
+        return self.execute_cmd(cmd, params, fetch=True)
+
     def is_user_history_updating(self, spotify_id):
         """Returns True if the user's history is currently being updated, False otherwise"""
         return spotify_id in self.history_update_list
 
-    def update_user_history(self, spotify_id, spotify_json: str, access_token: str):
-        """Update the user's listening history in the database"""
+    def create_user_sync_state_table(self):
+        """Create the user_sync_state table (newest play ingested per user) if it doesn't exist"""
+
+        cmd = """
+            CREATE TABLE IF NOT EXISTS user_sync_state (
+                spotify_id TEXT PRIMARY KEY
+                    REFERENCES users(spotify_id) ON UPDATE CASCADE ON DELETE CASCADE,
+                last_played_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                synced_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+            );
+        """
+        self.execute_cmd(cmd, (), fetch=False)
+
+        # Background poller schedule. A user can be scheduled before their first play is stored,
+        # so last_played_at may be NULL.
+        self.execute_cmd("ALTER TABLE user_sync_state ALTER COLUMN last_played_at DROP NOT NULL;", ())
+        self.execute_cmd(
+            """ALTER TABLE user_sync_state
+               ADD COLUMN IF NOT EXISTS next_poll_at TIMESTAMP WITH TIME ZONE,
+               ADD COLUMN IF NOT EXISTS poll_interval_seconds INTEGER;""",
+            (),
+        )
+
+    def get_sync_cursor(self, spotify_id):
+        """
+        Return the recently-played `after` cursor for the user (Unix milliseconds of the newest
+        play already ingested), or None if their history has never been synced
+        """
+        cmd = """SELECT (EXTRACT(EPOCH FROM last_played_at) * 1000)::BIGINT
+                 FROM user_sync_state
+                 WHERE spotify_id = %s;"""
+        result = self.execute_cmd(cmd, (spotify_id,), fetch=True)
+        return result[0][0] if result else None
+
+    def update_sync_cursor(self, spotify_id, last_played_at):
+        """Move the user's sync cursor forward to last_played_at (never backwards)"""
+        cmd = """INSERT INTO user_sync_state (spotify_id, last_played_at)
+                 VALUES (%s, %s)
+                 ON CONFLICT (spotify_id) DO UPDATE
+                 SET last_played_at = GREATEST(user_sync_state.last_played_at, EXCLUDED.last_played_at),
+                     synced_at = now();"""
+        self.execute_cmd(cmd, (spotify_id, last_played_at))
+
+    def claim_due_poll_users(self, shard=0, shards=1, limit=100, lease_seconds=900):
+        """
+        Claim up to limit users with a stored refresh token whose next background sync is due, most
+        overdue first, and return (spotify_id, refresh_token, poll_interval_seconds, lag_seconds) for them.
+        Claiming pushes next_poll_at lease_seconds ahead in the same statement (rows another process is
+        claiming are skipped), so each due user goes to exactly one poller; schedule_next_poll replaces
+        the lease after the sync, and a poller that dies only delays its users by the lease.
+        Only users in this shard (a stable hash of spotify_id modulo shards) are claimed.
+        Users that have never been polled are due immediately (interval None, lag 0).
+        """
+        with self.transaction() as cur:
+            # Give users who have never been polled a row to claim
+            cur.execute(
+                """INSERT INTO user_sync_state (spotify_id)
+                   SELECT u.spotify_id
+                   FROM users u
+                   WHERE u.refresh_token IS NOT NULL
+                     AND NOT EXISTS (SELECT 1 FROM user_sync_state s WHERE s.spotify_id = u.spotify_id)
+                     AND mod(hashtext(u.spotify_id)::BIGINT + 2147483648, %s) = %s
+                   ON CONFLICT (spotify_id) DO NOTHING;""",
+                (shards, shard),
+            )
+            cur.execute(
+                """UPDATE user_sync_state s
+                   SET next_poll_at = now() + make_interval(secs => %s)
+                   FROM (
+                       SELECT due.spotify_id, due.next_poll_at AS due_at
+                       FROM user_sync_state due
+                       WHERE (due.next_poll_at IS NULL OR due.next_poll_at <= now())
+                         AND mod(hashtext(due.spotify_id)::BIGINT + 2147483648, %s) = %s
+                         AND EXISTS (SELECT 1 FROM users u
+                                     WHERE u.spotify_id = due.spotify_id AND u.refresh_token IS NOT NULL)
+                       ORDER BY due.next_poll_at NULLS FIRST
+                       LIMIT %s
+                       FOR UPDATE SKIP LOCKED
+                   ) claimed, users u
+                   WHERE s.spotify_id = claimed.spotify_id
+                     AND u.spotify_id = claimed.spotify_id
+                   RETURNING s.spotify_id, u.refresh_token, s.poll_interval_seconds,
+                             COALESCE(EXTRACT(EPOCH FROM now() - claimed.due_at), 0)::DOUBLE PRECISION;""",
+                (lease_seconds, shards, shard, limit),
+            )
+            return cur.fetchall()
+
+    def release_poll_claims(self, spotify_ids):
+        """Make claimed users due again right away (claims the poller couldn't queue)"""
+        cmd = """UPDATE user_sync_state
+                 SET next_poll_at = now()
+                 WHERE spotify_id = ANY(%s);"""
+        self.execute_cmd(cmd, (list(spotify_ids),))
+
+    def try_hold_advisory_lock(self, key, subkey=0):
+        """
+        Try to take a session advisory lock on a dedicated connection (outside the pool, so holding
+        it doesn't cost a pooled connection). Returns the connection, which holds the lock until it
+        is closed, or None if another session already holds it.
+        """
+        conn = psycopg2.connect(
+            host=self.LOCAL_HOST, port=self.LOCAL_PORT,
+            user=self.DB_USER, password=self.DB_PASSWORD, dbname=self.DB_NAME,
+            connect_timeout=10,
+        )
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s, %s);", (key, subkey))
+                if cur.fetchone()[0]:
+                    return conn
+        except Exception:
+            conn.close()
+            raise
+        conn.close()
+        return None
+
+    def is_lock_connection_alive(self, conn):
+        """True if a connection from try_hold_advisory_lock (and so its lock) is still open"""
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            return True
+        except psycopg2.Error:
+            conn.close()
+            return False
+
+    def schedule_next_poll(self, spotify_id, interval_seconds):
+        """Schedule the user's next background sync interval_seconds from now"""
+        cmd = """INSERT INTO user_sync_state (spotify_id, next_poll_at, poll_interval_seconds)
+                 VALUES (%s, now() + make_interval(secs => %s), %s)
+                 ON CONFLICT (spotify_id) DO UPDATE
+                 SET next_poll_at = EXCLUDED.next_poll_at,
+                     poll_interval_seconds = EXCLUDED.poll_interval_seconds;"""
+        self.execute_cmd(cmd, (spotify_id, interval_seconds, round(interval_seconds)))
+
+    def get_refresh_token(self, spotify_id):
+        """Return the refresh token stored for the user by add_user, or None"""
+        cmd = "SELECT refresh_token FROM users WHERE spotify_id = %s;"
+        result = self.execute_cmd(cmd, (spotify_id,), fetch=True)
+        return result[0][0] if result else None
+
+    def update_user_tokens(self, spotify_id, access_token, refresh_token):
+        """Store a refreshed access token (and the refresh token, which Spotify may rotate)"""
+        cmd = """UPDATE users
+                 SET access_token = %s, refresh_token = %s
+                 WHERE spotify_id = %s;"""
+        self.execute_cmd(cmd, (access_token, refresh_token, spotify_id))
+
+    def update_user_history(self, spotify_id, listens, access_token: str, repair_genres=True):
+        """
+        Update the user's listening history in the database from parsed Listens (helpers/listening_records.py).
+        repair_genres=False skips the (slow) MusicBrainz repair of artists missing genres.
+        """
 
         # based on endpoint: https://developer.spotify.com/documentation/web-api/reference/get-recently-played
-        print("updating history for:", spotify_id)
+        # Nothing new since the last sync
+        if not listens:
+            return
+
+        log.info("Updating listening history", extra={"spotify_id": spotify_id, "listens": len(listens)})
         self.history_update_list.append(spotify_id)
-        artist_rows = []
-        tracks_rows = []
-        listening_history_rows = []
-        artists_tracks_rows = []
 
         artists_cmd = """
             INSERT INTO artists (spotify_artist_id, name)
@@ -478,8 +1019,7 @@ class DBConnection:
         listening_history_cmd = """
             INSERT INTO listening_history (spotify_id, track_id,  played_at, context)
             VALUES %s
-            ON CONFLICT (track_id) 
-            DO UPDATE SET played_at = EXCLUDED.played_at;
+            ON CONFLICT (spotify_id, track_id, played_at) DO NOTHING;
         """
 
         artists_tracks_cmd = """
@@ -487,57 +1027,12 @@ class DBConnection:
             VALUES %s ON CONFLICT (artist_id, track_id) DO NOTHING;
             """
 
-        spotify_data = json.loads(spotify_json)
-
-        for item in spotify_data["items"]:
-            track = item["track"]
-            track_id = track["id"]
-            played_at = item["played_at"]
-            album = track["album"]
-            artists = track["artists"]  # just the first artist for now
-
-            artist = track["artists"][0]
-            artist_id = artist["id"]
-
-            track_name = track["name"]
-            song_img_url = track["album"]["images"][0]["url"]
-            album_name = album["name"]
-            release_date_raw = album.get("release_date", None)
-            release_date = normalize_spotify_date(release_date_raw)
-
-            duration_ms = track.get("duration_ms", "NULL")
-
-            context = item["context"]["type"] if item.get("context") else None
+        artist_rows, tracks_rows, listening_history_rows, artists_tracks_rows = build_history_rows(
+            spotify_id, listens)
 
-            # Add variables for batch tracks update
-            artist_rows.append((artist_id,
-                                artist["name"]))
-
-            # Add variables for batch tracks update
-            tracks_rows.append((track_id, track_name, artist_id, duration_ms if duration_ms else "NULL", album_name, release_date if release_date else "NULL",
-                                song_img_url))
-
-            # Add variables for batch listening_history update
-            listening_history_rows.append(
-                (spotify_id, track_id,  played_at, context if context else "NULL"))
-
-            for artist in artists:
-                artist_id = artist["id"]
-                artists_tracks_rows.append((artist_id, track_id))
-                artist_rows.append((artist_id, artist["name"]))
-            
-
-        # Deduplicate rows by track_id — newest played_at wins
-        dedup = {}
-        for row in listening_history_rows:
-            spotify_id, track_id, played_at, context = row
-
-            # keep the row with the latest played_at
-            if track_id not in dedup or played_at > dedup[track_id][2]:
-                dedup[track_id] = row
-
-        # only unique rows go to Postgres
-        listening_history_rows = list(dedup.values())
+        # Every month we're about to write into needs its partition
+        self.ensure_listening_history_partitions(
+            [played_at for (_, _, played_at, _) in listening_history_rows])
 
         # Now fetch genres for all unique artists
         unique_artist_ids = {artist_id for (artist_id, _) in artist_rows}
@@ -547,11 +1042,11 @@ class DBConnection:
 
         for a_id in unique_artist_ids:
             # Define Spotify API URL with artist ID
-            url = f"https://api.spotify.com/v1/artists/{a_id}"
+            url = f"{self.SPOTIFY_API_BASE_URL}/artists/{a_id}"
 
             try:
                 # Try the Spotify API request
-                r = requests.get(url, headers=headers)
+                r = timed_request("spotify", "GET", url, headers=headers)
 
                 # If API working -> get the genre list
                 if r.status_code == 200:
@@ -576,7 +1071,7 @@ class DBConnection:
                             artist_genre_rows.append((a_id, ["NO_GENRE_DATA"]))
 
             except Exception as e:
-                print("Spotify error:", e)
+                log.warning("Spotify artist lookup failed: %s", e)
 
                 # Spotify failed → DO NOT call MusicBrainz here either.
                 # Just preserve whatever genre data already exists.
@@ -594,26 +1089,37 @@ class DBConnection:
 
             # Add variables for batch artists_tracks update
         # Insert any new artists, tracks, genre lists & listening history enteries
-        try: 
-            self.repair_missing_genres()
-        except Exception as e:
-            print("Error while repairing missing genres:", e)
+        if repair_genres:
+            try:
+                self.repair_missing_genres()
+            except Exception as e:
+                log.warning("Error while repairing missing genres: %s", e)
         self.execute_vals(artists_cmd, artist_rows)
         self.execute_vals(tracks_cmd, tracks_rows)
         self.execute_vals(artist_genre_cmd, artist_genre_rows)
         self.execute_vals(listening_history_cmd, listening_history_rows)
         self.execute_vals(artists_tracks_cmd, artists_tracks_rows)
+
+        # Only advance the cursor once the plays are stored, so a failed sync is retried in full.
+        # Spotify timestamps are fixed-width UTC ISO-8601 strings, so the largest string is the newest.
+        self.update_sync_cursor(spotify_id, max(listen.played_at for listen in listens))
+
+        # New plays may add new song of the day candidates
+        self.song_candidates_stale = True
+
         if spotify_id in self.history_update_list:
             self.history_update_list.remove(spotify_id)
         else:
-            print("Error: user should be in update list")
-        print("Done updating user listening history on the DB")
+            log.error("User should be in the history update list", extra={"spotify_id": spotify_id})
+        log.info("Done updating listening history", extra={"spotify_id": spotify_id})
 
     def killCloudflare(self):
         """Kills the cloudflare process if it is running"""
 
         # Regardless of success or failure in making the connection...
-        print("Stopping Cloudflare proxy...")
+        if self.proc is None:
+            return
+        log.info("Stopping Cloudflare proxy")
         if self.proc.poll() is None:
             self.proc.send_signal(signal.SIGINT)  # Tell it to close
             try:
@@ -626,7 +1132,7 @@ class DBConnection:
     def get_user_listening_history(self, spotify_id):
         """Returns the entire listening history of the user with parameter spotify_id"""
         
-        print(f"running get history from db {spotify_id}")
+        log.debug("Reading listening history", extra={"spotify_id": spotify_id})
         get_listening_history = """
             SELECT
                 lh.played_at,
@@ -644,6 +1150,7 @@ class DBConnection:
             JOIN artists a
                 ON at.artist_id = a.spotify_artist_id
             WHERE lh.spotify_id = %s
+            AND lh.played_at >= %s
             GROUP BY
                 lh.played_at,
                 lh.context,
@@ -652,7 +1159,7 @@ class DBConnection:
                 t.song_img_url
             ORDER BY lh.played_at DESC;
         """
-        params = (spotify_id,)
+        params = (spotify_id, self.listening_history_cutoff())
         return clean_db_listening_history(self.execute_cmd(get_listening_history, params, fetch=True))
 
 # --- GENRE STUFF ---
@@ -726,6 +1233,254 @@ class DBConnection:
         self.execute_cmd(update_artist_cmd, update_artist_rows)
 
 
+# --- LISTENING HISTORY PARTITIONS ---
+
+    def create_listening_history_tables(self):
+        """
+        Make sure listening_history is a table partitioned by month on played_at,
+        migrating the old unpartitioned table if we find one, and that the daily
+        rollup table exists. Also creates this month's and next month's partitions.
+        """
+        result = self.execute_cmd(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass('listening_history');",
+            (),
+            fetch=True,
+        )
+        relkind = result[0][0] if result else None
+
+        if relkind == 'r':
+            # Old unpartitioned table -> move its rows into the partitioned layout
+            self.migrate_listening_history_to_partitioned()
+        elif relkind is None:
+            # Fresh database -> create the partitioned parent from scratch
+            self.execute_cmd("CREATE SEQUENCE IF NOT EXISTS listening_history_id_seq;", ())
+            self.execute_cmd(self.listening_history_table_ddl("listening_history"), ())
+            self.execute_cmd(
+                """CREATE INDEX IF NOT EXISTS listening_history_spotify_id_played_at_idx
+                   ON listening_history (spotify_id, played_at DESC);""",
+                (),
+            )
+
+        # Per-user daily aggregates of rolled-up (dropped) partitions
+        self.execute_cmd(
+            """
+            CREATE TABLE IF NOT EXISTS listening_history_daily (
+                spotify_id TEXT NOT NULL,
+                listened_on DATE NOT NULL,
+                track_id TEXT NOT NULL,
+                play_count INTEGER NOT NULL,
+                PRIMARY KEY (spotify_id, listened_on, track_id),
+                FOREIGN KEY (spotify_id) REFERENCES users(spotify_id) ON UPDATE CASCADE ON DELETE CASCADE,
+                FOREIGN KEY (track_id) REFERENCES tracks(spotify_track_id) ON DELETE CASCADE
+            );
+            """,
+            (),
+        )
+
+        self.ensure_upcoming_listening_history_partitions()
+
+    def listening_history_table_ddl(self, table_name):
+        """Return the CREATE TABLE statement for a partitioned listening history table"""
+
+        # The partition key (played_at) has to be part of every unique constraint, so a
+        # listen is identified by who played which track when
+        return sql.SQL("""
+            CREATE TABLE {table} (
+                id BIGINT NOT NULL DEFAULT nextval('listening_history_id_seq'),
+                spotify_id TEXT,
+                played_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                context TEXT,
+                track_id TEXT,
+                CONSTRAINT listening_history_pkey PRIMARY KEY (id, played_at),
+                CONSTRAINT listening_history_play_key UNIQUE (spotify_id, track_id, played_at),
+                CONSTRAINT fk_listening_history_user FOREIGN KEY (spotify_id)
+                    REFERENCES users(spotify_id) ON UPDATE CASCADE ON DELETE CASCADE,
+                CONSTRAINT fk_track_id FOREIGN KEY (track_id)
+                    REFERENCES tracks(spotify_track_id) ON DELETE CASCADE
+            ) PARTITION BY RANGE (played_at);
+        """).format(table=sql.Identifier(table_name))
+
+    def migrate_listening_history_to_partitioned(self):
+        """
+        One-time migration from the unpartitioned listening_history table.
+        Runs as a single transaction so a failure leaves the old table untouched.
+        """
+        log.info("Migrating listening_history to monthly partitions")
+        with self.transaction() as cur:
+            # Free up the old names (the sequence must outlive the old table)
+            cur.execute("ALTER TABLE listening_history RENAME TO listening_history_legacy;")
+            cur.execute("ALTER INDEX IF EXISTS listening_history_pkey RENAME TO listening_history_legacy_pkey;")
+            cur.execute("ALTER SEQUENCE IF EXISTS listening_history_id_seq OWNED BY NONE;")
+            cur.execute("CREATE SEQUENCE IF NOT EXISTS listening_history_id_seq;")
+
+            cur.execute(self.listening_history_table_ddl("listening_history"))
+            cur.execute(
+                """CREATE INDEX listening_history_spotify_id_played_at_idx
+                   ON listening_history (spotify_id, played_at DESC);"""
+            )
+
+            # Create a partition for every month the old table covers
+            cur.execute(
+                """SELECT DISTINCT date_trunc('month', played_at)::date
+                   FROM listening_history_legacy;"""
+            )
+            months = [row[0] for row in cur.fetchall()]
+            for month in months:
+                cur.execute(self.listening_history_partition_ddl(month.year, month.month))
+
+            cur.execute(
+                """
+                INSERT INTO listening_history (id, spotify_id, played_at, context, track_id)
+                SELECT id, spotify_id, played_at, context, track_id
+                FROM listening_history_legacy
+                ON CONFLICT DO NOTHING;
+                """
+            )
+            cur.execute("DROP TABLE listening_history_legacy;")
+            cur.execute(
+                """SELECT setval('listening_history_id_seq',
+                                 COALESCE((SELECT MAX(id) FROM listening_history), 0) + 1,
+                                 false);"""
+            )
+
+        self.listening_history_partitions.update((m.year, m.month) for m in months)
+        log.info("Migrated listening_history into %d monthly partitions", len(months))
+
+    def listening_history_partition_ddl(self, year, month):
+        """Return the CREATE TABLE statement for the listening_history partition of year/month"""
+
+        start = date(year, month, 1)
+        end = date(year + month // 12, month % 12 + 1, 1)
+        return sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {partition}
+            PARTITION OF listening_history
+            FOR VALUES FROM ({start}) TO ({end});
+        """).format(
+            partition=sql.Identifier(f"listening_history_y{year:04d}m{month:02d}"),
+            start=sql.Literal(start.isoformat()),
+            end=sql.Literal(end.isoformat()),
+        )
+
+    def ensure_listening_history_partition(self, year, month):
+        """Create the listening_history partition for year/month if we haven't already"""
+
+        if (year, month) in self.listening_history_partitions:
+            return
+        self.execute_cmd(self.listening_history_partition_ddl(year, month), ())
+        self.listening_history_partitions.add((year, month))
+
+    def ensure_upcoming_listening_history_partitions(self):
+        """Keep the current month's and the next month's partitions ready for inserts"""
+
+        today = date.today()
+        next_month = date(today.year + today.month // 12, today.month % 12 + 1, 1)
+        self.ensure_listening_history_partition(today.year, today.month)
+        self.ensure_listening_history_partition(next_month.year, next_month.month)
+
+    def ensure_listening_history_partitions(self, played_ats):
+        """Create any missing partitions for a batch of Spotify played_at timestamps"""
+
+        months = set()
+        for played_at in played_ats:
+            # Spotify sends ISO-8601 strings (e.g. "2025-11-30T18:04:12.345Z")
+            if isinstance(played_at, str):
+                played_at = datetime.fromisoformat(played_at[:19])
+            months.add((played_at.year, played_at.month))
+
+        for year, month in sorted(months):
+            self.ensure_listening_history_partition(year, month)
+
+    def listening_history_cutoff(self, retain_months=None):
+        """
+        First day of the oldest month kept as raw listening_history rows. Bounding reads with
+        played_at >= this lets the planner prune partitions outside the retention window.
+        """
+        if retain_months is None:
+            retain_months = self.LISTENING_HISTORY_RETENTION_MONTHS
+        today = date.today()
+        months_since_epoch = today.year * 12 + (today.month - 1) - retain_months
+        return date(months_since_epoch // 12, months_since_epoch % 12 + 1, 1)
+
+    def maintain_listening_history(self, retain_months=None):
+        """
+        Periodic partition upkeep: create the upcoming months' partitions and roll up the ones
+        that have left the retention window. Guarded by a session advisory lock, so when several
+        server processes run it at once only one does the work and the others skip it.
+        Returns the names of the partitions that were rolled up, or None if another process had the lock.
+        """
+        with self.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_lock(%s);", (LISTENING_HISTORY_MAINTENANCE_LOCK_ID,))
+                    locked = cur.fetchone()[0]
+                conn.commit()
+                if not locked:
+                    return None
+
+                try:
+                    self.ensure_upcoming_listening_history_partitions()
+                    return self.apply_listening_history_retention(retain_months)
+                finally:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_unlock(%s);", (LISTENING_HISTORY_MAINTENANCE_LOCK_ID,))
+                    conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def apply_listening_history_retention(self, retain_months=None):
+        """
+        Roll every partition older than the retention window up into per-user daily
+        aggregates (listening_history_daily), then drop its raw rows. Call it through
+        maintain_listening_history so two processes never roll up the same partition.
+        Returns the names of the partitions that were rolled up.
+        """
+        # First month that is still kept raw
+        cutoff_date = self.listening_history_cutoff(retain_months)
+        cutoff = (cutoff_date.year, cutoff_date.month)
+
+        partitions = self.execute_cmd(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON i.inhrelid = c.oid
+            WHERE i.inhparent = 'listening_history'::regclass;
+            """,
+            (),
+            fetch=True,
+        )
+
+        rolled_up = []
+        for (name,) in partitions:
+            # Partition names look like listening_history_y2025m11
+            try:
+                year, month = int(name[-7:-3]), int(name[-2:])
+            except ValueError:
+                continue
+            if (year, month) >= cutoff:
+                continue
+
+            # Aggregate and drop in one transaction so no plays are lost or double counted
+            with self.transaction() as cur:
+                cur.execute(sql.SQL("""
+                    INSERT INTO listening_history_daily (spotify_id, listened_on, track_id, play_count)
+                    SELECT spotify_id, played_at::date, track_id, COUNT(*)
+                    FROM {partition}
+                    WHERE spotify_id IS NOT NULL AND track_id IS NOT NULL
+                    GROUP BY spotify_id, played_at::date, track_id
+                    ON CONFLICT (spotify_id, listened_on, track_id)
+                    DO UPDATE SET play_count = listening_history_daily.play_count + EXCLUDED.play_count;
+                """).format(partition=sql.Identifier(name)))
+                cur.execute(sql.SQL("DROP TABLE {partition};").format(partition=sql.Identifier(name)))
+
+            self.listening_history_partitions.discard((year, month))
+            rolled_up.append(name)
+
+        if rolled_up:
+            log.info("Rolled up listening_history partitions: %s", rolled_up)
+        return rolled_up
+
+
 # --- SONG OF THE DAY FUNCTIONS ---
 
     def create_song_of_the_day_table(self):
@@ -745,16 +1500,17 @@ class DBConnection:
         try:
             self.execute_cmd(cmd, (), fetch=False)
         except Exception as e:
-            print(f"Error creating song_of_the_day table: {e}")
+            log.error("Error creating song_of_the_day table: %s", e)
             raise e
 
-    def get_all_unique_tracks(self):
+    def create_song_candidates_view(self):
         """
-        Get all unique tracks from all users' listening histories.
-        Returns list of unique tracks with full track info.
+        Create the song_of_the_day_candidates materialized view if it doesn't exist.
+        It holds every unique track from all users' listening histories with its artists,
+        so picking a song of the day never has to scan listening_history.
         """
-        # Use a CTE to first get unique (track, artist) pairs, then aggregate.
         cmd = """
+            CREATE MATERIALIZED VIEW IF NOT EXISTS song_of_the_day_candidates AS
             WITH unique_track_artists AS (
                 SELECT DISTINCT
                     t.spotify_track_id,
@@ -780,19 +1536,102 @@ class DBConnection:
                 spotify_track_id,
                 track_name,
                 song_img_url,
-                album_name
-            ORDER BY track_name;
+                album_name;
         """
-        return self.execute_cmd(cmd, (), fetch=True)
+        self.execute_cmd(cmd, (), fetch=False)
 
-    def get_current_song_of_the_day(self):
+        # A unique index lets us refresh the view CONCURRENTLY (without blocking readers)
+        self.execute_cmd(
+            """CREATE UNIQUE INDEX IF NOT EXISTS song_of_the_day_candidates_track_id_idx
+               ON song_of_the_day_candidates (track_id);""",
+            (),
+            fetch=False,
+        )
+        self.song_candidates_refreshed_at = time.time()
+
+    def refresh_song_candidates(self, force=False):
         """
-        Get the current song of the day with full track information.
-        Returns None if no current song exists.
+        Refresh the song_of_the_day_candidates view if new listening history came in
+        and the last refresh is older than SONG_CANDIDATES_REFRESH_SECONDS (or if forced).
+        Returns True if the view was refreshed.
+        """
+        age = time.time() - self.song_candidates_refreshed_at
+        if not force and (not self.song_candidates_stale or age < self.SONG_CANDIDATES_REFRESH_SECONDS):
+            return False
+
+        # Clear the flag first so plays ingested during the refresh mark it stale again
+        self.song_candidates_stale = False
+        self.execute_cmd("REFRESH MATERIALIZED VIEW CONCURRENTLY song_of_the_day_candidates;", (), fetch=False)
+        self.song_candidates_refreshed_at = time.time()
+        return True
+
+    def rollover_song_of_the_day(self, rolled_over_since=None):
+        """
+        Atomically replace the song of the day if it is missing or was selected before
+        rolled_over_since (a timezone-aware datetime; defaults to 24 hours ago).
+        Runs in one transaction under an advisory lock, so concurrent callers (in any
+        server process) wait for the first rollover and then reuse its result.
+        Returns the track_id of the current song afterwards, or None if there are no tracks.
+        """
+        # Refresh the candidate pool outside the lock (it may take a moment)
+        self.refresh_song_candidates()
+
+        with self.transaction() as cur:
+            # Only one rollover at a time; released automatically at commit/rollback
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (SONG_OF_THE_DAY_LOCK_ID,))
+
+            # Someone else may have rolled over while we waited for the lock
+            cur.execute(
+                """
+                SELECT track_id
+                FROM song_of_the_day
+                WHERE is_current = TRUE
+                AND selected_at >= COALESCE(%s::timestamptz, NOW() - INTERVAL '24 hours')
+                LIMIT 1;
+                """,
+                (rolled_over_since,),
+            )
+            current = cur.fetchone()
+            if current is not None:
+                return current[0]
+
+            # Randomly pick a track that hasn't been the song of the day yet
+            cur.execute(PICK_SONG_OF_THE_DAY_CANDIDATE_CMD)
+            selected_track = cur.fetchone()
+
+            # If every track has been selected already, clear history and restart the cycle
+            if selected_track is None:
+                cur.execute("DELETE FROM song_of_the_day;")
+                cur.execute(PICK_SONG_OF_THE_DAY_CANDIDATE_CMD)
+                selected_track = cur.fetchone()
+
+            if selected_track is None:
+                return None
+
+            cur.execute("UPDATE song_of_the_day SET is_current = FALSE WHERE is_current = TRUE;")
+            cur.execute(
+                """
+                INSERT INTO song_of_the_day (track_id, selected_at, is_current, last_updated)
+                VALUES (%s, NOW(), TRUE, NOW())
+                ON CONFLICT (track_id)
+                DO UPDATE SET
+                    selected_at = NOW(),
+                    is_current = TRUE,
+                    last_updated = NOW();
+                """,
+                (selected_track[0],),
+            )
+            return selected_track[0]
+
+    def get_song_of_the_day_state(self, rolled_over_since=None):
+        """
+        Get the current song of the day and whether it is due for a refresh, in one query.
+        It is due if it was selected before rolled_over_since (a timezone-aware datetime;
+        defaults to 24 hours ago).
+        Returns (current_song, is_stale, seconds_until_rollover) where current_song is
+        (track_id, track_name, song_img_url, album_name, artist_names, artist_ids, selected_at),
+        or (None, True, 0) if no current song exists.
         """
-        # Ensure table exists
-        self.create_song_of_the_day_table()
-        
         # Use CTE to deduplicate artists before aggregation
         cmd = """
             WITH current_track_artists AS (
@@ -817,7 +1656,9 @@ class DBConnection:
                 album_name,
                 ARRAY_AGG(artist_name ORDER BY artist_name) AS artist_names,
                 ARRAY_AGG(artist_id ORDER BY artist_name) AS artist_ids,
-                selected_at
+                selected_at,
+                selected_at < COALESCE(%s::timestamptz, NOW() - INTERVAL '24 hours') AS is_stale,
+                EXTRACT(EPOCH FROM (selected_at + INTERVAL '24 hours' - NOW())) AS seconds_until_rollover
             FROM current_track_artists
             GROUP BY
                 spotify_track_id,
@@ -827,105 +1668,63 @@ class DBConnection:
                 selected_at
             LIMIT 1;
         """
-        result = self.execute_cmd(cmd, (), fetch=True)
+        result = self.execute_cmd(cmd, (rolled_over_since,), fetch=True)
         if result and len(result) > 0:
-            return result[0]
-        return None
+            row = result[0]
+            return row[:7], row[7], float(row[8])
+        return None, True, 0.0
 
-    def get_all_previously_selected_track_ids(self):
-        """
-        Get all track IDs that have been selected as song of the day before.
-        Returns a set of track IDs.
+    def get_current_song_of_the_day(self):
         """
-        # Ensure table exists
-        self.create_song_of_the_day_table()
-        
-        cmd = """
-            SELECT DISTINCT track_id
-            FROM song_of_the_day;
+        Get the current song of the day with full track information.
+        Returns None if no current song exists.
         """
-        result = self.execute_cmd(cmd, (), fetch=True)
-        return {row[0] for row in result} if result else set()
+        current_song, _, _ = self.get_song_of_the_day_state()
+        return current_song
 
-    def update_song_of_the_day(self, track_id):
-        """
-        Update the song of the day table with a new track.
-        Deactivates all previous current songs and sets the new one as current.
-        """
-        # Ensure table exists
-        self.create_song_of_the_day_table()
-        
-        # First, deactivate all current songs
-        deactivate_cmd = """
-            UPDATE song_of_the_day
-            SET is_current = FALSE
-            WHERE is_current = TRUE;
-        """
-        self.execute_cmd(deactivate_cmd, (), fetch=False)
-        
-        # Then insert or update the new song
-        insert_cmd = """
-            INSERT INTO song_of_the_day (track_id, selected_at, is_current, last_updated)
-            VALUES (%s, NOW(), TRUE, NOW())
-            ON CONFLICT (track_id)
-            DO UPDATE SET
-                selected_at = NOW(),
-                is_current = TRUE,
-                last_updated = NOW();
-        """
-        self.execute_cmd(insert_cmd, (track_id,), fetch=False)
 
-    def clear_song_of_the_day_history(self):
-        """
-        Clear all entries from the song_of_the_day table.
-        Called when all unique songs have been selected to restart the cycle.
-        """
-        # Ensure table exists
-        self.create_song_of_the_day_table()
-        
-        cmd = """
-            DELETE FROM song_of_the_day;
-        """
-        self.execute_cmd(cmd, (), fetch=False)
+# --- HTTP SESSIONS ---
 
-    def should_refresh_song_of_the_day(self):
-        """
-        Check if the song of the day should be refreshed.
-        Returns True if:
-        - No current song exists, OR
-        - Current song was selected more than 24 hours ago
-        """
-        # Ensure table exists
-        self.create_song_of_the_day_table()
-        
-        current_song = self.get_current_song_of_the_day()
-        
-        # If no current song exists, we need to refresh
-        if current_song is None:
-            return True
-        
-        # Check if the current song is older than 24 hours
-        cmd = """
-            SELECT selected_at
-            FROM song_of_the_day
-            WHERE is_current = TRUE
-            LIMIT 1;
-        """
-        result = self.execute_cmd(cmd, (), fetch=True)
-        
-        if result and len(result) > 0:
-            selected_at = result[0][0]
-            # Check if selected_at is more than 24 hours ago
-            check_cmd = """
-                SELECT selected_at < NOW() - INTERVAL '24 hours'
-                FROM song_of_the_day
-                WHERE is_current = TRUE
-                LIMIT 1;
-            """
-            refresh_result = self.execute_cmd(check_cmd, (), fetch=True)
-            if refresh_result and len(refresh_result) > 0:
-                return refresh_result[0][0]
-        
-        return False
+    def create_http_sessions_table(self):
+        """Create the http_sessions table used by the Postgres session backend if it doesn't exist"""
 
+        # id is a hash of the session cookie, never the cookie itself
+        self.execute_cmd(
+            """
+            CREATE TABLE IF NOT EXISTS http_sessions (
+                id TEXT PRIMARY KEY,
+                data JSONB NOT NULL,
+                expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+            );
+            """,
+            (),
+        )
+        self.execute_cmd(
+            "CREATE INDEX IF NOT EXISTS http_sessions_expires_at_idx ON http_sessions (expires_at);",
+            (),
+        )
 
+    def get_http_session(self, session_key):
+        """Return the stored session data (a dict) for session_key, or None if missing or expired"""
+        cmd = """SELECT data FROM http_sessions
+                 WHERE id = %s AND expires_at > now();"""
+        result = self.execute_cmd(cmd, (session_key,), fetch=True)
+        return result[0][0] if result else None
+
+    def save_http_session(self, session_key, data, ttl_seconds):
+        """Store session data (a dict) under session_key for ttl_seconds"""
+        cmd = """INSERT INTO http_sessions (id, data, expires_at)
+                 VALUES (%s, %s, now() + make_interval(secs => %s))
+                 ON CONFLICT (id) DO UPDATE
+                 SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at;"""
+        self.execute_cmd(cmd, (session_key, Json(data), ttl_seconds))
+
+    def delete_http_session(self, session_key):
+        """Delete one stored session (logout / server-side invalidation)"""
+        self.execute_cmd("DELETE FROM http_sessions WHERE id = %s;", (session_key,))
+
+    def delete_expired_http_sessions(self):
+        """Delete every expired session; returns how many were removed"""
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM http_sessions WHERE expires_at <= now();")
+            return cur.rowcount
@@ -0,0 +1,147 @@
+# Prologue
+# Name: app_logging.py
+# Description: Structured logging for the server. Records are stamped with the current request ID,
+#              scrubbed of tokens, and handed to a queue so a background thread does the writing.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: Modules get their logger from get_logger(); configure_logging() runs once at startup.
+#   - Post: Request threads only enqueue records; disabled levels cost a single level check.
+# Errors: None; a failing handler reports through logging's own error handling.
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import time
+import uuid
+
+# All server loggers live under this name so they share one handler
+ROOT_LOGGER = "scorify"
+
+# Request ID for the request being handled; "-" outside requests (startup, background threads)
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+# Values of these extra fields are never logged
+SECRET_FIELDS = re.compile(r"token|secret|password|authorization|cookie|^code$|^session$", re.IGNORECASE)
+# Token-shaped substrings inside messages: bearer headers and token key/value pairs
+SECRET_PATTERNS = [
+    (re.compile(r"(Bearer\s+)[A-Za-z0-9._~+/=-]+", re.IGNORECASE), r"\1[redacted]"),
+    (re.compile(r"""(['"]?\b(?:access_token|refresh_token|client_secret|code)['"]?\s*[:=]\s*['"]?)[^'"&,\s}]+""",
+                re.IGNORECASE), r"\1[redacted]"),
+]
+
+# LogRecord attributes that aren't user-supplied extra fields
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+listener = None
+
+
+def get_logger(name):
+    """Logger for a server module, e.g. get_logger("db") -> scorify.db"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def redact(text):
+    """Mask bearer tokens and token values embedded in a message"""
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class ContextFilter(logging.Filter):
+    '''Runs on the calling thread: stamps the request ID and scrubs secrets before the record is queued'''
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.msg = redact(record.getMessage())
+        record.args = None
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and SECRET_FIELDS.search(key) and value is not None:
+                setattr(record, key, "[redacted]")
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    '''One JSON object per line: time, level, logger, request_id, message, and any extra fields'''
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    '''Human-readable lines for local development'''
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        extras = {key: value for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES}
+        if extras:
+            line += " " + " ".join(f"{key}={value}" for key, value in extras.items())
+        return line
+
+
+def configure_logging(level=None, fmt=None):
+    """Route scorify.* loggers through a queue to stderr. LOG_LEVEL (default INFO) and LOG_FORMAT
+    (json or text, default json) are read from the environment. Safe to call more than once."""
+    global listener
+    if listener is not None:
+        return
+
+    level = (level or os.getenv("LOG_LEVEL") or "INFO").upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT") or "json").lower()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(TextFormatter() if fmt == "text" else JSONFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+def init_app(app):
+    """Give every request an ID (taken from X-Request-ID when the caller sends one) and echo it back"""
+    from flask import request
+
+    @app.before_request
+    def assign_request_id():
+        request_id_var.set(request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16])
+
+    @app.after_request
+    def add_request_id_header(response):
+        response.headers["X-Request-ID"] = request_id_var.get()
+        return response
+
+    @app.teardown_request
+    def clear_request_id(error):
+        request_id_var.set("-")
@@ -0,0 +1,455 @@
+# Prologue
+# Name: asgi_server.py
+# Description: Async (ASGI) serving mode. Serves server.py's shared route logic; this module only adds the
+#              transport: Spotify calls go through an async HTTP client and blocking database calls run on
+#              a small thread pool, so a request waiting on I/O holds a coroutine instead of a worker thread.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.2
+# Pre/post conditions
+#   - Pre: Same environment as server.py; Quart, quart-cors and httpx are installed. Serve with an ASGI
+#          server, e.g. hypercorn "asgi_server:create_app()".
+#   - Post: Route contracts match server.py (the route bodies are its *_response helpers).
+# Errors: Same as the matching routes in server.py.
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import httpx
+from quart import Blueprint, Quart, Response, g, jsonify, redirect, request, session
+from quart.sessions import SessionInterface
+from quart_cors import cors
+
+import app_logging
+import metrics
+import server
+import session_store
+
+log = app_logging.get_logger("asgi_server")
+
+# All routes live on this blueprint; create_app() builds a Quart app around it
+api = Blueprint('api', __name__)
+
+# Threads for blocking database calls. Only DB_POOL_SIZE connections exist, so more threads would
+# only wait for one; requests beyond that wait on the event loop, which costs next to nothing.
+DB_WORKERS = int(os.getenv('DB_POOL_SIZE') or 8)
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="asgi-db")
+
+# Separate threads for session loads/saves (file and Postgres stores), so they never queue behind
+# slow queries on the database threads
+SESSION_WORKERS = 4
+session_executor = ThreadPoolExecutor(max_workers=SESSION_WORKERS, thread_name_prefix="asgi-session")
+
+# Listening history ingestion (Spotify and MusicBrainz artist lookups) runs in the background on these
+# threads. Beyond INGEST_BACKLOG waiting syncs new ones are skipped: the sync cursor only moves once
+# plays are stored, so the user's next sync fetches them again.
+INGEST_WORKERS = 2
+INGEST_BACKLOG = 100
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="asgi-ingest")
+ingest_slots = threading.BoundedSemaphore(INGEST_BACKLOG)
+
+# Connections the shared HTTP client keeps open to Spotify (calls beyond that wait for one)
+HTTP_MAX_CONNECTIONS = 256
+HTTP_TIMEOUT_SECONDS = 30
+
+# The async HTTP client, opened when the server starts serving
+http_client: Optional[httpx.AsyncClient] = None
+
+# Method and route of the request a coroutine is handling, for the database metrics
+endpoint_var = contextvars.ContextVar("endpoint", default=None)
+
+
+def run_with_context(context, endpoint, fn, args):
+    '''Run fn in the request's logging context, labelled with its endpoint for the slow query log'''
+    metrics.request_state.endpoint = endpoint
+    try:
+        return context.run(fn, *args)
+    finally:
+        metrics.request_state.endpoint = None
+
+
+async def run_on(executor, fn, *args):
+    '''Await a blocking call run on one of the thread pools, in the request's context'''
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, run_with_context, contextvars.copy_context(), endpoint_var.get(), fn, args)
+
+
+async def blocking(fn, *args):
+    '''Await a blocking call (database, token refresh) run on the database threads'''
+    return await run_on(db_executor, fn, *args)
+
+
+def ingest_in_background(spotify_id, listens, access_token):
+    '''Store new plays on the ingestion threads without waiting (skipped if the backlog is full)'''
+    if not ingest_slots.acquire(blocking=False):
+        log.warning("Ingestion backlog full, leaving plays for the next sync", extra={"spotify_id": spotify_id})
+        return
+
+    def ingest():
+        try:
+            server.dbConn.update_user_history(spotify_id, listens, access_token)
+        except Exception as e:
+            log.error("Error storing listening history: %s", e, extra={"spotify_id": spotify_id})
+        finally:
+            ingest_slots.release()
+
+    ingest_executor.submit(contextvars.copy_context().run, ingest)
+
+
+async def cached_song_of_the_day():
+    '''The cached song of the day, read in place; only a stale cache goes to the database threads'''
+    fresh, payload = server.song_of_the_day_cache.cached()
+    if fresh:
+        return payload
+    return await blocking(server.song_of_the_day_cache.get)
+
+
+async def spotify_request(method, url, **kwargs):
+    '''Timed request to Spotify on the shared async client'''
+    return await metrics.timed_async_request(http_client, "spotify", method, url, **kwargs)
+
+
+class AsyncSessionInterface(SessionInterface):
+    def __init__(self, interface):
+        '''Serve session_store's server-side sessions to Quart (file/Postgres stores load on the session threads)'''
+        self.interface = interface
+        self.in_memory = isinstance(interface.store, session_store.MemorySessionStore)
+
+    async def open_session(self, app, request):
+        if self.in_memory:
+            return self.interface.open_session(app, request)
+        return await run_on(session_executor, self.interface.open_session, app, request)
+
+    async def save_session(self, app, session, response):
+        if self.in_memory:
+            return self.interface.save_session(app, session, response)
+        return await run_on(session_executor, self.interface.save_session, app, session, response)
+
+
+def create_app():
+    '''App factory for the async serving mode. The database connects lazily on the first request.'''
+
+    # Quart app initialization
+    app = Quart(__name__)
+    app = cors(app,
+               allow_origin=['http://127.0.0.1:3000'],
+               allow_credentials=True
+               )
+
+    # Same secret key and session cookie settings as server.create_app()
+    app.secret_key = os.getenv('APP_SECRET_KEY')
+    app.config.update(
+        SESSION_COOKIE_SAMESITE='Lax',
+        SESSION_COOKIE_SECURE=False,
+        SESSION_COOKIE_HTTPONLY=True,
+        SESSION_COOKIE_DOMAIN='127.0.0.1'
+    )
+
+    # Keep session data on the server if SESSION_BACKEND asks for it; cookie (default) keeps Quart's signed cookie
+    if session_store.SESSION_BACKEND != "cookie":
+        app.session_interface = AsyncSessionInterface(session_store.ServerSideSessionInterface(
+            session_store.make_store(session_store.SESSION_BACKEND, server.get_db)))
+
+    app_logging.configure_logging()
+    init_request_hooks(app)
+
+    @app.before_serving
+    async def open_http_client():
+        global http_client
+        http_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS))
+
+    @app.after_serving
+    async def close_http_client():
+        await http_client.aclose()
+
+    app.register_blueprint(api)
+    return app
+
+
+def init_request_hooks(app):
+    '''Request IDs, per-endpoint latency and /metrics, as app_logging.init_app and metrics.init_app do for Flask'''
+
+    @app.before_request
+    async def start_request():
+        app_logging.request_id_var.set(request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16])
+        g.request_started = time.perf_counter()
+        rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        endpoint_var.set(f"{request.method} {rule}")
+
+    @app.after_request
+    async def finish_request(response):
+        response.headers["X-Request-ID"] = app_logging.request_id_var.get()
+        started = g.pop("request_started", None)
+        if started is not None:
+            # Use the route template to keep label counts bounded
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method,
+                                                 str(response.status_code))
+        return response
+
+    @app.teardown_request
+    async def record_failed_request(error):
+        # Unhandled exceptions skip after_request
+        started = g.pop("request_started", None)
+        if started is not None and error is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method, "500")
+        app_logging.request_id_var.set("-")
+
+    @app.route('/metrics')
+    async def metrics_endpoint():
+        return Response(metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)
+
+
+# --- HELPERS (the awaiting glue around server.py's shared route logic) ---
+
+async def logged_in_token():
+    '''server.logged_in_token, leaving the event loop only when the token has to be refreshed'''
+    if server.session_token_needs_refresh(session):
+        return await blocking(server.logged_in_token, session)
+    return server.logged_in_token(session)
+
+
+async def user_id_for(spotify_id):
+    '''The user ID for spotify_id, looked up at most once per request'''
+    memo = g.setdefault('user_ids', {})
+    if spotify_id not in memo:
+        user_id = server.dbConn.identities.user_id(spotify_id)
+        if user_id is None:
+            user_id = await blocking(server.dbConn.get_user_id_by_spotify_id, spotify_id)
+        memo[spotify_id] = user_id
+    return memo[spotify_id]
+
+
+async def sync_spotify_profile(access_token, refresh_token, spotify_id=None):
+    '''server.sync_spotify_profile over the async client: returns (Spotify /me JSON, user_id)'''
+    current, profile = server.cached_spotify_profile(spotify_id, access_token, refresh_token)
+    if current is not None:
+        return current
+    if profile is None:
+        response = await spotify_request("GET", f'{server.API_BASE_URL}/me',
+                                         headers=server.spotify_headers(access_token))
+        response.raise_for_status()
+        profile = (response.json(), response.text)
+    return await blocking(server.store_spotify_profile, *profile, access_token, refresh_token)
+
+
+# --- ROUTES (the route bodies live in server.py; see the matching routes there) ---
+
+@api.route('/')
+async def lander():
+    return "<div><h1>API lander<h1><div>"
+
+
+@api.route('/login')
+async def login():
+    '''Redirect the user to Spotify's authorization URL to authorize the app.'''
+    if 'access_token' in session:
+        log.debug("User already logged in, redirecting to dashboard")
+        return redirect('http://127.0.0.1:3000/dashboard')
+
+    try:
+        return redirect(server.authorize_url())
+    except Exception as e:
+        return redirect(server.login_error_url(e))
+
+
+@api.route('/callback')
+async def callback():
+    '''Handle the callback from Spotify's authorization server and exchange temporary code for access token.'''
+    try:
+        if 'error' in request.args:
+            raise Exception(request.args['error'])
+
+        assert (server.dbConn.connected)
+        if 'code' in request.args:
+            response = await spotify_request("POST", server.TOKEN_URL,
+                                             data=server.token_request_body(request.args['code']))
+            server.start_session(session, response.json())
+            return redirect('http://127.0.0.1:3000/dashboard')
+    except Exception as e:
+        return redirect(server.login_error_url(e))
+
+
+@api.route('/get-user-info-by-id/<int:user_id>')
+async def get_user_info_by_id(user_id):
+    '''Returns user info for a given user ID.'''
+    return await blocking(server.user_info_by_id_response, session, user_id)
+
+
+@api.route('/get-user-info')
+async def api_get_user_info():
+    '''Get the user's information from the Spotify API, using the access token.'''
+    access_token, error = await logged_in_token()
+    if error is not None:
+        return error
+
+    try:
+        user_info, user_id = await sync_spotify_profile(
+            access_token, session.get('refresh_token'), session.get('spotify_id'))
+        server.link_session(session, user_info['id'], access_token)
+        return server.user_info_response(user_info, user_id)
+    except Exception as e:
+        return {'error': str(e)}, 400
+
+
+@api.route('/get-leaderboard-data')
+async def get_leaderboard_data():
+    '''Get profile pictures, usernames, diversity scores, and music taste ratings for all users.'''
+    return await blocking(server.leaderboard_response, session)
+
+
+@api.route('/get-user-diversity-score-by-id/<int:user_id>')
+async def get_user_diversity_score_by_user_id(user_id):
+    return await blocking(server.diversity_score_by_id_response, session, user_id)
+
+
+@api.route('/get-user-diversity-score')
+async def get_user_diversity_score():
+    '''Get the user's diversity score from their listening history.'''
+    return await blocking(server.diversity_score_response, session)
+
+
+@api.route('/get-user-taste-score')
+async def get_user_taste_score():
+    '''Get the user's taste score by comparing their genre distribution to the developers' (the reference cohort).'''
+    return await blocking(server.taste_score_response, session)
+
+
+@api.route('/get-user-taste-score-by-id/<int:user_id>')
+async def get_user_taste_score_by_user_id(user_id):
+    '''Returns the taste score for a given user ID.'''
+    return await blocking(server.taste_score_by_id_response, session, user_id)
+
+
+@api.route('/get-user-listening-history-by-id/<int:user_id>')
+async def get_user_listening_history_id(user_id):
+    '''Retrieve a user's listening history by their user ID.'''
+    return await blocking(server.listening_history_by_id_response, session, user_id)
+
+
+@api.route('/get-similar-listeners-by-id/<int:user_id>')
+async def get_similar_listeners_by_id(user_id):
+    '''Returns the listeners whose genre distributions are most similar to the given user's.'''
+    return await blocking(server.similar_listeners_response, session, user_id,
+                          request.args.get('limit', default=10, type=int))
+
+
+@api.route('/is-user-history-updating')
+async def is_user_history_updating():
+    '''Returns whether the user's listening history is currently being updated.'''
+    # An in-memory check; no need to leave the event loop
+    return server.history_updating_response(session, request.args.get('spotify_id'))
+
+
+@api.route('/get-user-listening-history')
+async def get_user_listening_history():
+    '''Get the user's listening history from the SpotifyDB Database, using existing dbconnection'''
+    return await blocking(server.stored_listening_history_response, session)
+
+
+@api.route('/fetch-user-listening-history-by-id/<int:user_id>')
+async def fetch_user_listening_history(user_id):
+    '''Fetch the user's plays since their last sync from the Spotify API, using the access token.'''
+    error, fetch = await blocking(server.prepare_history_fetch, session, user_id)
+    if error is not None:
+        return error
+    spotify_id, access_token, req_params = fetch
+
+    try:
+        response = await spotify_request(
+            "GET", f'{server.API_BASE_URL}/me/player/recently-played',
+            headers=server.spotify_headers(access_token),
+            params=req_params)
+        listens, result = server.history_fetch_response(response.content)
+
+        # Ingestion looks up artists on Spotify and MusicBrainz; it runs on the ingestion threads
+        if listens:
+            ingest_in_background(spotify_id, listens, access_token)
+        return result
+    except Exception as e:
+        return {'error': str(e)}, 400
+
+
+@api.route('/refresh-user-token')
+async def refresh_token():
+    '''Refresh the access token using the refresh token.'''
+    return await blocking(server.refresh_token_response, session)
+
+
+@api.route('/get-song-of-the-day')
+async def get_song_of_the_day():
+    '''Get the song of the day. It is rolled over daily by a background scheduler.'''
+    _, error = await logged_in_token()
+    if error is not None:
+        return error
+
+    try:
+        # Cache read; falls back to the database only when the cache is cold
+        return server.song_of_the_day_response(await cached_song_of_the_day())
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+@api.route('/dashboard')
+@api.route('/dashboard/<int:user_id>')
+async def get_dashboard(user_id=None):
+    '''Everything the dashboard needs in one request (see server.get_dashboard); independent reads run concurrently.'''
+    access_token, error = await logged_in_token()
+    if error is not None:
+        return error
+
+    try:
+        refresh_token = session.get('refresh_token')
+        spotify_id = session.get('spotify_id')
+        own_user_id = await user_id_for(spotify_id) if spotify_id else None
+
+        if own_user_id is None:
+            # First load after login (or a new user): we need /me to know who this is before anything else
+            profile, own_user_id = await sync_spotify_profile(access_token, refresh_token)
+            spotify_id = profile['id']
+            server.link_session(session, spotify_id, access_token)
+            profile_task = None
+        else:
+            # Keep the stored profile current alongside the reads below
+            profile_task = asyncio.ensure_future(sync_spotify_profile(access_token, refresh_token, spotify_id))
+
+        dashboard = await blocking(server.load_dashboard, spotify_id, own_user_id,
+                                   own_user_id if user_id is None else user_id)
+        song_of_the_day = await cached_song_of_the_day()
+
+        if profile_task is not None:
+            try:
+                profile = (await profile_task)[0]
+            except Exception as e:
+                log.warning("Could not load dashboard profile: %s", e)
+                profile = None
+        # Without a profile, the fallback reads the users table
+        return await blocking(server.dashboard_response, profile, spotify_id, own_user_id, dashboard,
+                              song_of_the_day)
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+
+@api.before_request
+async def check_db_connection():
+    # Connecting can take a while (tunnel start-up), so do it off the event loop
+    db = server.dbConn or await blocking(server.get_db)
+    if db is None or not db.connected:
+        return jsonify({
+            "error": "Database connection failed. Please try again later."
+        }), 501
+
+
+# Run the application
+if __name__ == "__main__":
+    create_app().run(host="127.0.0.1", port=5000)
@@ -0,0 +1,294 @@
+# Prologue
+# Name: micro.py
+# Description: Micro-benchmarks for the pure-Python scoring, classification, formatting and session
+#              lookup code on the request path, compared against stored baselines so regressions fail loudly.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.1
+# Pre/post conditions
+#   - Pre: genres_dict.json is in the flask-server directory.
+#   - Post: Exits 1 if any case is slower than its baseline by more than --tolerance (--small-tolerance
+#           for sub-millisecond cases) on every one of --confirm re-measurements. Timings are the
+#           fastest round relative to a fixed reference workload timed in alternating rounds, with the
+#           garbage collector off, so CPU frequency changes and noisy neighbours don't read as regressions.
+# Errors: Cases without a baseline are reported but never fail the run.
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.synthetic import Catalogue  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baselines.json")
+
+# Each round runs for at least this long (loops are calibrated to reach it)
+MIN_ROUND_SECONDS = 0.05
+
+# Cases faster than this are dominated by timer and cache noise and get --small-tolerance instead
+SMALL_CASE_SECONDS = 0.001
+
+
+def build_inputs(seed=581):
+    """Realistic inputs: a 10k-play history drawn from a large catalogue, and its 50 most recent plays"""
+    import server_utils
+
+    catalogue = Catalogue(users=1, listens=1_000_000, seed=seed)
+    plays = catalogue.plays(0, 10_000)
+
+    # get_user_genres returns one genre array per (track, artist); empty arrays are filtered out by callers
+    genre_lists = [catalogue.artist_genres(a) for t, _ in plays for a in catalogue.track_artists(t)]
+    genre_lists = [genres for genres in genre_lists if genres]
+
+    db_rows = []
+    for t, played_at in plays:
+        track = catalogue.track(t)
+        db_rows.append((played_at, None, track["id"], track["name"], track["album"]["images"][0]["url"],
+                        [a["name"] for a in track["artists"]], [a["id"] for a in track["artists"]]))
+
+    history_10k = catalogue.recently_played(0, limit=10_000)
+    history_50 = {"items": history_10k["items"][:50]}
+    body_10k = json.dumps(history_10k).encode()
+    body_50 = json.dumps(history_50).encode()
+
+    bucketed_10k = server_utils.bucketize_genre_lists(genre_lists)
+    bucketed_50 = server_utils.bucketize_genre_lists(genre_lists[:50])
+
+    return {
+        "tags": catalogue.genre_tags[:2000] + [tag.upper() for tag in catalogue.genre_tags[2000:3000]],
+        "genre_lists_50": genre_lists[:50],
+        "genre_lists_10k": genre_lists,
+        "bucketed_50": bucketed_50,
+        "bucketed_10k": bucketed_10k,
+        "db_rows_50": db_rows[:50],
+        "db_rows_10k": db_rows,
+        "history_50": history_50,
+        "history_10k": history_10k,
+        "body_50": body_50,
+        "body_10k": body_10k,
+    }
+
+
+def legacy_history_rows(spotify_id, spotify_json):
+    """
+    Ingestion row building as update_user_history did it before plays were parsed once into shared
+    records: re-parse the response text and build rows per play. Kept only as the comparison point for
+    the recently_played_route cases.
+    """
+    import server_utils
+
+    artist_rows, tracks_rows, listening_history_rows, artists_tracks_rows = [], [], [], []
+    for item in json.loads(spotify_json)["items"]:
+        track = item["track"]
+        album = track["album"]
+        artist = track["artists"][0]
+        duration_ms = track.get("duration_ms", "NULL")
+        release_date = server_utils.normalize_spotify_date(album.get("release_date", None))
+        context = item["context"]["type"] if item.get("context") else None
+        artist_rows.append((artist["id"], artist["name"]))
+        tracks_rows.append((track["id"], track["name"], artist["id"], duration_ms if duration_ms else "NULL",
+                            album["name"], release_date if release_date else "NULL", album["images"][0]["url"]))
+        listening_history_rows.append((spotify_id, track["id"], item["played_at"], context if context else "NULL"))
+        for artist in track["artists"]:
+            artists_tracks_rows.append((artist["id"], track["id"]))
+            artist_rows.append((artist["id"], artist["name"]))
+
+    dedup = {}
+    for row in listening_history_rows:
+        dedup[(row[1], row[2])] = row
+    return artist_rows, tracks_rows, list(dedup.values()), artists_tracks_rows
+
+
+def build_cases(inputs):
+    """name -> zero-argument callable"""
+    import server_utils
+    import session_store
+    from helpers.listening_records import parse_recently_played
+    from helpers.simplify_json import SimplifyJSON
+
+    def classify_cold():
+        # Clear the memo so every round classifies every tag from scratch
+        server_utils.classify_genre_id.cache_clear()
+        for tag in inputs["tags"]:
+            server_utils.classify_genre(tag)
+
+    def classify_warm():
+        for tag in inputs["tags"]:
+            server_utils.classify_genre(tag)
+
+    developers = [37.5, 52.0, 61.25, 44.0, 58.75]
+    simplifier = SimplifyJSON()
+
+    # Session lookup as done on every request: hash the cookie's ID, then load from the store
+    # (the file and Postgres stores are I/O bound, so they aren't compared against a CPU reference)
+    session_data = {"access_token": "x" * 200, "refresh_token": "y" * 130,
+                    "expires_at": time.time() + 3600, "spotify_id": "benchuser000000"}
+    memory_sessions = session_store.MemorySessionStore()
+    memory_sessions.save(session_store.storage_key("bench-session"), session_data, 3600)
+
+    # The whole recently-played route body from the raw response: build the response and the rows
+    # ingestion writes, parsing once per consumer (before) or once into shared records (after)
+    def route_per_consumer(body):
+        simplifier.simplify_listening_history(body)
+        legacy_history_rows("benchuser000000", body.decode())
+
+    def route_parse_once(body):
+        listens = parse_recently_played(body)
+        simplifier.simplify_listens(listens)
+        server_utils.build_history_rows("benchuser000000", listens)
+
+    return {
+        "classify_genre[3k tags, cold]": classify_cold,
+        "classify_genre[3k tags, warm]": classify_warm,
+        "bucketize_genre_lists[50]": lambda: server_utils.bucketize_genre_lists(inputs["genre_lists_50"]),
+        "bucketize_genre_lists[10k]": lambda: server_utils.bucketize_genre_lists(inputs["genre_lists_10k"]),
+        "calculate_diversity_score[50]": lambda: server_utils.calculate_diversity_score(inputs["bucketed_50"]),
+        "calculate_diversity_score[10k]": lambda: server_utils.calculate_diversity_score(inputs["bucketed_10k"]),
+        "calculate_taste_score[5 developers]": lambda: server_utils.calculate_taste_score(48.5, developers),
+        "clean_db_listening_history[50]": lambda: server_utils.clean_db_listening_history(inputs["db_rows_50"]),
+        "clean_db_listening_history[10k]": lambda: server_utils.clean_db_listening_history(inputs["db_rows_10k"]),
+        "simplify_listening_history[50]": lambda: simplifier.simplify_listening_history(inputs["history_50"]),
+        "simplify_listening_history[10k]": lambda: simplifier.simplify_listening_history(inputs["history_10k"]),
+        "parse_recently_played[50]": lambda: parse_recently_played(inputs["history_50"]),
+        "parse_recently_played[10k]": lambda: parse_recently_played(inputs["history_10k"]),
+        "recently_played_route[50, 2 parses]": lambda: route_per_consumer(inputs["body_50"]),
+        "recently_played_route[50, 1 parse]": lambda: route_parse_once(inputs["body_50"]),
+        "recently_played_route[10k, 2 parses]": lambda: route_per_consumer(inputs["body_10k"]),
+        "recently_played_route[10k, 1 parse]": lambda: route_parse_once(inputs["body_10k"]),
+        "session_load[memory]": lambda: memory_sessions.load(session_store.storage_key("bench-session")),
+    }
+
+
+def calibrate(func):
+    """Loops per round so that one round lasts at least MIN_ROUND_SECONDS"""
+    start = time.perf_counter()
+    func()
+    single = time.perf_counter() - start
+    return max(1, int(MIN_ROUND_SECONDS / single)) if single > 0 else 1000
+
+
+def time_round(func, loops):
+    """Seconds per call over one round of loops calls"""
+    start = time.perf_counter()
+    for _ in range(loops):
+        func()
+    return (time.perf_counter() - start) / loops
+
+
+def measure(func, rounds):
+    """
+    Time func and the reference workload in alternating rounds with the garbage collector off.
+    Returns (median seconds, fastest seconds, fastest / fastest reference round).
+    """
+    loops, reference_loops = calibrate(func), calibrate(reference_workload)
+    timings, reference_timings = [], []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            reference_timings.append(time_round(reference_workload, reference_loops))
+            timings.append(time_round(func, loops))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return statistics.median(timings), min(timings), min(timings) / min(reference_timings)
+
+
+def reference_workload():
+    """Fixed pure-Python work (dict, string and list operations) that timings are expressed relative to"""
+    counts = {}
+    for i in range(2000):
+        key = f"genre-{i % 97}"
+        counts[key] = counts.get(key, 0) + 1
+    return sorted(counts.items(), key=lambda item: item[1])
+
+
+def machine():
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "system": platform.system()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for scoring and classification hot paths")
+    parser.add_argument("--rounds", type=int, default=9, help="timed rounds per case (default 9)")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown over the baseline before failing (default 0.25 = 25%%)")
+    parser.add_argument("--small-tolerance", type=float, default=0.5,
+                        help="allowed slowdown for cases under 1 ms (default 0.5 = 50%%)")
+    parser.add_argument("--confirm", type=int, default=2,
+                        help="re-measure a slow case this many times; it fails only if every run is slow (default 2)")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this text")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file (default bench/micro_baselines.json)")
+    parser.add_argument("--update", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args()
+
+    cases = build_cases(build_inputs())
+    if args.filter:
+        cases = {name: func for name, func in cases.items() if args.filter in name}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        baseline = stored.get("cases", {})
+        if stored.get("machine") != machine():
+            print(f"Note: baselines were recorded on {stored.get('machine')}; comparisons are approximate")
+
+    results = {}
+    regressions = []
+    print(f"{'case':40} {'median':>12} {'relative':>10} {'baseline':>10} {'change':>8}")
+    for name, func in cases.items():
+        median, best, relative = measure(func, args.rounds)
+
+        expected = baseline.get(name, {}).get("relative")
+        tolerance = args.tolerance
+        if baseline.get(name, {}).get("min_seconds", 1) < SMALL_CASE_SECONDS:
+            tolerance = max(tolerance, args.small_tolerance)
+
+        # A regression has to reproduce: keep the fastest of a few re-measurements
+        attempts = 0
+        while expected and relative / expected - 1 > tolerance and attempts < args.confirm:
+            attempts += 1
+            retry = measure(func, args.rounds)
+            if retry[2] < relative:
+                median, best, relative = retry
+        results[name] = {"median_seconds": median, "min_seconds": best, "relative": relative}
+
+        change = ""
+        if expected:
+            ratio = relative / expected - 1
+            change = f"{ratio:+.0%}"
+            if ratio > tolerance:
+                regressions.append(name)
+                change += " !"
+        expected_text = f"{expected:.3f}" if expected else "-"
+        print(f"{name:40} {median * 1e6:>10.1f}us {relative:>10.3f} {expected_text:>10} {change:>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"machine": machine(), "cases": results}, f, indent=2)
+
+    if args.update:
+        # Keep baselines for cases that weren't run this time
+        merged = {**baseline, **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"machine": machine(), "cases": merged}, f, indent=2, sort_keys=True)
+        print(f"\nStored {len(results)} baselines in {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond tolerance: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+# Prologue
+# Name: mock_services.py
+# Description: Local stand-ins for the Spotify accounts service, the Spotify Web API, and the
+#              MusicBrainz API, serving the synthetic catalogue with configurable latency.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: None.
+#   - Post: Authorization codes are Spotify user IDs; tokens map back to the user they were issued for.
+# Errors: Unknown paths return 404, unknown tokens 401 (like the real APIs).
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench.synthetic import Catalogue
+
+# Token prefixes; the rest of the token is the Spotify user ID it was issued for
+ACCESS_PREFIX = "benchaccess-"
+REFRESH_PREFIX = "benchrefresh-"
+
+
+class MockServices(ThreadingHTTPServer):
+    daemon_threads = True
+    # Accept backlog; the default of 5 drops connections when an async server has hundreds in flight
+    request_queue_size = 1024
+
+    def __init__(self, address, catalogue, spotify_latency_ms=0.0, musicbrainz_latency_ms=0.0, jitter=0.2):
+        '''Serve the catalogue at address. Latencies are per request, +/- jitter (fraction of the latency).'''
+        super().__init__(address, MockHandler)
+        self.catalogue = catalogue
+        self.spotify_latency_ms = spotify_latency_ms
+        self.musicbrainz_latency_ms = musicbrainz_latency_ms
+        self.jitter = jitter
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self, latency_ms):
+        if latency_ms > 0:
+            time.sleep(latency_ms * random.uniform(1 - self.jitter, 1 + self.jitter) / 1000)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def bearer_user(self):
+        """Catalogue index of the user whose access token was sent, or None"""
+        auth = self.headers.get("Authorization", "")
+        token = auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+        if not token.startswith(ACCESS_PREFIX):
+            return None
+        try:
+            return self.server.catalogue.user_index(token[len(ACCESS_PREFIX):])
+        except ValueError:
+            return None
+
+    # --- SPOTIFY ACCOUNTS ---
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"))
+        self.server.delay(self.server.spotify_latency_ms)
+
+        if url.path != "/api/token":
+            return self.send_json({"error": "not_found"}, 404)
+
+        grant = form.get("grant_type", [""])[0]
+        if grant == "authorization_code":
+            spotify_id = form.get("code", [""])[0]
+        elif grant == "refresh_token":
+            spotify_id = form.get("refresh_token", [""])[0][len(REFRESH_PREFIX):]
+        else:
+            return self.send_json({"error": "unsupported_grant_type"}, 400)
+
+        self.send_json({
+            "access_token": ACCESS_PREFIX + spotify_id,
+            "token_type": "Bearer",
+            "scope": "user-read-recently-played user-read-private user-read-email",
+            "expires_in": 3600,
+            "refresh_token": REFRESH_PREFIX + spotify_id,
+        })
+
+    # --- SPOTIFY WEB API / MUSICBRAINZ ---
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        catalogue = self.server.catalogue
+
+        if url.path.startswith("/ws/2/"):
+            self.server.delay(self.server.musicbrainz_latency_ms)
+            return self.musicbrainz(url.path[len("/ws/2"):], query)
+
+        self.server.delay(self.server.spotify_latency_ms)
+        user = self.bearer_user()
+        if user is None:
+            return self.send_json({"error": {"status": 401, "message": "Invalid access token"}}, 401)
+
+        if url.path == "/v1/me":
+            return self.send_json(catalogue.user(user))
+        if url.path == "/v1/me/player/recently-played":
+            limit = min(int(query.get("limit", ["20"])[0]), 50)
+            after = int(query["after"][0]) if "after" in query else None
+            return self.send_json(catalogue.recently_played(user, limit, after))
+        if url.path.startswith("/v1/artists/"):
+            try:
+                return self.send_json(catalogue.artist(catalogue.artist_index(url.path[len("/v1/artists/"):])))
+            except ValueError:
+                pass
+        self.send_json({"error": {"status": 404, "message": "Not found"}}, 404)
+
+    def musicbrainz(self, path, query):
+        catalogue = self.server.catalogue
+
+        def artist_index(value):
+            digits = "".join(ch for ch in value if ch.isdigit())
+            return int(digits) % catalogue.artist_count if digits else 0
+
+        if path == "/artist/":
+            # Search: answer artistaccent:spotify:<id> and artist:<name> queries with one match
+            i = artist_index(query.get("query", [""])[0])
+            tags = [{"name": tag, "count": 5} for tag in catalogue.musicbrainz_tags(i)]
+            return self.send_json({"artists": [{"id": f"mbid-{i}", "score": 100, "tags": tags}]})
+        if path.startswith("/artist/mbid-"):
+            i = artist_index(path)
+            return self.send_json({"tags": [{"name": tag, "count": 5} for tag in catalogue.musicbrainz_tags(i)]})
+        self.send_json({"error": "Not Found"}, 404)
+
+
+def start_mock_services(catalogue, host="127.0.0.1", port=0, spotify_latency_ms=0.0,
+                        musicbrainz_latency_ms=0.0):
+    """Start the stand-in services on a background thread and return the server (port 0 = any free port)"""
+    server = MockServices((host, port), catalogue, spotify_latency_ms, musicbrainz_latency_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the stand-in Spotify / MusicBrainz services")
+    parser.add_argument("--port", type=int, default=8581)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--listens", type=int, default=10000)
+    parser.add_argument("--spotify-latency-ms", type=float, default=80.0)
+    parser.add_argument("--musicbrainz-latency-ms", type=float, default=250.0)
+    args = parser.parse_args()
+
+    server = MockServices(("127.0.0.1", args.port), Catalogue(args.users, args.listens),
+                          args.spotify_latency_ms, args.musicbrainz_latency_ms)
+    print(f"Serving Spotify at {server.base_url}/v1 (accounts at {server.base_url}) "
+          f"and MusicBrainz at {server.base_url}/ws/2")
+    server.serve_forever()
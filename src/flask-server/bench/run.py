@@ -0,0 +1,239 @@
+# Prologue
+# Name: run.py
+# Description: Endpoint benchmark. Starts the stand-in Spotify / MusicBrainz services and the Flask
+#              app against a local Postgres database, logs virtual users in through /callback, drives
+#              every route concurrently, and reports p50/p95/p99 latency and requests per second.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: DB_HOST points at a database seeded by bench/seed.py with at least --users users.
+#   - Post: Results are printed (and written as JSON with --json); nothing is left running.
+# Errors: Exits non-zero if the app cannot log any virtual user in.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.mock_services import start_mock_services  # noqa: E402
+from bench.synthetic import Catalogue  # noqa: E402
+
+# Every route in server.py, as (name, path template). {user_id} / {spotify_id} are filled in
+# per virtual user. Redirecting routes are measured without following the redirect.
+ROUTES = [
+    ("/", "/"),
+    ("/login", "/login"),
+    ("/get-user-info", "/get-user-info"),
+    ("/get-user-info-by-id/<id>", "/get-user-info-by-id/{user_id}"),
+    ("/get-leaderboard-data", "/get-leaderboard-data"),
+    ("/get-user-diversity-score", "/get-user-diversity-score"),
+    ("/get-user-diversity-score-by-id/<id>", "/get-user-diversity-score-by-id/{user_id}"),
+    ("/get-user-taste-score", "/get-user-taste-score"),
+    ("/get-user-taste-score-by-id/<id>", "/get-user-taste-score-by-id/{user_id}"),
+    ("/get-user-listening-history", "/get-user-listening-history"),
+    ("/get-user-listening-history-by-id/<id>", "/get-user-listening-history-by-id/{user_id}"),
+    ("/fetch-user-listening-history-by-id/<id>", "/fetch-user-listening-history-by-id/{user_id}"),
+    ("/is-user-history-updating", "/is-user-history-updating?spotify_id={spotify_id}"),
+    ("/get-similar-listeners-by-id/<id>", "/get-similar-listeners-by-id/{user_id}"),
+    ("/get-song-of-the-day", "/get-song-of-the-day"),
+    ("/dashboard/<id>", "/dashboard/{user_id}"),
+    ("/refresh-user-token", "/refresh-user-token"),
+    ("/metrics", "/metrics"),
+]
+
+# Login is measured too, since every session starts with it
+CALLBACK_ROUTE = "/callback"
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Results:
+    def __init__(self):
+        '''Latencies (seconds) and error counts per route name'''
+        self.latencies = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, route, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, elapsed):
+        rows = []
+        for route, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            rows.append({
+                "route": route,
+                "requests": len(latencies),
+                "errors": self.errors.get(route, 0),
+                "rps": round(len(latencies) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2),
+            })
+        total = sum(row["requests"] for row in rows)
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "requests": total,
+            "errors": sum(row["errors"] for row in rows),
+            "rps": round(total / elapsed, 2),
+            "routes": sorted(rows, key=lambda row: row["p95_ms"], reverse=True),
+        }
+
+
+class VirtualUser:
+    def __init__(self, base_url, spotify_id, results):
+        '''One logged-in browser session'''
+        self.base_url = base_url
+        self.spotify_id = spotify_id
+        self.results = results
+        self.http = requests.Session()
+        self.user_id = None
+
+    def get(self, route, path):
+        start = time.perf_counter()
+        try:
+            response = self.http.get(self.base_url + path, allow_redirects=False, timeout=60)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.results.record(route, time.perf_counter() - start, ok)
+        return response
+
+    def login(self):
+        '''OAuth callback (the stand-in accounts service accepts the Spotify ID as the code), then profile'''
+        self.get(CALLBACK_ROUTE, f"/callback?code={self.spotify_id}")
+        response = self.get("/get-user-info", "/get-user-info")
+        if response is None or response.status_code != 200:
+            return False
+        self.user_id = response.json()["user_info"]["user_id"]
+        return self.user_id is not None
+
+    def run_routes(self, routes):
+        for route, template in routes:
+            self.get(route, template.format(user_id=self.user_id, spotify_id=self.spotify_id))
+
+
+def serve_app(port):
+    """Start the Flask app in-process on a threaded WSGI server"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    httpd = make_server("127.0.0.1", port, server.create_app(), threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def print_summary(summary):
+    print(f"\n{summary['requests']} requests in {summary['elapsed_seconds']}s "
+          f"({summary['rps']} req/s, {summary['errors']} errors)\n")
+    print(f"{'route':44} {'reqs':>6} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in summary["routes"]:
+        print(f"{row['route']:44} {row['requests']:>6} {row['errors']:>5} {row['rps']:>8} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every Scorify route against local stand-ins")
+    parser.add_argument("--users", type=int, default=200, help="seeded users to log in as (default 200)")
+    parser.add_argument("--listens", type=int, default=10000, help="plays the database was seeded with")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent virtual users (default 16)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to drive load (default 30)")
+    parser.add_argument("--routes", default="", help="comma-separated route names to drive (default: all)")
+    parser.add_argument("--spotify-latency-ms", type=float, default=80.0)
+    parser.add_argument("--musicbrainz-latency-ms", type=float, default=250.0)
+    parser.add_argument("--target", default=None,
+                        help="benchmark an already running server (e.g. under gunicorn) instead of "
+                             "starting one; it must use the stand-ins printed at startup")
+    parser.add_argument("--port", type=int, default=5581, help="port for the in-process app")
+    parser.add_argument("--mock-port", type=int, default=0, help="port for the stand-ins (default: any)")
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args()
+
+    if not os.getenv("DB_HOST") and args.target is None:
+        sys.exit("DB_HOST is not set; seed a local database with bench/seed.py first")
+
+    catalogue = Catalogue(users=args.users, listens=args.listens)
+    mocks = start_mock_services(catalogue, port=args.mock_port, spotify_latency_ms=args.spotify_latency_ms,
+                                musicbrainz_latency_ms=args.musicbrainz_latency_ms)
+    print(f"Stand-in Spotify / MusicBrainz services on {mocks.base_url}")
+
+    if args.target is None:
+        # Must be set before server.py / mb_api.py are imported (they read these at import time)
+        os.environ.update({
+            "SPOTIFY_ACCOUNTS_URL": mocks.base_url,
+            "SPOTIFY_API_BASE_URL": f"{mocks.base_url}/v1",
+            "MUSICBRAINZ_BASE_URL": f"{mocks.base_url}/ws/2",
+            "MUSICBRAINZ_RATE_LIMIT_SECONDS": "0",
+            "SPOTIFY_CLIENT_ID": "bench",
+            "SPOTIFY_CLIENT_SECRET": "bench",
+            "APP_SECRET_KEY": os.getenv("APP_SECRET_KEY", "bench-secret"),
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+            # Measure the routes alone, without background syncs competing for the database
+            "HISTORY_POLLER": "0",
+        })
+        httpd = serve_app(args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+    else:
+        httpd = None
+        base_url = args.target.rstrip("/")
+
+    routes = ROUTES
+    if args.routes:
+        wanted = {name.strip() for name in args.routes.split(",")}
+        routes = [route for route in ROUTES if route[0] in wanted]
+
+    results = Results()
+    started = time.perf_counter()
+    vusers = [VirtualUser(base_url, catalogue.user_id(i % args.users), results) for i in range(args.concurrency)]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        logged_in = [vuser for vuser, ok in zip(vusers, pool.map(VirtualUser.login, vusers)) if ok]
+    if not logged_in:
+        sys.exit("No virtual user could log in; is the database seeded and reachable?")
+
+    # Each virtual user walks every route in order until the deadline
+    deadline = time.perf_counter() + args.duration
+
+    def drive(vuser):
+        while time.perf_counter() < deadline:
+            vuser.run_routes(routes)
+
+    with ThreadPoolExecutor(max_workers=len(logged_in)) as pool:
+        list(pool.map(drive, logged_in))
+    summary = results.summary(time.perf_counter() - started)
+    summary["config"] = {key: value for key, value in vars(args).items() if key != "json"}
+
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    if httpd is not None:
+        httpd.shutdown()
+    mocks.shutdown()
+
+
+if __name__ == "__main__":
+    main()
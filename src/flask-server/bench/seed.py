@@ -0,0 +1,195 @@
+# Prologue
+# Name: seed.py
+# Description: Create the Scorify schema in a local Postgres database and fill it with a synthetic
+#              catalogue (users, artists, tracks, listening history, metrics) for benchmarking.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: DB_HOST (and DB_PORT / DB_NAME / DB_USER / DB_PASSWORD) point at a disposable database.
+#   - Post: The database holds --users users and --listens plays; --reset drops existing data first.
+# Errors: Refuses to run without DB_HOST so it can never touch the hosted database.
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.synthetic import Catalogue  # noqa: E402
+
+# Tables that exist before DBConnection adds its own (see dbconnection/postgresql_info.md)
+BASE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id SERIAL PRIMARY KEY,
+        spotify_id TEXT NOT NULL UNIQUE,
+        user_name TEXT,
+        profile_image_url TEXT,
+        access_token TEXT,
+        refresh_token TEXT,
+        diversity_score NUMERIC
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS artists (
+        artist_id SERIAL PRIMARY KEY,
+        spotify_artist_id TEXT NOT NULL UNIQUE,
+        name TEXT NOT NULL,
+        genres TEXT[] DEFAULT '{}'::TEXT[]
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tracks (
+        track_id SERIAL PRIMARY KEY,
+        spotify_track_id TEXT NOT NULL UNIQUE,
+        name TEXT NOT NULL,
+        spotify_artist_id TEXT REFERENCES artists(spotify_artist_id) ON DELETE CASCADE,
+        duration_ms INTEGER,
+        album_name TEXT,
+        release_date DATE,
+        song_img_url TEXT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS artist_tracks (
+        track_id TEXT NOT NULL REFERENCES tracks(spotify_track_id),
+        artist_id TEXT NOT NULL REFERENCES artists(spotify_artist_id),
+        PRIMARY KEY (track_id, artist_id)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_metrics (
+        user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+        spotify_id TEXT UNIQUE REFERENCES users(spotify_id) ON DELETE CASCADE,
+        diversity_score DOUBLE PRECISION CHECK (diversity_score >= 0 AND diversity_score <= 1),
+        taste_score DOUBLE PRECISION CHECK (taste_score >= 0 AND taste_score <= 1),
+        last_updated TIMESTAMP DEFAULT now()
+    );
+    """,
+]
+
+# Everything the seeder (and DBConnection) creates, dropped by --reset
+RESET_CMD = """
+    DROP MATERIALIZED VIEW IF EXISTS song_of_the_day_candidates;
+    DROP TABLE IF EXISTS song_of_the_day, user_similarity, listening_history_daily, listening_history,
+        user_metrics, artist_tracks, tracks, artists, users CASCADE;
+    DROP SEQUENCE IF EXISTS listening_history_id_seq;
+"""
+
+# Rows per INSERT batch
+BATCH_SIZE = 5000
+
+
+def connect_params():
+    """psycopg2 connection arguments for the benchmark database"""
+    return {
+        "host": os.environ["DB_HOST"],
+        "port": int(os.getenv("DB_PORT", "5432")),
+        "dbname": os.getenv("DB_NAME", "scorify_bench"),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", ""),
+    }
+
+
+def create_base_schema(reset=False):
+    """Create the tables DBConnection expects to already exist"""
+    conn = psycopg2.connect(**connect_params())
+    try:
+        with conn, conn.cursor() as cur:
+            if reset:
+                cur.execute(RESET_CMD)
+            for ddl in BASE_SCHEMA:
+                cur.execute(ddl)
+    finally:
+        conn.close()
+
+
+def batches(rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        yield rows[i:i + BATCH_SIZE]
+
+
+def seed(db, catalogue):
+    """Insert the catalogue through DBConnection, then compute every user's scores like the server does"""
+    from server_utils import bucketize_genre_lists, calculate_diversity_score, genre_distribution
+
+    artists = [catalogue.artist(i) for i in range(catalogue.artist_count)]
+    for chunk in batches([(a["id"], a["name"], a["genres"] or ["NO_GENRE_DATA"]) for a in artists]):
+        db.execute_vals(
+            "INSERT INTO artists (spotify_artist_id, name, genres) VALUES %s ON CONFLICT DO NOTHING;", chunk)
+
+    tracks = [catalogue.track(t) for t in range(catalogue.track_count)]
+    for chunk in batches([(t["id"], t["name"], t["artists"][0]["id"], t["duration_ms"], t["album"]["name"],
+                           t["album"]["release_date"], t["album"]["images"][0]["url"]) for t in tracks]):
+        db.execute_vals(
+            """INSERT INTO tracks (spotify_track_id, name, spotify_artist_id, duration_ms, album_name,
+                                   release_date, song_img_url)
+               VALUES %s ON CONFLICT DO NOTHING;""", chunk)
+    for chunk in batches([(t["id"], a["id"]) for t in tracks for a in t["artists"]]):
+        db.execute_vals("INSERT INTO artist_tracks (track_id, artist_id) VALUES %s ON CONFLICT DO NOTHING;", chunk)
+
+    users = [catalogue.user(i) for i in range(catalogue.user_count)]
+    for chunk in batches([(u["id"], u["display_name"], u["images"][0]["url"], 0.0) for u in users]):
+        db.execute_vals(
+            """INSERT INTO users (spotify_id, user_name, profile_image_url, diversity_score)
+               VALUES %s ON CONFLICT DO NOTHING;""", chunk)
+
+    # Plays end a day ago so the stand-in recently-played endpoint always has newer ones
+    per_user, extra = divmod(catalogue.listen_count, catalogue.user_count)
+    end = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(days=1)
+    for i, user in enumerate(users):
+        plays = catalogue.plays(i, per_user + (1 if i < extra else 0), end=end)
+        db.ensure_listening_history_partitions([played_at for _, played_at in plays])
+        for chunk in batches([(user["id"], catalogue.track_id(t), played_at, "NULL") for t, played_at in plays]):
+            db.execute_vals(
+                """INSERT INTO listening_history (spotify_id, track_id, played_at, context)
+                   VALUES %s ON CONFLICT DO NOTHING;""", chunk)
+
+    # Diversity scores and genre counts, computed exactly as /get-user-diversity-score does
+    for user in users:
+        genre_lists = [genres for (genres,) in db.get_user_genres(user["id"]) if genres]
+        bucketed = bucketize_genre_lists(genre_lists)
+        user_id = db.get_user_id_by_spotify_id(user["id"])
+        db.update_user_diversity_score(user_id, user["id"], calculate_diversity_score(bucketed),
+                                       genre_distribution(bucketed))
+
+    db.refresh_song_candidates(force=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a local Postgres database with synthetic Scorify data")
+    parser.add_argument("--users", type=int, default=200, help="number of users (default 200)")
+    parser.add_argument("--listens", type=int, default=10000, help="total plays, 1k-1M (default 10000)")
+    parser.add_argument("--seed", type=int, default=581, help="random seed (default 581)")
+    parser.add_argument("--reset", action="store_true", help="drop existing Scorify tables first")
+    args = parser.parse_args()
+
+    if not os.getenv("DB_HOST"):
+        sys.exit("DB_HOST is not set; refusing to seed anything but a local database")
+    os.environ.setdefault("DB_NAME", "scorify_bench")
+    os.environ.setdefault("DB_USER", "postgres")
+    os.environ.setdefault("DB_PASSWORD", "")
+
+    started = time.perf_counter()
+    create_base_schema(reset=args.reset)
+
+    from DBConnection import DBConnection
+    db = DBConnection()
+    if not db.connected:
+        sys.exit("Could not connect to the benchmark database")
+
+    catalogue = Catalogue(users=args.users, listens=args.listens, seed=args.seed)
+    seed(db, catalogue)
+    print(f"Seeded {catalogue.user_count} users, {catalogue.artist_count} artists, "
+          f"{catalogue.track_count} tracks and {catalogue.listen_count} plays "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
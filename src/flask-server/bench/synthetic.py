@@ -0,0 +1,141 @@
+# Prologue
+# Name: synthetic.py
+# Description: Deterministic synthetic catalogue (users, artists, tracks, plays) shared by the
+#              benchmark seeder and the stand-in Spotify / MusicBrainz servers.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: genres_dict.json is in the flask-server directory.
+#   - Post: The same scale and seed always produce the same IDs, names, and genres.
+# Errors: None.
+
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Share of artists that Spotify returns no genres for (these go through the MusicBrainz path)
+NO_GENRE_SHARE = 0.1
+
+
+def load_genre_tags():
+    """Every genre tag in genres_dict.json, so synthetic artists classify like real ones"""
+    with open(os.path.join(BASE_DIR, "genres_dict.json"), "r", encoding="utf-8") as f:
+        genres = json.load(f)
+    return sorted({tag for tags in genres["genres_map"].values() for tag in tags})
+
+
+class Catalogue:
+    def __init__(self, users=200, listens=10000, seed=581):
+        '''Size the catalogue from the number of plays: roughly 5 tracks per artist, 40 plays per track'''
+        self.seed = seed
+        self.user_count = users
+        self.listen_count = listens
+        self.artist_count = max(50, listens // 200)
+        self.track_count = self.artist_count * 5
+        self.genre_tags = load_genre_tags()
+
+    # --- IDS ---
+
+    def user_id(self, i):
+        return f"benchuser{i:06d}"
+
+    def artist_id(self, i):
+        return f"benchartist{i:06d}"
+
+    def track_id(self, i):
+        return f"benchtrack{i:07d}"
+
+    def user_index(self, spotify_id):
+        return int(spotify_id[len("benchuser"):])
+
+    def artist_index(self, spotify_artist_id):
+        return int(spotify_artist_id[len("benchartist"):])
+
+    # --- RECORDS ---
+
+    def user(self, i):
+        return {
+            "id": self.user_id(i),
+            "display_name": f"Bench User {i}",
+            "email": f"bench{i}@example.com",
+            "images": [{"url": f"https://example.com/users/{i}.jpg"}],
+        }
+
+    def artist_genres(self, i):
+        """Spotify genres for artist i (empty for about NO_GENRE_SHARE of artists)"""
+        rng = random.Random(self.seed * 1000003 + i)
+        if rng.random() < NO_GENRE_SHARE:
+            return []
+        return rng.sample(self.genre_tags, rng.randint(1, 4))
+
+    def musicbrainz_tags(self, i):
+        """MusicBrainz tags for artist i (always present, so MusicBrainz repairs succeed)"""
+        rng = random.Random(self.seed * 7919 + i)
+        return rng.sample(self.genre_tags, rng.randint(1, 3))
+
+    def artist(self, i):
+        return {"id": self.artist_id(i), "name": f"Bench Artist {i}", "genres": self.artist_genres(i)}
+
+    def track_artists(self, t):
+        """Artist indexes on track t: its main artist, sometimes with a featured artist"""
+        main = t // 5
+        if t % 7 == 0:
+            return [main, (main + 1 + t % 11) % self.artist_count]
+        return [main]
+
+    def track(self, t):
+        '''A track object shaped like the Spotify Web API's'''
+        artists = [{"id": self.artist_id(a), "name": f"Bench Artist {a}"} for a in self.track_artists(t)]
+        return {
+            "id": self.track_id(t),
+            "name": f"Bench Track {t}",
+            "duration_ms": 120000 + (t * 7919) % 180000,
+            "artists": artists,
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{self.track_id(t)}"},
+            "album": {
+                "name": f"Bench Album {t // 10}",
+                "release_date": f"{1970 + t % 55}-{1 + t % 12:02d}-{1 + t % 28:02d}",
+                "images": [{"url": f"https://example.com/albums/{t // 10}.jpg"}],
+            },
+        }
+
+    # --- PLAYS ---
+
+    def user_tracks(self, user):
+        """Each user favours a slice of the catalogue, so genre distributions differ between users"""
+        rng = random.Random(self.seed * 31 + user)
+        start = rng.randrange(self.track_count)
+        width = max(20, self.track_count // 10)
+        return rng, start, width
+
+    def plays(self, user, count, end=None, spacing_minutes=None):
+        """count (track index, played_at) plays for a user ending at end, newest first"""
+        end = end or datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        rng, start, width = self.user_tracks(user)
+        spacing_minutes = spacing_minutes or 3
+        return [
+            ((start + int(rng.triangular(0, width, 0))) % self.track_count,
+             end - timedelta(minutes=spacing_minutes * k))
+            for k in range(count)
+        ]
+
+    def recently_played(self, user, limit=50, after=None):
+        '''
+        A /me/player/recently-played response; the newest plays move forward with the clock.
+        after (Unix milliseconds) keeps only plays strictly newer than it, like the real cursor.
+        '''
+        items = []
+        for t, played_at in self.plays(user, limit):
+            if after is not None and played_at.timestamp() * 1000 <= after:
+                break
+            items.append({
+                "track": self.track(t),
+                "played_at": played_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "context": {"type": "playlist"} if t % 4 == 0 else None,
+            })
+        return {"items": items, "limit": limit}
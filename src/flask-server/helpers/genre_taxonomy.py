@@ -0,0 +1,137 @@
+# Prologue
+# Name: genre_taxonomy.py
+# Description: Compiled, memory-mappable genre taxonomy. Maps lowercase genre tags to the index of
+#              their root genre bucket without keeping the full genre JSON in every process.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: genres_dict.json must contain "genres" (root names) and "genres_map" (root -> tags).
+#   - Post: The compiled artifact is rebuilt whenever it is missing or older than the JSON.
+# Errors: Raises ValueError if an artifact is corrupt or from another format version.
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# File layout (all offsets relative to the start of the file):
+#   header   MAGIC, version, byte order, root count, key count, roots blob length
+#   roots    root genre names, UTF-8, newline separated
+#   (padding to a 4-byte boundary)
+#   offsets  key count + 1 native uint32 offsets into the keys blob
+#   root_ids key count uint8 root indexes (one per key)
+#   keys     lowercase genre tags, UTF-8, sorted bytewise, concatenated
+MAGIC = b"SCGT"
+VERSION = 1
+HEADER = struct.Struct("<4sHBxHII")
+
+
+def compile_taxonomy(json_path, artifact_path):
+    """Compile genres_dict.json into the binary artifact at artifact_path (written atomically)"""
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        genres = json.load(f)
+
+    roots = genres["genres"]
+    root_index = {root: i for i, root in enumerate(roots)}
+
+    # Tag -> root index. Later roots win for tags listed under several roots, and exact
+    # root names always win, same as the old dict-based lookup.
+    mapping = {}
+    for root, subs in genres["genres_map"].items():
+        for sub in subs:
+            mapping[sub.lower()] = root_index[root]
+    for root, i in root_index.items():
+        mapping[root.lower()] = i
+
+    keys = sorted(key.encode("utf-8") for key in mapping)
+    offsets = array("I", [0])
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    root_ids = array("B", [mapping[key.decode("utf-8")] for key in keys])
+    roots_blob = "\n".join(roots).encode("utf-8")
+
+    header = HEADER.pack(MAGIC, VERSION, 1 if sys.byteorder == "little" else 0,
+                         len(roots), len(keys), len(roots_blob))
+    padding = b"\0" * (-(len(header) + len(roots_blob)) % 4)
+
+    # Write to a temp file first so concurrently starting workers never see a partial artifact
+    tmp_path = f"{artifact_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(roots_blob)
+        f.write(padding)
+        f.write(offsets.tobytes())
+        f.write(root_ids.tobytes())
+        f.write(b"".join(keys))
+    os.replace(tmp_path, artifact_path)
+
+
+class GenreTaxonomy:
+    def __init__(self, artifact_path):
+        '''Memory-map a compiled taxonomy artifact (read-only, shared between processes by the OS)'''
+
+        with open(artifact_path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, little_endian, n_roots, n_keys, roots_len = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{artifact_path} is not a version {VERSION} genre taxonomy")
+        if little_endian != (sys.byteorder == "little"):
+            raise ValueError(f"{artifact_path} was compiled on a machine with a different byte order")
+
+        # Root names are few; keep them as interned Python strings
+        position = HEADER.size
+        self.roots = tuple(sys.intern(root) for root in
+                           self.mm[position:position + roots_len].decode("utf-8").split("\n"))
+        position += roots_len
+        position += -position % 4
+
+        # Zero-copy views into the mapped file
+        self.n_keys = n_keys
+        self.offsets = memoryview(self.mm)[position:position + 4 * (n_keys + 1)].cast("I")
+        position += 4 * (n_keys + 1)
+        self.root_ids = memoryview(self.mm)[position:position + n_keys]
+        position += n_keys
+        self.keys_start = position
+
+    def lookup(self, genre):
+        '''Root index for a lowercase, stripped genre tag, or None if it isn't in the taxonomy'''
+
+        target = genre.encode("utf-8")
+        mm, offsets, base = self.mm, self.offsets, self.keys_start
+
+        # Binary search over the sorted keys
+        lo, hi = 0, self.n_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = mm[base + offsets[mid]:base + offsets[mid + 1]]
+            if key < target:
+                lo = mid + 1
+            elif key > target:
+                hi = mid
+            else:
+                return self.root_ids[mid]
+        return None
+
+
+def load_taxonomy(json_path, artifact_path):
+    """Load the compiled taxonomy, (re)building it first if it is missing or older than the JSON"""
+
+    if (not os.path.exists(artifact_path)
+            or os.path.getmtime(artifact_path) < os.path.getmtime(json_path)):
+        compile_taxonomy(json_path, artifact_path)
+    return GenreTaxonomy(artifact_path)
+
+
+# Offline build: python -m helpers.genre_taxonomy [genres_dict.json] [genres_taxonomy.bin]
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    json_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, "genres_dict.json")
+    artifact_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(base_dir, "genres_taxonomy.bin")
+    compile_taxonomy(json_path, artifact_path)
+    print(f"Compiled {json_path} -> {artifact_path} ({os.path.getsize(artifact_path)} bytes)")
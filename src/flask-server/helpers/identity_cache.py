@@ -0,0 +1,35 @@
+# Prologue
+# Name: identity_cache.py
+# Description: Bounded, thread-safe two-way map between users' Spotify IDs and their internal user IDs
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: A user's (spotify_id, user_id) pair never changes once the user exists.
+#   - Post: Lookups of remembered pairs never reach the database; the least recently used are dropped.
+# Errors: None.
+
+from helpers.ttl_cache import TTLCache
+
+
+class IdentityCache:
+    def __init__(self, maxsize=10000):
+        '''Remember up to maxsize users in each direction; entries never expire (the mapping can't change)'''
+        self.user_ids = TTLCache(ttl=None, maxsize=maxsize)     # spotify_id -> user_id
+        self.spotify_ids = TTLCache(ttl=None, maxsize=maxsize)  # user_id -> spotify_id
+
+    def remember(self, spotify_id, user_id):
+        '''Record that spotify_id and user_id are the same user'''
+        if spotify_id is None or user_id is None:
+            return
+        self.user_ids.set(spotify_id, user_id)
+        self.spotify_ids.set(user_id, spotify_id)
+
+    def user_id(self, spotify_id):
+        '''The user ID for spotify_id, or None if it isn't cached'''
+        return self.user_ids.get(spotify_id)
+
+    def spotify_id(self, user_id):
+        '''The Spotify ID for user_id, or None if it isn't cached'''
+        return self.spotify_ids.get(user_id)
@@ -0,0 +1,92 @@
+# Prologue
+# Name: listening_records.py
+# Description: Compact track / listen records parsed once from a Spotify recently-played response and
+#              shared by the HTTP response (SimplifyJSON) and database ingestion (update_user_history).
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: Input is a recently-played response as bytes, str, or an already parsed dict.
+#   - Post: Each distinct track is parsed into a single Track shared by all of its listens.
+# Errors: Items without a track ID are skipped; missing optional fields become None.
+
+import json
+
+# Use orjson when it is installed (several times faster on large payloads); fall back to the stdlib
+try:
+    import orjson
+
+    def loads(data):
+        '''Parse JSON from bytes or str'''
+        return orjson.loads(data)
+except ImportError:
+    def loads(data):
+        '''Parse JSON from bytes or str'''
+        return json.loads(data)
+
+
+class Track:
+    '''One Spotify track, with only the fields the server uses'''
+    __slots__ = ("id", "name", "artists", "album_name", "release_date", "image_url", "duration_ms",
+                 "spotify_url")
+
+    def __init__(self, id, name, artists, album_name, release_date, image_url, duration_ms, spotify_url):
+        self.id = id
+        self.name = name
+        self.artists = artists            # tuple of (spotify_artist_id, name), main artist first
+        self.album_name = album_name
+        self.release_date = release_date  # raw Spotify string ("2024", "2024-05" or "2024-05-17")
+        self.image_url = image_url
+        self.duration_ms = duration_ms
+        self.spotify_url = spotify_url
+
+    @classmethod
+    def from_spotify(cls, track):
+        '''Build a Track from a Spotify track object'''
+        album = track.get("album") or {}
+        images = album.get("images") or []
+        return cls(
+            track["id"],
+            track.get("name", ""),
+            tuple([(artist["id"], artist["name"]) for artist in track.get("artists", ())]),
+            album.get("name"),
+            album.get("release_date"),
+            images[0]["url"] if images else None,
+            track.get("duration_ms"),
+            (track.get("external_urls") or {}).get("spotify", ""),
+        )
+
+
+class Listen:
+    '''One play of a track'''
+    __slots__ = ("track", "played_at", "context")
+
+    def __init__(self, track, played_at, context):
+        self.track = track
+        self.played_at = played_at  # ISO 8601 string as returned by Spotify
+        self.context = context      # context type ("playlist", "album", ...) or None
+
+
+def parse_recently_played(data):
+    """Parse a recently-played response (bytes, str or dict) into Listens, newest first"""
+    if isinstance(data, (bytes, bytearray, memoryview, str)):
+        data = loads(data)
+
+    tracks = {}
+    listens = []
+    append = listens.append
+    for item in data.get("items", []):
+        raw_track = item.get("track") or {}
+        track_id = raw_track.get("id")
+        if not track_id:
+            continue
+
+        # Repeat plays of a track share one Track object
+        track = tracks.get(track_id)
+        if track is None:
+            track = tracks[track_id] = Track.from_spotify(raw_track)
+
+        context = item.get("context")
+        append(Listen(track, item.get("played_at", ""), context["type"] if context else None))
+    return listens
@@ -0,0 +1,45 @@
+# Prologue
+# Name: rate_limiter.py
+# Description: Thread-safe token bucket for pacing calls to an external API across worker threads
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: rate > 0.
+#   - Post: Over any window, callers are admitted at no more than rate per second plus the burst.
+# Errors: None.
+
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        '''Admit rate calls per second on average, and up to burst (default: one second's worth) at once'''
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        '''
+        Block until tokens calls may be made. Tokens are reserved up front (the bucket can go
+        negative), so a large request waits its turn instead of starving behind small ones.
+        '''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            wait = max(-self.tokens / self.rate, self.paused_until - now, 0.0)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        '''Hold every caller back for seconds (e.g. a Retry-After from a 429 response)'''
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
@@ -3,62 +3,90 @@
 # Description: Simplify the JSON data from the Spotify API
 # Programmer: Nifemi Lawal
 # Creation date: 11/01/25
-# Last revision date: 11/01/25
-# Revisions: 1.0
+# Last revision date: 10/19/26
+# Revisions: 3.1
 # Pre/post conditions
-#   - Pre: None. 
+#   - Pre: None.
 #   - Post: None.
-# Errors: All known errors should be handled gracefully. 
+# Errors: All known errors should be handled gracefully.
+
+from helpers.listening_records import loads
 
-import json 
 
 class SimplifyJSON:
-    def __init__(self):
-        '''Initialize the SimplifyJSON class'''
-        self.simplified = [] # Initialize simplified list
-    
-    def simplify_listening_history(self, json_data): 
-        '''Extract and return relevant information from user listening history JSON data'''
-        
-        # Reset simplified list for new call
-        self.simplified = []
-        
-        # Obtain song items from Spotify API response
-        song_items = json_data.get("items", [])
+    def iter_listens(self, listens):
+        '''Yield simplified tracks for parsed Listens, skipping repeat plays of a track'''
 
-        # Extract relevant elements
-        for item in song_items:
-            track = item.get("track", {})
+        # Track IDs already yielded (a set keeps this linear in the number of listens)
+        seen = set()
 
-            # Check if the track is already in the simplified list
-            # - If it is, skip it
-            if track.get("id", "") in [track.get("id", "") for track in self.simplified]:
+        for listen in listens:
+            track = listen.track
+
+            # If the track was already yielded, skip it
+            if track.id in seen:
                 continue
+            seen.add(track.id)
+
+            yield {
+                "id": track.id,  # Add ID for React key prop
+                "track_name": track.name,
+                "artists": ", ".join([name for _, name in track.artists]),
+                "artist_ids": [artist_id for artist_id, _ in track.artists],
+                "played_at": listen.played_at,
+                "album_image": track.image_url,
+                "spotify_url": track.spotify_url
+            }
+
+    def simplify_listens(self, listens):
+        '''Simplified tracks for parsed Listens, as a list Flask can serialize'''
+        return list(self.iter_listens(listens))
+
+    def iter_listening_history(self, json_data):
+        '''Yield simplified tracks straight from a recently-played response, skipping repeat plays of a track'''
+
+        # Accept the raw response body so callers don't need to build response.json() first
+        if isinstance(json_data, (bytes, bytearray, memoryview, str)):
+            json_data = loads(json_data)
 
-            # Extract artists
-            artists = [
-                artist["name"] for artist in track.get("artists", [])
-            ]
+        # Track IDs already yielded (a set keeps this linear in the number of items)
+        seen = set()
 
-            # Extract artist ids
-            artist_ids = [
-                artist["id"] for artist in track.get("artists", [])      
-            ]
+        # Extract relevant elements
+        for item in json_data.get("items", []):
+            track = item.get("track") or {}
+            track_id = track.get("id")
+
+            # Items without a track ID are skipped, as in parse_recently_played
+            if not track_id or track_id in seen:
+                continue
+            seen.add(track_id)
+
+            # Extract artists and their IDs
+            artists = track.get("artists", [])
 
             # Extract album image
-            album_images = track.get("album", {}).get("images", [])
+            album_images = (track.get("album") or {}).get("images") or []
             album_img = album_images[0]["url"] if album_images else None
 
-            # Append simplified dict
-            self.simplified.append({ 
-                "id": track.get("id", ""),  # Add ID for React key prop
+            yield {
+                "id": track_id,  # Add ID for React key prop
                 "track_name": track.get("name", ""),
-                "artists": ", ".join(artists),
-                "artist_ids": artist_ids,
+                "artists": ", ".join([artist["name"] for artist in artists]),
+                "artist_ids": [artist["id"] for artist in artists],
                 "played_at": item.get("played_at", ""),
-                "album_image": album_img, 
-                "spotify_url": track.get("external_urls", {}).get("spotify", "")
-            })
-        
-        # Return Python list (not JSON string) so Flask can serialize it properly
-        return self.simplified
\ No newline at end of file
+                "album_image": album_img,
+                "spotify_url": (track.get("external_urls") or {}).get("spotify", "")
+            }
+
+    def simplify_listening_history(self, json_data):
+        '''
+        Extract and return relevant information from user listening history JSON data (dict, str or bytes).
+        Builds no Track/Listen records; use parse_recently_played + simplify_listens when the plays are
+        also being stored.
+        '''
+        return list(self.iter_listening_history(json_data))
+
+
+# Shared instance; SimplifyJSON keeps no per-call state, so one is safe to use from every request thread
+simplifier = SimplifyJSON()
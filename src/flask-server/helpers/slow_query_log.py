@@ -0,0 +1,191 @@
+# Prologue
+# Name: slow_query_log.py
+# Description: Collects statements that exceed a latency threshold, with redacted parameters and
+#              sampled EXPLAIN (ANALYZE, BUFFERS) plans, into a JSON report grouped by query shape.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: Callers pass a fingerprint and normalized SQL (see metrics.fingerprint_sql).
+#   - Post: Parameter values never reach the report; only their types and sizes do.
+# Errors: Report write failures are logged and otherwise ignored.
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+log = logging.getLogger("scorify.slow_queries")
+
+# Only plain reads are re-run under EXPLAIN ANALYZE; anything that could write or take locks is skipped
+READ_ONLY_STATEMENT = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+SIDE_EFFECTS = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|NEXTVAL|SETVAL|PG_ADVISORY\w*|FOR UPDATE)\b",
+                          re.IGNORECASE)
+
+
+def redact_value(value):
+    """Describe a parameter without revealing it (type, and length for sized values)"""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return f"<{type(value).__name__} len={len(value)}>"
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__} len={len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def redact_params(params):
+    """Redact a psycopg2 parameter sequence or mapping"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: redact_value(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [redact_value(value) for value in params]
+    return redact_value(params)
+
+
+def can_explain(query):
+    """True if re-running the statement under EXPLAIN ANALYZE cannot change data"""
+    return bool(READ_ONLY_STATEMENT.match(query)) and not SIDE_EFFECTS.search(query)
+
+
+def seq_scans(plan):
+    """(relation, actual rows) for every sequential scan in an EXPLAIN (FORMAT JSON) plan tree"""
+    found = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if node.get("Node Type") == "Seq Scan":
+            found.append((node.get("Relation Name"), node.get("Actual Rows")))
+        stack.extend(node.get("Plans", []))
+    return found
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms, report_path=None, explain_interval=600, max_samples=3,
+                 write_interval=30):
+        '''Collect statements slower than threshold_ms (<= 0 disables the log)'''
+        self.threshold_ms = threshold_ms
+        self.report_path = report_path
+        self.explain_interval = explain_interval  # seconds between plans for the same fingerprint
+        self.max_samples = max_samples            # plans / parameter samples kept per fingerprint
+        self.write_interval = write_interval      # seconds between report rewrites
+        self.entries = {}                         # fingerprint -> aggregate dict
+        self.last_written = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def is_slow(self, seconds):
+        return self.threshold_ms > 0 and seconds * 1000 >= self.threshold_ms
+
+    def record(self, fingerprint, query, seconds, params, caller=None, endpoint=None):
+        '''Add one slow execution. Returns True if the caller should capture an EXPLAIN plan for it.'''
+        elapsed_ms = seconds * 1000
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(fingerprint)
+            if entry is None:
+                entry = self.entries[fingerprint] = {
+                    "fingerprint": fingerprint, "query": query, "count": 0, "total_ms": 0.0,
+                    "max_ms": 0.0, "callers": {}, "endpoints": {}, "samples": [], "plans": [],
+                    "explained_at": 0.0,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            if caller:
+                entry["callers"][caller] = entry["callers"].get(caller, 0) + 1
+            if endpoint:
+                entry["endpoints"][endpoint] = entry["endpoints"].get(endpoint, 0) + 1
+            entry["samples"] = (entry["samples"] + [{"ms": round(elapsed_ms, 2),
+                                                     "params": redact_params(params)}])[-self.max_samples:]
+
+            explain = can_explain(query) and now - entry["explained_at"] >= self.explain_interval
+            if explain:
+                entry["explained_at"] = now
+
+        self.maybe_write()
+        return explain
+
+    def add_plan(self, fingerprint, plan):
+        '''Attach an EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) result to a fingerprint'''
+        with self.lock:
+            entry = self.entries.get(fingerprint)
+            if entry is None:
+                return
+            root = plan[0]["Plan"] if isinstance(plan, list) else plan.get("Plan", plan)
+            sample = {
+                "captured_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "seq_scans": seq_scans(root),
+                "plan": plan,
+            }
+            entry["plans"] = (entry["plans"] + [sample])[-self.max_samples:]
+        self.maybe_write(force=True)
+
+    def report(self):
+        '''Aggregates ordered by total time spent, worst first'''
+        with self.lock:
+            entries = [dict(entry) for entry in self.entries.values()]
+        for entry in entries:
+            entry.pop("explained_at", None)
+            entry["avg_ms"] = round(entry["total_ms"] / entry["count"], 2)
+            entry["total_ms"] = round(entry["total_ms"], 2)
+            entry["max_ms"] = round(entry["max_ms"], 2)
+        return sorted(entries, key=lambda entry: entry["total_ms"], reverse=True)
+
+    def maybe_write(self, force=False):
+        '''Rewrite the report file if it is due (slow queries are rare, so this stays cheap)'''
+        if not self.report_path:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_written < self.write_interval:
+            return
+        self.last_written = now
+        self.write_report()
+
+    def write_report(self):
+        '''Write the report atomically to report_path'''
+        if not self.report_path:
+            return
+        try:
+            tmp_path = f"{self.report_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"threshold_ms": self.threshold_ms, "queries": self.report()}, f, indent=2,
+                          default=str)
+            os.replace(tmp_path, self.report_path)
+        except OSError as e:
+            log.warning("Could not write slow query report to %s: %s", self.report_path, e)
+
+
+def print_report(path):
+    """Summarize a report file: worst query shapes first, with where they come from and what they scan"""
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+
+    print(f"Statements slower than {report['threshold_ms']} ms\n")
+    for entry in report["queries"]:
+        print(f"[{entry['fingerprint']}] {entry['count']}x  total {entry['total_ms']} ms  "
+              f"avg {entry['avg_ms']} ms  max {entry['max_ms']} ms")
+        print(f"  {entry['query'][:160]}")
+        if entry["callers"]:
+            print("  callers:   " + ", ".join(f"{name} ({n})" for name, n in entry["callers"].items()))
+        if entry["endpoints"]:
+            print("  endpoints: " + ", ".join(f"{name} ({n})" for name, n in entry["endpoints"].items()))
+        if entry["plans"]:
+            scans = entry["plans"][-1]["seq_scans"]
+            if scans:
+                print("  seq scans: " + ", ".join(f"{relation} ({rows} rows)" for relation, rows in scans))
+        print()
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print_report(sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, "slow_queries.json"))
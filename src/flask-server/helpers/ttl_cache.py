@@ -0,0 +1,70 @@
+# Prologue
+# Name: ttl_cache.py
+# Description: Small thread-safe in-process cache with per-entry expiry and a bounded size
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: Keys must be hashable.
+#   - Post: Entries are dropped after ttl seconds, or least-recently-used first once maxsize is reached.
+# Errors: None.
+
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel for "not in the cache" so that None can be cached
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, ttl, maxsize=1024):
+        '''Initialize a cache whose entries live for ttl seconds (None = forever)'''
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict() # key -> (expires_at, value), least recently used first
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        '''Return the cached value for key, or default if it is missing or expired'''
+        with self.lock:
+            entry = self.entries.get(key, MISSING)
+            if entry is MISSING:
+                return default
+
+            expires_at, value = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self.entries[key]
+                return default
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=MISSING):
+        '''Cache value under key (ttl overrides the cache-wide ttl for this entry)'''
+        if ttl is MISSING:
+            ttl = self.ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+
+            # Evict least recently used entries beyond maxsize
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        '''Drop key from the cache (no-op if missing)'''
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        '''Drop every entry'''
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
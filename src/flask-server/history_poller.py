@@ -0,0 +1,274 @@
+# Prologue
+# Name: history_poller.py
+# Description: Background poller that keeps every user's listening history current. Spotify only
+#              returns the last 50 plays, so users who rarely open the dashboard would otherwise lose
+#              history. Each user is synced on an adaptive interval using their stored refresh token.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.1
+# Pre/post conditions
+#   - Pre: The user_sync_state table exists (created by DBConnection on connect).
+#   - Post: Every user with a refresh token in this shard is synced at least every max interval,
+#           by exactly one process, within HISTORY_POLLER_RATE_PER_SECOND across all shards.
+# Errors: Failed syncs are logged, counted, and retried on the user's next (backed off) poll.
+
+import os
+import queue
+import random
+import threading
+import time
+import zlib
+
+import spotify_auth
+from app_logging import get_logger
+from helpers.listening_records import parse_recently_played
+from helpers.rate_limiter import RateLimiter
+from metrics import (POLLER_DUE_USERS, POLLER_LAG_SECONDS, POLLER_PLAYS, POLLER_QUEUE_DEPTH,
+                     POLLER_SYNC_SECONDS, POLLER_SYNCS, timed_request)
+
+log = get_logger("history_poller")
+
+# Worker threads per process; each owns the users that hash to it, so a user is never synced twice at once
+POLLER_WORKERS = int(os.getenv("HISTORY_POLLER_WORKERS", "4"))
+
+# This process's shard of the users (0 <= shard < shards). Every server process starts a poller, but only
+# one process per shard (whichever holds the shard's advisory lock) runs it; the others stand by.
+POLLER_SHARD = int(os.getenv("HISTORY_POLLER_SHARD", "0"))
+POLLER_SHARDS = int(os.getenv("HISTORY_POLLER_SHARDS", "1"))
+
+# Spotify Web API calls per second across every shard (recently-played and artist lookups);
+# each shard's poller gets an equal share
+POLLER_RATE_PER_SECOND = float(os.getenv("HISTORY_POLLER_RATE_PER_SECOND", "5"))
+
+# A claimed user isn't due again for this long, so a poller that dies mid-sync only delays them.
+# Must exceed the time a claimed user can wait in a worker queue plus one sync.
+POLLER_LEASE_SECONDS = int(os.getenv("HISTORY_POLLER_LEASE_SECONDS", "900"))
+
+# Advisory lock (key, shard) held by the process running each shard's poller
+POLLER_LOCK_ID = 5810003
+
+# How often a standby process checks whether it can take over its shard
+STANDBY_RETRY_SECONDS = 60
+
+# Bounds of the adaptive interval. Keep the maximum well under the ~2.5 hours it takes a heavy
+# listener to play 50 tracks, or plays fall out of Spotify's window between polls.
+MIN_INTERVAL_SECONDS = int(os.getenv("HISTORY_POLLER_MIN_INTERVAL_SECONDS", "600"))
+MAX_INTERVAL_SECONDS = int(os.getenv("HISTORY_POLLER_MAX_INTERVAL_SECONDS", "7200"))
+
+# Aim to find about this many new plays per poll (half of what recently-played can return)
+TARGET_PLAYS_PER_POLL = 25
+
+# How often the scheduler looks for due users, and how many it dispatches per look
+TICK_SECONDS = 15
+BATCH_SIZE = 200
+
+# Syncs that may wait per worker; users that don't fit stay due and are picked up next tick
+QUEUE_SIZE = 100
+
+# Spread polls +/- this fraction of the interval so users don't stay in lockstep
+INTERVAL_JITTER = 0.1
+
+
+def next_poll_interval(previous, new_plays, minimum=MIN_INTERVAL_SECONDS, maximum=MAX_INTERVAL_SECONDS,
+                       target=TARGET_PLAYS_PER_POLL):
+    """
+    Seconds until a user's next poll. With new plays, the interval is scaled so the listening rate
+    just seen would produce about target plays; with none, it doubles. previous is None on the
+    first poll, which starts at the minimum.
+    """
+    if previous is None:
+        return minimum
+    if new_plays == 0:
+        interval = previous * 2
+    else:
+        interval = previous * target / new_plays
+    return max(minimum, min(maximum, interval))
+
+
+class HistoryPoller:
+    def __init__(self, db, token_manager=None, workers=POLLER_WORKERS, shard=POLLER_SHARD, shards=POLLER_SHARDS,
+                 rate_per_second=POLLER_RATE_PER_SECOND):
+        '''
+        Initialize the poller on top of a DBConnection; start() launches its threads.
+        token_manager is shared with the request handlers so both reuse each other's refreshed tokens.
+        '''
+        self.db = db
+        self.token_manager = token_manager or spotify_auth.TokenManager(db)
+        self.shard = shard
+        self.shards = max(shards, 1)
+        self.limiter = RateLimiter(rate_per_second / self.shards)
+        self.lock_conn = None   # Holds the shard's advisory lock while this process runs the poller
+
+        # Users queued or being synced, so the scheduler doesn't dispatch them twice
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+
+        self.queues = [queue.Queue(maxsize=QUEUE_SIZE) for _ in range(max(workers, 1))]
+        self.threads = []
+        self.stop_event = threading.Event()
+
+    def start(self):
+        '''Start the scheduler and worker daemon threads'''
+        if self.threads:
+            return
+        for i, work_queue in enumerate(self.queues):
+            self.threads.append(threading.Thread(target=self.run_worker, args=(work_queue,),
+                                                 name=f"history-poller-{i}", daemon=True))
+        self.threads.append(threading.Thread(target=self.run_scheduler, name="history-poller", daemon=True))
+        for thread in self.threads:
+            thread.start()
+        log.info("Started history poller", extra={"workers": len(self.queues), "shard": self.shard,
+                                                  "shards": self.shards, "rate": self.limiter.rate})
+
+    def stop(self):
+        '''Ask every poller thread to exit and hand the shard to another process'''
+        self.stop_event.set()
+        if self.lock_conn is not None:
+            self.lock_conn.close()
+
+    # --- SCHEDULING ---
+
+    def run_scheduler(self):
+        '''Scheduler loop: while this process holds the shard, hand its due users to the workers every tick'''
+        while not self.stop_event.is_set():
+            active = False
+            try:
+                active = self.hold_shard()
+                if active:
+                    self.dispatch_due_users()
+            except Exception as e:
+                log.error("Error scheduling listening history syncs: %s", e)
+            self.stop_event.wait(TICK_SECONDS if active else STANDBY_RETRY_SECONDS)
+
+    def hold_shard(self):
+        '''True if this process runs the poller for its shard (taking it over if no other process does)'''
+        if self.lock_conn is not None:
+            if self.db.is_lock_connection_alive(self.lock_conn):
+                return True
+            log.warning("Lost the history poller lock", extra={"shard": self.shard})
+            self.lock_conn = None
+
+        self.lock_conn = self.db.try_hold_advisory_lock(POLLER_LOCK_ID, self.shard)
+        if self.lock_conn is not None:
+            log.info("Running the history poller", extra={"shard": self.shard})
+        return self.lock_conn is not None
+
+    def dispatch_due_users(self):
+        '''Claim as many due users as the worker queues have room for and queue them; returns how many were queued'''
+        room = sum(QUEUE_SIZE - work_queue.qsize() for work_queue in self.queues)
+        due = []
+        if room > 0:
+            due = self.db.claim_due_poll_users(self.shard, self.shards, min(BATCH_SIZE, room), POLLER_LEASE_SECONDS)
+        POLLER_DUE_USERS.set(len(due))
+
+        queued = 0
+        unqueued = []
+        for spotify_id, refresh_token, interval, lag_seconds in due:
+            with self.in_flight_lock:
+                if spotify_id in self.in_flight:
+                    # Still syncing from an earlier claim; that sync reschedules them
+                    continue
+                self.in_flight.add(spotify_id)
+            try:
+                self.worker_queue(spotify_id).put_nowait((spotify_id, refresh_token, interval, lag_seconds))
+                queued += 1
+            except queue.Full:
+                with self.in_flight_lock:
+                    self.in_flight.discard(spotify_id)
+                unqueued.append(spotify_id)
+
+        # Their worker's queue was full; let the next tick claim them instead of waiting out the lease
+        if unqueued:
+            self.db.release_poll_claims(unqueued)
+
+        for i, work_queue in enumerate(self.queues):
+            POLLER_QUEUE_DEPTH.set(work_queue.qsize(), str(i))
+        return queued
+
+    def worker_queue(self, spotify_id):
+        '''The queue of the worker that owns spotify_id (a stable hash, unlike hash() on str)'''
+        return self.queues[zlib.crc32(spotify_id.encode("utf-8")) % len(self.queues)]
+
+    # --- SYNCING ---
+
+    def run_worker(self, work_queue):
+        '''Worker loop: sync queued users one at a time'''
+        while not self.stop_event.is_set():
+            try:
+                spotify_id, refresh_token, interval, lag_seconds = work_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                POLLER_LAG_SECONDS.observe(max(lag_seconds, 0))
+                self.sync_user(spotify_id, refresh_token, interval)
+            finally:
+                with self.in_flight_lock:
+                    self.in_flight.discard(spotify_id)
+
+    def sync_user(self, spotify_id, refresh_token, interval):
+        '''Ingest the user's plays since their sync cursor, then schedule their next poll'''
+        start = time.perf_counter()
+        new_plays = 0
+        try:
+            # A token refresh is a Spotify request too, so it waits for a limiter slot. Refreshing here
+            # (rather than in get()'s background refresh-ahead) keeps it on this rate-limited thread.
+            if self.token_manager.needs_refresh(spotify_id):
+                self.limiter.acquire()
+                access_token = self.token_manager.refresh(spotify_id, refresh_token)[0]
+            else:
+                access_token = self.token_manager.get(spotify_id, refresh_token)[0]
+            listens = self.fetch_new_listens(spotify_id, access_token)
+            if listens:
+                # update_user_history looks up each artist on Spotify. The MusicBrainz genre repair
+                # (about a second per artist) is left to user-triggered updates so it can't hold a worker.
+                self.limiter.acquire(len({artist_id for listen in listens
+                                          for artist_id, _ in listen.track.artists}))
+                self.db.update_user_history(spotify_id, listens, access_token, repair_genres=False)
+            new_plays = len(listens)
+            outcome = "new" if listens else "empty"
+            interval = next_poll_interval(interval, new_plays)
+        except spotify_auth.TokenRefreshError as e:
+            # Most likely revoked access; check back rarely until they log in again
+            log.warning("Could not refresh token for %s: %s", spotify_id, e)
+            outcome = "token_error"
+            interval = MAX_INTERVAL_SECONDS
+        except Exception as e:
+            log.warning("Background sync failed for %s: %s", spotify_id, e)
+            outcome = "error"
+            interval = next_poll_interval(interval, 0)
+
+        POLLER_SYNCS.inc(1, outcome)
+        POLLER_PLAYS.inc(new_plays)
+        POLLER_SYNC_SECONDS.observe(time.perf_counter() - start)
+
+        try:
+            self.db.schedule_next_poll(spotify_id, interval * random.uniform(1 - INTERVAL_JITTER, 1 + INTERVAL_JITTER))
+        except Exception as e:
+            log.error("Could not schedule next sync for %s: %s", spotify_id, e)
+        return outcome
+
+    def fetch_new_listens(self, spotify_id, access_token):
+        '''Parsed Listens played after the user's sync cursor (all of the last 50 on the first sync)'''
+        params = {"limit": 50}
+        cursor = self.db.get_sync_cursor(spotify_id)
+        if cursor is not None:
+            params["after"] = cursor
+
+        self.limiter.acquire()
+        response = timed_request(
+            "spotify", "GET",
+            f"{self.db.SPOTIFY_API_BASE_URL}/me/player/recently-played",
+            headers={"Authorization": f"Bearer {access_token}"},
+            params=params)
+
+        if response.status_code == 429:
+            # Back every worker off for as long as Spotify asks
+            self.limiter.pause(int(response.headers.get("Retry-After", "1")))
+        elif response.status_code == 401:
+            # Token revoked or expired early; refresh it next time
+            self.token_manager.invalidate(spotify_id)
+        if response.status_code != 200:
+            raise RuntimeError(f"recently-played returned status {response.status_code}")
+
+        return parse_recently_played(response.content)
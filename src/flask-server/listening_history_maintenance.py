@@ -0,0 +1,80 @@
+# Prologue
+# Name: listening_history_maintenance.py
+# Description: Keeps listening_history's monthly partitions current on a long-running server: creates
+#              upcoming months ahead of time and rolls months past the retention window up into daily
+#              aggregates. Runs as a background thread, or once from cron (python3 listening_history_maintenance.py).
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: listening_history is partitioned (done by DBConnection on connect).
+#   - Post: Within one interval of a month boundary, next month's partition exists and expired months are rolled up.
+# Errors: Failed passes are logged and retried on the next interval.
+
+import os
+import threading
+
+from app_logging import get_logger
+
+log = get_logger("listening_history_maintenance")
+
+# Seconds between maintenance passes in each server process (0 = don't run in-process, e.g. when cron does it)
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("LISTENING_HISTORY_MAINTENANCE_SECONDS", "3600"))
+
+
+class ListeningHistoryMaintenance:
+    def __init__(self, db, interval=MAINTENANCE_INTERVAL_SECONDS):
+        '''Initialize maintenance on top of a DBConnection; start() launches its thread'''
+        self.db = db
+        self.interval = interval
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        '''Start a daemon thread that runs a pass now and then every interval (no-op if the interval is 0)'''
+        if self.interval <= 0 or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.run, name="listening-history-maintenance", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        '''Ask the maintenance thread to exit'''
+        self.stop_event.set()
+
+    def run(self):
+        '''Maintenance loop; other processes' passes are skipped by the database's advisory lock'''
+        while not self.stop_event.is_set():
+            self.run_once()
+            self.stop_event.wait(self.interval)
+
+    def run_once(self):
+        '''One pass. Returns the rolled-up partition names, or None if it was skipped or failed.'''
+        try:
+            rolled_up = self.db.maintain_listening_history()
+        except Exception as e:
+            log.error("Error maintaining listening_history partitions: %s", e)
+            return None
+        if rolled_up is None:
+            log.debug("Listening history maintenance is running in another process")
+        return rolled_up
+
+
+# One pass, for running from cron instead of (or as well as) the in-process thread
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from DBConnection import DBConnection
+
+    load_dotenv()
+    db = DBConnection()
+    try:
+        if not db.connected:
+            raise SystemExit("Database connection failed.")
+        # Called directly (not run_once) so a failure exits non-zero
+        rolled_up = db.maintain_listening_history()
+        if rolled_up is None:
+            print("Skipped: another process is maintaining listening_history")
+        else:
+            print(f"Rolled up {len(rolled_up)} partitions")
+    finally:
+        db.killCloudflare()
@@ -9,14 +9,21 @@
 #   - Post: MusicBrainz returns a list of genres or it remains empty
 # Errors: All known errors should be handled gracefully.
 
-import requests
 import time
 import os
+from metrics import timed_request
+from app_logging import get_logger
+
+log = get_logger("musicbrainz")
 
 # Header required per MusicBrainz API Documentation
 USER_AGENT = f"Scorify/1.0 ({os.getenv('USER_AGENT_EMAIL')})"
 HEADERS = {"User-Agent": USER_AGENT}
 
+# API root and the pause before each request (MusicBrainz allows one request per second)
+MB_BASE_URL = os.getenv("MUSICBRAINZ_BASE_URL", "https://musicbrainz.org/ws/2")
+MB_RATE_LIMIT_SECONDS = float(os.getenv("MUSICBRAINZ_RATE_LIMIT_SECONDS", "1"))
+
 def mb_search_artist(artist_name: str):
     """
      Searches for an artist by name using MusicBrainz.
@@ -24,16 +31,17 @@ def mb_search_artist(artist_name: str):
     """
 
     # Rate limit - 1 second per API request
-    time.sleep(1) 
+    time.sleep(MB_RATE_LIMIT_SECONDS)
 
     # Construct URL for fetching tags via MBID
-    url = f"https://musicbrainz.org/ws/2/artist/?query={artist_name}&fmt=json"
+    url = f"{MB_BASE_URL}/artist/?query={artist_name}&fmt=json"
 
     # Issue GET request to MusicBrainz with required User-Agent
-    r = requests.get(url, headers=HEADERS)
+    r = timed_request("musicbrainz", "GET", url, headers=HEADERS)
 
     # Abort if request fails or API returns non-200 status
     if r.status_code != 200:
+        log.warning("MusicBrainz artist search failed", extra={"status_code": r.status_code})
         return None
     
     # Parse response into Python dict
@@ -53,16 +61,17 @@ def mb_get_genres(mbid: str):
     """
 
     # Rate limit - 1 second per API request
-    time.sleep(1)
+    time.sleep(MB_RATE_LIMIT_SECONDS)
 
     # Construct URL for fetching tags via MBID
-    url = f"https://musicbrainz.org/ws/2/artist/{mbid}?inc=tags&fmt=json"
+    url = f"{MB_BASE_URL}/artist/{mbid}?inc=tags&fmt=json"
 
     # Issue GET request to MusicBrainz with required User-Agent
-    r = requests.get(url, headers=HEADERS)
+    r = timed_request("musicbrainz", "GET", url, headers=HEADERS)
 
     # Abort early if API returns any non-200 status code
     if r.status_code != 200:
+        log.warning("MusicBrainz tag lookup failed", extra={"status_code": r.status_code, "mbid": mbid})
         return []
 
     # Parse the JSON response
@@ -87,18 +96,19 @@ def mb_lookup_by_spotify_id(spotify_artist_id):
     """
 
     # Respect 1-second rate limit
-    time.sleep(1)
+    time.sleep(MB_RATE_LIMIT_SECONDS)
 
     # Query MusicBrainz for artists linked to this Spotify ID
     url = (
-        "https://musicbrainz.org/ws/2/artist/"
+        f"{MB_BASE_URL}/artist/"
         "?query=artistaccent:spotify:" + spotify_artist_id + "&fmt=json"
     )
 
-    response = requests.get(url, headers=HEADERS)
+    response = timed_request("musicbrainz", "GET", url, headers=HEADERS)
 
     # Abort on request failure
     if response.status_code != 200:
+        log.warning("MusicBrainz Spotify ID lookup failed", extra={"status_code": response.status_code})
         return None
 
     data = response.json()
@@ -120,13 +130,14 @@ def mb_lookup_by_name(artist_name):
     """
     try:
         # Build MusicBrainz search query using artist name
-        url = f"https://musicbrainz.org/ws/2/artist/?query=artist:{artist_name}&fmt=json"
+        url = f"{MB_BASE_URL}/artist/?query=artist:{artist_name}&fmt=json"
 
         # Perform the search request
-        response = requests.get(url, headers=HEADERS)
+        response = timed_request("musicbrainz", "GET", url, headers=HEADERS)
 
         # If API fails or returns a non-200 status code → empty list
         if response.status_code != 200:
+            log.warning("MusicBrainz name lookup failed", extra={"status_code": response.status_code})
             return []
 
         # Parse the JSON response
@@ -152,4 +163,5 @@ def mb_lookup_by_name(artist_name):
         return genres
 
     except Exception:
+        log.exception("MusicBrainz name lookup raised")
         return []
\ No newline at end of file
@@ -0,0 +1,279 @@
+# Prologue
+# Name: metrics.py
+# Description: In-process latency metrics (HTTP endpoints, database queries, outbound Spotify and
+#              MusicBrainz calls) exported in the Prometheus text format on /metrics.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: None.
+#   - Post: Every observation is aggregated into histograms/counters; nothing is stored per event.
+# Errors: None; recording a metric never raises into the request path.
+
+import hashlib
+import re
+import threading
+import time
+from functools import lru_cache
+
+import requests
+
+# Histogram buckets (upper bounds); +Inf is always added
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Content type Prometheus expects from a scrape
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    """Render {name="value",...} (empty string when there are no labels)"""
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{escape_label(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_bound(bound):
+    """Render a bucket bound the way Prometheus clients do (1.0 -> 1.0, 5 -> 5.0)"""
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        '''A labelled histogram: per label set, cumulative bucket counts plus sum and count'''
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        '''Record one observation for the given label values'''
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        '''Prometheus text lines for this histogram'''
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {labels: list(series) for labels, series in self.series.items()}
+        for labels, series in sorted(snapshot.items()):
+            for i, bound in enumerate(self.buckets):
+                label_text = format_labels(self.label_names, labels, [("le", format_bound(bound))])
+                lines.append(f"{self.name}_bucket{label_text} {series[i]}")
+            label_text = format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-2]}")
+            lines.append(f"{self.name}_count{label_text} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text, label_names=()):
+        '''A labelled gauge (last value set wins)'''
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.series[label_values] = value
+
+    def inc(self, amount=1, *label_values):
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self.lock:
+            snapshot = dict(self.series)
+        for labels, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Counter(Gauge):
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} counter"
+        return lines
+
+
+# Every metric the server exports, in output order
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+HTTP_REQUEST_SECONDS = register(Histogram(
+    "scorify_http_request_duration_seconds", "Wall time spent handling each request.",
+    ("endpoint", "method", "status")))
+DB_QUERY_SECONDS = register(Histogram(
+    "scorify_db_query_duration_seconds", "Database round-trip time per statement (execute + fetch).",
+    ("fingerprint",)))
+DB_COMMIT_SECONDS = register(Histogram(
+    "scorify_db_commit_duration_seconds", "Time spent committing after each statement.",
+    ("fingerprint",)))
+DB_QUERY_ROWS = register(Histogram(
+    "scorify_db_query_rows", "Rows returned (or affected) per statement.",
+    ("fingerprint",), ROW_BUCKETS))
+DB_QUERY_INFO = register(Gauge(
+    "scorify_db_query_info", "Normalized SQL text for each query fingerprint.",
+    ("fingerprint", "query")))
+OUTBOUND_REQUEST_SECONDS = register(Histogram(
+    "scorify_outbound_request_duration_seconds", "Latency of calls to external APIs.",
+    ("service", "method", "status")))
+POLLER_SYNCS = register(Counter(
+    "scorify_poller_syncs_total", "Background listening history syncs by outcome (new, empty, error, token_error).",
+    ("outcome",)))
+POLLER_PLAYS = register(Counter(
+    "scorify_poller_plays_total", "Plays ingested by the background poller."))
+POLLER_SYNC_SECONDS = register(Histogram(
+    "scorify_poller_sync_duration_seconds", "Wall time of each background sync (token, fetch and ingestion)."))
+POLLER_LAG_SECONDS = register(Histogram(
+    "scorify_poller_lag_seconds", "How long past its scheduled time each background sync started.",
+    buckets=LAG_BUCKETS))
+POLLER_DUE_USERS = register(Gauge(
+    "scorify_poller_due_users", "Due users this process claimed for a sync at the last scheduler tick."))
+POLLER_QUEUE_DEPTH = register(Gauge(
+    "scorify_poller_queue_depth", "Syncs waiting per poller worker.", ("worker",)))
+
+
+def render_metrics():
+    """The whole registry in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- SQL FINGERPRINTS ---
+
+# Literals and whitespace that shouldn't split one query shape into many fingerprints
+SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+SQL_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+SQL_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(text):
+    """Collapse whitespace and replace literals with ? so equivalent statements match"""
+    text = SQL_STRING.sub("?", text)
+    text = SQL_NUMBER.sub("?", text)
+    return SQL_SPACE.sub(" ", text).strip()
+
+
+@lru_cache(maxsize=1024)
+def fingerprint_sql(text):
+    """Short, stable ID for a SQL statement's shape. Returns (fingerprint, normalized text)."""
+    normalized = normalize_sql(text)
+    fingerprint = hashlib.md5(normalized.encode("utf-8")).hexdigest()[:12]
+    DB_QUERY_INFO.set(1, fingerprint, normalized[:200])
+    return fingerprint, normalized
+
+
+def sql_text(command, conn=None):
+    """SQL text of a str or psycopg2.sql.Composable command"""
+    if isinstance(command, str):
+        return command
+    try:
+        return command.as_string(conn)
+    except Exception:
+        return repr(command)
+
+
+def record_db_query(fingerprint, query_seconds, commit_seconds, rows):
+    """Record one statement's round-trip time, commit time, and row count"""
+    DB_QUERY_SECONDS.observe(query_seconds, fingerprint)
+    DB_COMMIT_SECONDS.observe(commit_seconds, fingerprint)
+    DB_QUERY_ROWS.observe(rows, fingerprint)
+
+
+# --- OUTBOUND HTTP ---
+
+def timed_request(service, method, url, **kwargs):
+    """requests.request() that records its latency under the given service name (spotify, musicbrainz)"""
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = requests.request(method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    finally:
+        OUTBOUND_REQUEST_SECONDS.observe(time.perf_counter() - start, service, method.upper(), status)
+
+
+async def timed_async_request(client, service, method, url, **kwargs):
+    """timed_request() for an async client (httpx.AsyncClient): awaits client.request() and records its latency"""
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = await client.request(method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    finally:
+        OUTBOUND_REQUEST_SECONDS.observe(time.perf_counter() - start, service, method.upper(), status)
+
+
+# --- FLASK MIDDLEWARE ---
+
+# Route handled by the current thread ("GET /get-user-info"); unset outside requests
+request_state = threading.local()
+
+
+def current_endpoint():
+    """Method and route template of the request being handled on this thread, or None"""
+    return getattr(request_state, "endpoint", None)
+
+
+def init_app(app):
+    """Time every request and serve the registry on /metrics"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_state.endpoint = f"{request.method} {rule}"
+
+    @app.after_request
+    def record_request_time(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            # Use the route template (/get-user-info-by-id/<int:user_id>) to keep label counts bounded
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method,
+                                         str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def record_failed_request(error):
+        request_state.endpoint = None
+        # Unhandled exceptions skip after_request
+        started = g.pop("request_started", None)
+        if started is not None and error is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method, "500")
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(render_metrics(), content_type=CONTENT_TYPE)
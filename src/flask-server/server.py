@@ -10,47 +10,74 @@
 #   - Post: None.
 # Errors: None.
 
+import contextvars
 import os
-from flask.typing import ErrorHandlerCallable
+import time
 import urllib.parse
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, redirect, request, jsonify, session
+from flask import Blueprint, Flask, g, redirect, request, jsonify, session
 from flask_cors import CORS
 from dotenv import load_dotenv
 from typing import Optional
-import werkzeug
-import random
-from helpers.simplify_json import SimplifyJSON
+from helpers.listening_records import parse_recently_played
+from helpers.simplify_json import simplifier
+from helpers.ttl_cache import TTLCache
 import threading
-from DBConnection import DBConnection
-from server_utils import *
-from werkzeug.exceptions import HTTPException, InternalServerError
+from song_of_the_day import SongOfTheDay
+import app_logging
+import metrics
+import session_store
+import spotify_auth
+from metrics import timed_request
 from server_utils import calculate_diversity_score, bucketize_genre_lists, calculate_taste_score
+from server_utils import genre_distribution, get_developer_spotify_ids
 
 # Load env variables
 load_dotenv()
 
-# Flask app initialization
-app = Flask(__name__)
-CORS(app,
-     origins=['http://127.0.0.1:3000'],
-     supports_credentials=True
-     )
-
-# Load secret key from environment variable and bind to app instance
-app.secret_key = os.getenv('APP_SECRET_KEY')
-
-# Configure session cookie settings
-app.config.update(
-    # This means the cookie is only accessible on the same site
-    SESSION_COOKIE_SAMESITE='Lax',
-    SESSION_COOKIE_SECURE=False,    # This means the cookie is not secure --> not HTTPS
-    # This means the cookie is not accessible by JavaScript
-    SESSION_COOKIE_HTTPONLY=True,
-    # This means the cookie is only accessible on the local host (127.0.0.1)
-    SESSION_COOKIE_DOMAIN='127.0.0.1'
-)
+log = app_logging.get_logger("server")
+
+# All routes live on this blueprint; create_app() builds a Flask app around it
+api = Blueprint('api', __name__)
+
+
+def create_app():
+    '''App factory: build and configure the Flask app. The database connects lazily on the first request.'''
+
+    # Flask app initialization
+    app = Flask(__name__)
+    CORS(app,
+         origins=['http://127.0.0.1:3000'],
+         supports_credentials=True
+         )
+
+    # Load secret key from environment variable and bind to app instance
+    app.secret_key = os.getenv('APP_SECRET_KEY')
+
+    # Configure session cookie settings
+    app.config.update(
+        # This means the cookie is only accessible on the same site
+        SESSION_COOKIE_SAMESITE='Lax',
+        SESSION_COOKIE_SECURE=False,    # This means the cookie is not secure --> not HTTPS
+        # This means the cookie is not accessible by JavaScript
+        SESSION_COOKIE_HTTPONLY=True,
+        # This means the cookie is only accessible on the local host (127.0.0.1)
+        SESSION_COOKIE_DOMAIN='127.0.0.1'
+    )
+
+    # Keep session data on the server if SESSION_BACKEND asks for it; the cookie then only carries a session ID
+    session_store.init_app(app, get_db)
+
+    # Structured, queue-backed logging with a request ID on every record
+    app_logging.configure_logging()
+    app_logging.init_app(app)
+
+    # Per-endpoint latency histograms and the /metrics endpoint (outside the blueprint's DB check)
+    metrics.init_app(app)
+
+    app.register_blueprint(api)
+    return app
 
 # Constants
 # - REDIRECT_URI = 'https://localhost:3000/callback'
@@ -58,231 +85,267 @@ REDIRECT_URI = 'http://127.0.0.1:5000/callback'
 CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 
-# Developer Spotify IDs for taste score baseline
-DEV1_SPOTIFY_ID = os.getenv('DEV1_SPOTIFY_ID')
-DEV2_SPOTIFY_ID = os.getenv('DEV2_SPOTIFY_ID')
-DEV3_SPOTIFY_ID = os.getenv('DEV3_SPOTIFY_ID')
-DEV4_SPOTIFY_ID = os.getenv('DEV4_SPOTIFY_ID')
-DEV5_SPOTIFY_ID = os.getenv('DEV5_SPOTIFY_ID')
+# Hour of the day (UTC) at which the song of the day rolls over
+SONG_OF_THE_DAY_ROLLOVER_HOUR = int(os.getenv('SONG_OF_THE_DAY_ROLLOVER_HOUR', '0'))
 
-AUTH_URL = 'https://accounts.spotify.com/authorize'
-TOKEN_URL = 'https://accounts.spotify.com/api/token'
-API_BASE_URL = 'https://api.spotify.com/v1'
-ERROR_MESSAGE = 'Authentication failed: {error}'
+# Keep every user's listening history current in the background (HISTORY_POLLER=0 turns it off)
+HISTORY_POLLER_ENABLED = os.getenv('HISTORY_POLLER', '1') != '0'
 
-# Initialize our connection to the Scorify database
-dbConn: Optional[DBConnection] = None
-try:
-    temp = DBConnection()
-    if not temp.connected:
-        raise ConnectionError(
-            "Database connection failed: could not connect to Scorify database.")
-    else:
-        dbConn = temp
-except Exception as e:
-    import sys
-    print(f"[ERROR] {e}", file=sys.stderr)
+# Developer Spotify IDs for taste score baseline (DEV_SPOTIFY_IDS or DEV1_SPOTIFY_ID ... DEV5_SPOTIFY_ID)
+DEV_SPOTIFY_IDS = get_developer_spotify_ids()
 
+# Spotify endpoints (overridable so benchmarks can point at a stand-in server)
+SPOTIFY_ACCOUNTS_URL = os.getenv('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com')
+AUTH_URL = f'{SPOTIFY_ACCOUNTS_URL}/authorize'
+TOKEN_URL = f'{SPOTIFY_ACCOUNTS_URL}/api/token'
+API_BASE_URL = os.getenv('SPOTIFY_API_BASE_URL', 'https://api.spotify.com/v1')
+ERROR_MESSAGE = 'Authentication failed: {error}'
 
-def handle_error(error):
-    '''Handle an error by redirecting to the login page with the error parameter.'''
+# Threads shared by /dashboard requests for their concurrent database reads (about the DB pool size;
+# reads beyond the pool's connections would only queue for one)
+DASHBOARD_WORKERS = int(os.getenv('DASHBOARD_WORKERS', '8'))
+dashboard_pool = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix="dashboard")
+
+# Spotify profiles (/me) are reused for this long before being fetched again
+PROFILE_CACHE_SECONDS = int(os.getenv('PROFILE_CACHE_SECONDS', '300'))
+profile_cache = TTLCache(ttl=PROFILE_CACHE_SECONDS, maxsize=10000)
+
+# Seconds to wait before trying to connect to the database again after a failure
+DB_RETRY_SECONDS = 30
+
+# Our connection to the Scorify database and the services built on it.
+# Created on first use by get_db() so importing this module stays cheap.
+dbConn = None
+song_of_the_day_cache: Optional[SongOfTheDay] = None
+similarity_index = None
+history_poller = None
+listening_history_maintenance = None
+token_manager = None
+db_lock = threading.Lock()
+db_failed_at = 0.0
+
+
+def get_db():
+    '''Return the database connection, connecting (and starting DB-backed services) on first use.'''
+    global dbConn, song_of_the_day_cache, similarity_index, history_poller, token_manager, db_failed_at
+    global listening_history_maintenance
+
+    if dbConn is not None:
+        return dbConn
+
+    with db_lock:
+        # Another request may have connected while we waited, or it failed very recently
+        if dbConn is not None or time.time() - db_failed_at < DB_RETRY_SECONDS:
+            return dbConn
+
+        # Heavy imports (psycopg2, NumPy) are deferred until the database is actually needed
+        from DBConnection import DBConnection
+        from similarity_index import SimilarityIndex
+
+        try:
+            temp = DBConnection()
+            if not temp.connected:
+                raise ConnectionError(
+                    "Database connection failed: could not connect to Scorify database.")
+        except Exception as e:
+            db_failed_at = time.time()
+            log.error("Database connection failed: %s", e)
+            return None
+
+        # Cached song of the day, rolled over and pre-formatted by a background scheduler
+        song_of_the_day_cache = SongOfTheDay(temp, SONG_OF_THE_DAY_ROLLOVER_HOUR)
+        song_of_the_day_cache.start_scheduler()
+
+        # Pre-create upcoming listening_history partitions and roll up expired ones every so often
+        from listening_history_maintenance import ListeningHistoryMaintenance
+        listening_history_maintenance = ListeningHistoryMaintenance(temp)
+        listening_history_maintenance.start()
+
+        # "Listeners like you" index, refreshed per user whenever their genre counts change
+        similarity_index = SimilarityIndex(temp)
+        try:
+            # Load before any request writes new counts, so the first update after a restart isn't
+            # mistaken for "unchanged" (update_user would otherwise load them lazily)
+            similarity_index.load()
+        except Exception as e:
+            log.error("Could not load the similarity index: %s", e)
+
+        # Per-user access tokens, refreshed server-side before they expire (shared with the poller)
+        token_manager = spotify_auth.TokenManager(temp)
+
+        # Background syncs for users who don't open the dashboard often enough
+        if HISTORY_POLLER_ENABLED:
+            from history_poller import HistoryPoller
+            history_poller = HistoryPoller(temp, token_manager)
+            history_poller.start()
+
+        dbConn = temp
+        return dbConn
+
+
+# --- SHARED ROUTE LOGIC ---
+# Route bodies below take the session (sess) and request arguments explicitly and return
+# (JSON body, status), so asgi_server.py serves the same logic; only Spotify calls and the waiting on
+# them differ between the two servers.
+
+def not_authenticated():
+    '''Response for a request without a logged-in session'''
+    return {
+        'error': 'Not authenticated',
+        'logged_in': False
+    }, 401
+
+
+def access_token_expired():
+    '''Response for a session whose token expired and couldn't be refreshed'''
+    # Refresh failed; the client falls back to /refresh-user-token or logging in again
+    return {
+        'error': 'Access token expired',
+        'logged_in': False,
+        'needs_refresh': True
+    }, 401
+
+
+def session_access_token(sess):
+    '''
+    Return the logged-in user's access token, refreshing it server-side when it is about to expire
+    (sess is updated to match). Returns None if it has expired and can't be refreshed.
+    '''
+    spotify_id = sess.get('spotify_id')
+    if spotify_id is None or token_manager is None:
+        # Not linked to a user yet (first /get-user-info after login): only the session's token is known
+        return sess['access_token'] if time.time() < sess['expires_at'] else None
 
     try:
-        # URL-encode the error message
-        encoded_error_message = urllib.parse.quote(
-            ERROR_MESSAGE.format(error=error))
-        # Redirect to login page with error parameter
-        return redirect(f'http://127.0.0.1:3000/login?error={encoded_error_message}')
+        access_token, expires_at, refresh_token = token_manager.get(
+            spotify_id, sess.get('refresh_token'), (sess['access_token'], sess['expires_at']))
     except Exception as e:
-        # URL-encode the error message
-        encoded_error_message = urllib.parse.quote(
-            ERROR_MESSAGE.format(error=e))
-        # Redirect to login page with error parameter
-        return redirect(f'http://127.0.0.1:3000/login?error={encoded_error_message}')
+        log.warning("Server-side token refresh failed: %s", e)
+        return None
 
+    if access_token != sess['access_token']:
+        sess['access_token'] = access_token
+        sess['expires_at'] = expires_at
+        sess['refresh_token'] = refresh_token or sess.get('refresh_token')
+    return access_token
 
-@app.route('/')
-def lander():
-    return "<div><h1>API lander<h1><div>"
 
-# Login route
+def session_token_needs_refresh(sess):
+    '''True if session_access_token(sess) has to call Spotify before it can return the token'''
+    spotify_id = sess.get('spotify_id')
+    if 'access_token' not in sess or spotify_id is None or token_manager is None:
+        return False
+    return token_manager.get_cached(
+        spotify_id, sess.get('refresh_token'), (sess['access_token'], sess['expires_at'])) is None
 
 
-@app.route('/login')
-def login():
-    '''Redirect the user to Spotify's authorization URL to authorize the app.'''
+def logged_in_token(sess):
+    '''(access_token, None) for a logged-in session (refreshed if needed), else (None, error response)'''
+    # Check if user is logged in
+    if 'access_token' not in sess:
+        return None, not_authenticated()
 
-    # Check if user is already logged in
-    if 'access_token' in session:
-        # If already logged in, redirect to dashboard
-        # add data population here!
-        print("access token in session")
-        print(session)
-        return jsonify({'message': 'User already logged in', 'logged_in': True}) and redirect('http://127.0.0.1:3000/dashboard')
+    # Get a valid access token, refreshed server-side if it is about to expire
+    access_token = session_access_token(sess)
+    if access_token is None:
+        return None, access_token_expired()
+    return access_token, None
 
-    try:
-        # Spotify scopes
-        # - user-read-recently-played: Read access to user's recently played tracks
-        # - user-read-private: Read access to user's private information
-        # - user-read-email: Read access to user's email address
-        # Note: To get a user's display name, will use user-read-private and user-read-email
-        scope = 'user-read-recently-played user-read-private user-read-email'
-
-        # Declare the parameters for the authorization URL
-        params = {
-            'client_id': CLIENT_ID,
-            'response_type': 'code',
-            'scope': scope,
-            'redirect_uri': REDIRECT_URI
-        }
 
-        # Create the authorization URL and encode the parameters
-        auth_url = f'{AUTH_URL}?{urllib.parse.urlencode(params)}'
+def spotify_headers(access_token):
+    '''Headers for a Spotify Web API request on the user's behalf'''
+    return {"Authorization": f"Bearer {access_token}"}
 
-        # Redirect the user to Spotify's authorization URL
-        return redirect(auth_url)
-    except Exception as e:
-        # Handle error and redirect to login page with error parameter
-        return handle_error(e)
 
-# Callback route
+def login_error_url(error):
+    '''The login page URL showing error'''
+    # URL-encode the error message
+    encoded_error_message = urllib.parse.quote(ERROR_MESSAGE.format(error=error))
+    return f'http://127.0.0.1:3000/login?error={encoded_error_message}'
 
 
-@app.route('/callback')
-def callback():
-    '''Handle the callback from Spotify's authorization server and exchange temporary code for access token.'''
+def authorize_url():
+    '''Spotify's authorization URL for this app'''
 
-    try:
-        # Check if there is an error from Spotify (e.g., user denied access)
-        if 'error' in request.args:
-            # Throw an error
-            raise Exception(request.args['error'])
+    # Spotify scopes
+    # - user-read-recently-played: Read access to user's recently played tracks
+    # - user-read-private: Read access to user's private information
+    # - user-read-email: Read access to user's email address
+    # Note: To get a user's display name, will use user-read-private and user-read-email
+    scope = 'user-read-recently-played user-read-private user-read-email'
 
-        # If there is no error, get the temporary authorization code
-        # - When successful, auth server returns a temporary code in URL parameters
-        # - Need to exchange temp code for access token
-        assert (dbConn.connected)
-        if 'code' in request.args:
-            req_body = {
-                'code': request.args['code'],
-                'grant_type': 'authorization_code',
-                'redirect_uri': REDIRECT_URI,
-                'client_id': CLIENT_ID,
-                'client_secret': CLIENT_SECRET
-            }
+    # Declare the parameters for the authorization URL
+    params = {
+        'client_id': CLIENT_ID,
+        'response_type': 'code',
+        'scope': scope,
+        'redirect_uri': REDIRECT_URI
+    }
 
-            # Send the response body to get an access token
-            response = requests.post(TOKEN_URL, data=req_body)
-            # Extract JSON from response
-            token_info = response.json()
-
-            # Store access token
-            session['access_token'] = token_info['access_token']
-            # Store refresh token
-            session['refresh_token'] = token_info['refresh_token']
-            # Store expiry as an absolute timestamp
-            session['expires_at'] = datetime.now().timestamp() + \
-                int(token_info['expires_in'])
+    # Create the authorization URL and encode the parameters
+    return f'{AUTH_URL}?{urllib.parse.urlencode(params)}'
 
-            # Return success message and redirect to the dashboard page
-            return redirect('http://127.0.0.1:3000/dashboard')
-    except Exception as e:
-        # Handle error and redirect to login page with error parameter
-        return handle_error(e)
 
-# User profile information endpoint
+def token_request_body(code):
+    '''Body of the request that exchanges the temporary authorization code for an access token'''
+    return {
+        'code': code,
+        'grant_type': 'authorization_code',
+        'redirect_uri': REDIRECT_URI,
+        'client_id': CLIENT_ID,
+        'client_secret': CLIENT_SECRET
+    }
 
 
-@app.route('/get-user-info-by-id/<int:user_id>')
-def get_user_info_by_id(user_id):
-    '''Returns user info for a given user ID.'''
-    
-    # Check if user is logged in
-    if 'access_token' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
-    
-    # Get the user's information from the database
-    out = dbConn.get_user_info_by_id(user_id)
-
-    # Clean the output
-    cleaned = []
-    row = out[0]
-    cleaned.append({
-            "user_id": row[0],
-            "spotify_id": row[1],
-            "user_name": row[2],
-            "profile_image_url": row[3],
-            "diversity_score": row[6]
-        })
-
-    return jsonify({ "user_info": cleaned }), 200
-
-@app.route('/get-user-info')
-def api_get_user_info():
-    '''Get the user's information from the Spotify API, using the access token.'''
+def start_session(sess, token_info):
+    '''Store a newly issued token (Spotify's token response JSON) in the session'''
 
-    # Check if user is logged in
-    if 'access_token' not in session:
-        # If not logged in, return error
-        return jsonify({
-            'error': 'Not authenticated',
-            'logged_in': False
-        }), 401
+    # A new login may be a different Spotify account; /get-user-info links the session again
+    sess.pop('spotify_id', None)
 
-    # Check if access token is expired
-    if datetime.now().timestamp() > session['expires_at']:
-        # If access token is expired, refresh token
-        return jsonify({
-            'error': 'Access token expired',
-            'logged_in': False,
-            'needs_refresh': True
-        }), 401
+    # Store access token
+    sess['access_token'] = token_info['access_token']
+    # Store refresh token
+    sess['refresh_token'] = token_info['refresh_token']
+    # Store expiry as an absolute timestamp
+    sess['expires_at'] = datetime.now().timestamp() + int(token_info['expires_in'])
 
-    try:
-        # Construct header
-        req_headers = {
-            "Authorization": f"Bearer {session['access_token']}"
-        }
 
-        # Send GET request to Spotify API to get user information
-        response = requests.get(f'{API_BASE_URL}/me', headers=req_headers)
-        print("User info response status code:", response.status_code)
-        # Extract JSON from response
-        user_info = response.json()
-        spotify_id = user_info['id']
-        session['spotify_id'] = spotify_id
-        # Get user_id from database
-        print("Fetching user ID for Spotify ID:", spotify_id)
-        user_id = dbConn.get_user_id_by_spotify_id(spotify_id)
-        print("Fetched user ID:", user_id)
-        # Store/Update the user in the database
-        dbConn.add_user(
-            response.text, session["access_token"], session["refresh_token"])
-        # Prepare user_info with user_id
-        print("Preparing user info with user ID")
-        user_info_with_id = {
-            'user_id': user_id,
-            'spotify_id': user_info.get('id'),
-            'user_name': user_info.get('display_name'),
-            'profile_image_url': user_info.get('images')[0]['url'] if user_info.get('images') else None,
-            'email': user_info.get('email')
-        }
-        # Return the user_info
-        return jsonify({
-            'message': 'User information retrieved',
-            'user_info': user_info_with_id,
-            'logged_in': True,
-            'needs_refresh': False,
-        }), 200
+def link_session(sess, spotify_id, access_token):
+    '''Tie the session to the user with spotify_id'''
+    if sess.get('spotify_id') != spotify_id:
+        sess['spotify_id'] = spotify_id
+        # From now on the token manager keeps this user's token fresh
+        token_manager.remember(spotify_id, access_token, sess['expires_at'], sess.get('refresh_token'))
 
-    except Exception as e:
-        # Return error message
-        return jsonify({'error': str(e)}), 400
 
+def user_info_response(user_info, user_id):
+    '''/get-user-info's response for a Spotify /me profile'''
+    return {
+        'message': 'User information retrieved',
+        'user_info': format_spotify_profile(user_info, user_id),
+        'logged_in': True,
+        'needs_refresh': False,
+    }, 200
 
-@app.route('/get-leaderboard-data')
-def get_leaderboard_data():
-    '''Get profile pictures, usernames, diversity scores, and music taste ratings for all users.'''
+
+def user_info_by_id_response(sess, user_id):
+    '''Body of /get-user-info-by-id'''
+
+    # Check if user is logged in
+    if 'access_token' not in sess:
+        return {'error': 'Not authenticated'}, 401
+
+    # Get the user's information from the database
+    user_info = load_viewed_user(user_id)
+    if user_info is None:
+        return {'error': 'User not found'}, 404
+
+    return {"user_info": [user_info]}, 200
+
+
+def leaderboard_response(sess):
+    '''Body of /get-leaderboard-data'''
 
     # Steps:
     # 0 - Ensure we're logged in and have a valid token
@@ -291,22 +354,9 @@ def get_leaderboard_data():
     # 3 - Format data from database if necessary. Error on failure.
     # 4 - Return data to requestee.
 
-    # Check if user is logged in
-    if 'access_token' not in session:
-        # If not logged in, return error
-        return jsonify({
-            'error': 'Not authenticated',
-            'logged_in': False
-        }), 401
-
-    # Check if access token is expired
-    if datetime.now().timestamp() > session['expires_at']:
-        # If access token is expired, refresh token
-        return jsonify({
-            'error': 'Access token expired',
-            'logged_in': False,
-            'needs_refresh': True
-        }), 401
+    _, error = logged_in_token(sess)
+    if error is not None:
+        return error
 
     try:
         # Step 1 - Check DB connection
@@ -327,192 +377,233 @@ def get_leaderboard_data():
         return {
             "profiles": result,
             "scores": scores
-        }
+        }, 200
 
     except Exception as e:
         # Return error message
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
 
 
-@app.route('/get-user-diversity-score-by-id/<int:user_id>')
-def get_user_diversity_score_by_user_id(user_id):
-    if 'access_token' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
-    
+def diversity_score_by_id_response(sess, user_id):
+    '''Body of /get-user-diversity-score-by-id'''
+    if 'access_token' not in sess:
+        return {'error': 'Not authenticated'}, 401
+
     # Get the users diversity score from the database
     diversity_score = dbConn.get_user_diversity_score_by_id(user_id)
     if diversity_score is None:
-        return jsonify({'error': 'Diversity score not found for user'}), 404
-    return jsonify({'diversity_score': diversity_score}), 200
+        return {'error': 'Diversity score not found for user'}, 404
+    return {'diversity_score': diversity_score}, 200
+
+
+def diversity_score_response(sess):
+    '''Body of /get-user-diversity-score'''
 
-@app.route('/get-user-diversity-score')
-def get_user_diversity_score():
     # Check if user is logged in
-    if 'access_token' not in session:
-        # If not logged in, return error
-        return jsonify({
-            'error': 'Not authenticated',
-            'logged_in': False
-        }), 401
+    if 'access_token' not in sess:
+        return not_authenticated()
 
     # We need the user's Spotify ID to look up their songs/artists.
-    spotify_id = session['spotify_id']
+    spotify_id = sess['spotify_id']
 
     try:
-        # Get genres from DB | Return Form: [( ['rock','metal'], ), ( ['pop'], ), ... ]
-        genres_rows = dbConn.get_user_genres(spotify_id)
-
-        # Convert SQL rows --> list of lists
-        # Ex: [( ['rock','metal'], ), ( ['pop'], )] --> [ ['rock','metal'], ['pop'] ]
-        genre_lists = []
-        for (genre_array,) in genres_rows:
-            if genre_array:
-                genre_lists.append(genre_array)
-
-        # Convert raw genres → bucketed genres
-        bucketed_genres = bucketize_genre_lists(genre_lists)
-
-        # Calculate score by calling the helper function
-        div_score = calculate_diversity_score(bucketed_genres)
-
-        # Commit user scores to db (if user exists).
-        user_id = dbConn.get_user_id_by_spotify_id(spotify_id)
-        dbConn.update_user_diversity_score(user_id, spotify_id, div_score)
+        div_score = update_diversity_score(spotify_id, dbConn.get_user_id_by_spotify_id(spotify_id))
 
         # Return score to the frontend
-        return jsonify({
+        return {
             "diversity_score": div_score
-        }), 200
+        }, 200
 
     except Exception as e:
         # Return error message
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
 
 
-@app.route('/get-user-taste-score')
-def get_user_taste_score():
-    '''Get the user's taste score based on developer diversity scores stored in the database.'''
+def update_diversity_score(spotify_id, user_id):
+    '''Recompute the user's diversity score from their genres, store it, and return it.'''
+
+    # Get genres from DB | Return Form: [( ['rock','metal'], ), ( ['pop'], ), ... ]
+    genres_rows = dbConn.get_user_genres(spotify_id)
+
+    # Convert SQL rows --> list of lists
+    # Ex: [( ['rock','metal'], ), ( ['pop'], )] --> [ ['rock','metal'], ['pop'] ]
+    genre_lists = []
+    for (genre_array,) in genres_rows:
+        if genre_array:
+            genre_lists.append(genre_array)
+
+    # Convert raw genres → bucketed genres
+    bucketed_genres = bucketize_genre_lists(genre_lists)
+
+    # Calculate score by calling the helper function
+    div_score = calculate_diversity_score(bucketed_genres)
+
+    # Keep the full per-bucket distribution for taste scoring
+    genre_counts = genre_distribution(bucketed_genres)
+
+    # Commit user scores to db (if user exists).
+    dbConn.update_user_diversity_score(user_id, spotify_id, div_score, genre_counts)
+
+    # Refresh this user's similar listeners in the background (no-op if counts are unchanged)
+    similarity_index.update_user_in_background(user_id, genre_counts)
+    return div_score
+
+
+def taste_score_response(sess):
+    '''Body of /get-user-taste-score'''
 
     # Check if user is logged in
-    if 'access_token' not in session:
-        # If not logged in, return error
-        return jsonify({
-            'error': 'Not authenticated',
-            'logged_in': False
-        }), 401
-    
+    if 'access_token' not in sess:
+        return not_authenticated()
+
     # We need the user's Spotify ID to compare to developer scores
-    user_spotify_id = session.get('spotify_id')
-    print("user spotify id:", user_spotify_id)
+    user_spotify_id = sess.get('spotify_id')
+    log.debug("Scoring taste", extra={"spotify_id": user_spotify_id})
     if user_spotify_id is None:
-        return jsonify({
+        return {
             'error': 'User Spotify ID not found in session',
             'logged_in': False
-        }), 401
+        }, 401
 
     try:
         # Ensure DB connection is valid
         assert (dbConn.connected)
 
-        # Collect developer Spotify IDs from constants
-        dev_ids = [
-            DEV1_SPOTIFY_ID,
-            DEV2_SPOTIFY_ID,
-            DEV3_SPOTIFY_ID,
-            DEV4_SPOTIFY_ID,
-            DEV5_SPOTIFY_ID
-        ]
-
-        # Ensure all 5 IDs exist in the environment
-        if any(dev_id is None for dev_id in dev_ids):
-            return jsonify({
-                "error": "Developer Spotify IDs are not fully configured in environment."
-            }), 500
-        
-        # Get the user's diversity score and normalize to 0–100 scale
-        raw_user_div = dbConn.get_diversity_score_by_spotify_id(user_spotify_id)
-        print("raw_user_div:", raw_user_div)
-        if raw_user_div is None:
-            return jsonify({
-                'error': 'No diversity score found for user. Please generate a diversity score first.',
-            }), 404
-
-        # Normalize the diversity score
-        user_div = raw_user_div * 100
-        print("user_div:", user_div)
-        # Fetch developer diversity scores (0–100)
-        developer_diversities = []
-        for dev_spotify_id in dev_ids:
-            score = dbConn.get_diversity_score_by_spotify_id(dev_spotify_id)
-            if score is not None:
-                # Normalize from 0–1 to 0–100
-                developer_diversities.append(score * 100)
-        
-        # If none of the developers have diversity scores stored
-        if len(developer_diversities) == 0:
-            return jsonify({
-                'error': 'No developer diversity scores found in database.'
-            }), 500
-
-        # Calculate the taste score (0–100)
-        taste_score = calculate_taste_score(user_div, developer_diversities)
-        
-        # Commit user scores to db (if user exists).
-        user_id = dbConn.get_user_id_by_spotify_id(user_spotify_id)
-        dbConn.update_user_taste_score(user_id, user_spotify_id, taste_score)
+        taste_score, error = update_taste_score(
+            user_spotify_id, dbConn.get_user_id_by_spotify_id(user_spotify_id))
+        if error is not None:
+            return error
 
         # Return taste score to the frontend
-        return jsonify({
+        return {
             "taste_score": taste_score
-        }), 200
+        }, 200
 
     except Exception as e:
         # Return error message
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
 
-@app.route('/get-user-taste-score-by-id/<int:user_id>')
-def get_user_taste_score_by_user_id(user_id):
-    '''Returns the taste score for a given user ID.'''
+def update_taste_score(user_spotify_id, user_id):
+    '''Recompute the user's taste score, store it, and return (score, None) or (None, (error body, status)).'''
+
+    # Ensure the developer baseline is configured in the environment
+    if len(DEV_SPOTIFY_IDS) == 0:
+        return None, ({
+            "error": "Developer Spotify IDs are not configured in environment."
+        }, 500)
+
+    # Compare the user's full genre distribution to the developer cohort's (both precomputed)
+    user_counts = dbConn.get_genre_counts_by_spotify_id(user_spotify_id)
+    cohort_counts = dbConn.get_developer_genre_counts(DEV_SPOTIFY_IDS)
+
+    if user_counts is not None and len(cohort_counts) > 0:
+        from taste_engine import engine_for
+        taste_score = engine_for(cohort_counts).score(user_counts)
+    else:
+        # Distributions not stored yet -> compare diversity scores instead
+        taste_score, error = legacy_taste_score(user_spotify_id)
+        if error is not None:
+            return None, error
+
+    # Commit user scores to db (if user exists).
+    dbConn.update_user_taste_score(user_id, user_spotify_id, taste_score)
+    return taste_score, None
+
+def legacy_taste_score(user_spotify_id):
+    '''Taste score from the user's diversity score vs. the developers' average. Returns (score, (error body, status)).'''
+
+    # Get the user's diversity score and normalize to 0–100 scale
+    raw_user_div = dbConn.get_diversity_score_by_spotify_id(user_spotify_id)
+    if raw_user_div is None:
+        return None, ({
+            'error': 'No diversity score found for user. Please generate a diversity score first.',
+        }, 404)
+
+    # Normalize the diversity score
+    user_div = raw_user_div * 100
+
+    # Average developer diversity score (0–100), cached between requests
+    developer_baseline = dbConn.get_developer_baseline(DEV_SPOTIFY_IDS)
+
+    # If none of the developers have diversity scores stored
+    if developer_baseline is None:
+        return None, ({
+            'error': 'No developer diversity scores found in database.'
+        }, 500)
+
+    # Calculate the taste score (0–100)
+    return calculate_taste_score(user_div, [developer_baseline]), None
+
+
+def taste_score_by_id_response(sess, user_id):
+    '''Body of /get-user-taste-score-by-id'''
 
     # Check if user is logged in
-    if 'access_token' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
-    
+    if 'access_token' not in sess:
+        return {'error': 'Not authenticated'}, 401
+
     # Get the users taste score from the database
     taste_score = dbConn.get_user_taste_score_by_id(user_id)
 
     # Return error if taste score not found
     if taste_score is None:
-        return jsonify({'error': 'Taste score not found for user'}), 404
-    return jsonify({'taste_score': taste_score}), 200
+        return {'error': 'Taste score not found for user'}, 404
+    return {'taste_score': taste_score}, 200
 
-@app.route('/get-user-listening-history-by-id/<int:user_id>')
-def get_user_listening_history_id(user_id):
-    '''Retrieve a user's listening history by their user ID.'''
+
+def listening_history_by_id_response(sess, user_id):
+    '''Body of /get-user-listening-history-by-id'''
 
     # Check if user is logged in
-    if 'access_token' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
+    if 'access_token' not in sess:
+        return {'error': 'Not authenticated'}, 401
 
     # Verify that the user exists
-    print("user id", user_id, "checking rows")
     user_rows = dbConn.get_user_info_by_id(user_id)
-    print("user rows", user_rows)
+    log.debug("Looked up user", extra={"user_id": user_id, "found": bool(user_rows)})
 
     # If no such user exists, return error
     if not user_rows:
-        return jsonify({'error': 'User not found'}), 404
+        return {'error': 'User not found'}, 404
 
     # Directly fetch history by user_id
     rows = dbConn.get_listening_history_by_user_id(user_id)
 
     # Return the listening history
-    return jsonify({
+    return {
         'message': 'User listening history retrieved',
         'user_listening_history': rows,
         'logged_in': True,
         'needs_refresh': False
-    }), 200
+    }, 200
+
+
+def similar_listeners_response(sess, user_id, limit):
+    '''Body of /get-similar-listeners-by-id'''
+
+    # Check if user is logged in
+    if 'access_token' not in sess:
+        return {'error': 'Not authenticated'}, 401
+
+    try:
+        # Precomputed by the similarity index; this is a single indexed read
+        rows = dbConn.get_similar_users(user_id, limit)
+
+        similar_listeners = []
+        for row in rows:
+            similar_listeners.append({
+                "user_id": row[0],
+                "spotify_id": row[1],
+                "user_name": row[2],
+                "profile_image_url": row[3],
+                "similarity": row[4]
+            })
+
+        return {'similar_listeners': similar_listeners}, 200
+
+    except Exception as e:
+        # Return error message
+        return {'error': str(e)}, 500
 
 def clean_user_info_by_username(out):
     '''Cleans the user info from the database.'''
@@ -529,283 +620,557 @@ def clean_user_info_by_username(out):
         cleaned_info.append(user_dict)
     return cleaned_info
 
-@app.route('/is-user-history-updating') # Will also have the spotify id as a query parameter
-def is_user_history_updating():
-    '''Returns whether the user's listening history is currently being updated.'''
+
+def history_updating_response(sess, spotify_id):
+    '''Body of /is-user-history-updating (an in-memory check, so it never blocks)'''
 
     # Check if user is logged in
-    if 'access_token' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
-    
-    # Get spotify_id from query parameters
-    spotify_id = request.args.get('spotify_id')
+    if 'access_token' not in sess:
+        return {'error': 'Not authenticated'}, 401
 
     # If no spotify_id provided, return error
     if spotify_id is None:
-        return jsonify({
+        return {
             'error': 'No spotify_id provided in request',
-        }), 400
+        }, 400
 
     # No synchronization issues because we never write to this variable on thread 1!
-    return {"status":dbConn.is_user_history_updating(spotify_id)}
+    return {"status": dbConn.is_user_history_updating(spotify_id)}, 200
 
-@app.route('/get-user-listening-history')
-def get_user_listening_history():
-    '''Get the user's listening history from the SpotifyDB Database, using existing dbconnection'''
+
+def stored_listening_history_response(sess):
+    '''Body of /get-user-listening-history'''
 
     # Check if we've stored user's spotify_id locally
-    spotify_id: Optional[str] = None
-    try:
-        spotify_id = session['spotify_id']
-    except:
-        print("spotify_id not in session")
-    print("Fetch listening history spotify_id:", spotify_id)
+    spotify_id: Optional[str] = sess.get('spotify_id')
     if spotify_id is None:
-        return jsonify({
+        log.debug("spotify_id not in session")
+        return {
             'error': 'Not authenticated: spotify id not in session',
             'logged_in': False
-        }), 401
+        }, 401
 
-    # Fetch and clean the user's listening history from the database
-    cleaned_user_info = dbConn.get_user_listening_history(
-        session['spotify_id'])
-    
-    # Return the user_info
     try:
-        return jsonify({
+        # Fetch and clean the user's listening history from the database
+        cleaned_user_info = dbConn.get_user_listening_history(spotify_id)
+
+        # Return the user_info
+        return {
             'message': 'User listening history retrieved',
             'user_listening_history': cleaned_user_info,
             'logged_in': True,
             'needs_refresh': False
-        }), 200
+        }, 200
     except Exception as e:
         # Return error message
-        return jsonify({'error': str(e)}), 400
+        return {'error': str(e)}, 400
 
-# User listening history endpoint
 
-
-@app.route('/fetch-user-listening-history-by-id/<int:user_id>')
-def fetch_user_listening_history(user_id):
-    '''Fetch the user's listening history from the Spotify API, using the access token.'''
+def prepare_history_fetch(sess, user_id):
+    '''
+    First half of /fetch-user-listening-history-by-id: check the session may fetch user_id's plays.
+    Returns (None, (spotify_id, access_token, recently-played params)) or (error response, None).
+    '''
 
     # Check if user is logged in
-    if 'access_token' not in session:
-        return jsonify({
+    if 'access_token' not in sess:
+        return ({
             'error': 'Not authenticated: access token not in session',
             'logged_in': False
-        }), 401
-    
+        }, 401), None
+
     # Check if current user matches requsted user_id
-    current_user_id = dbConn.get_user_id_by_spotify_id(session.get('spotify_id'))
+    current_user_id = dbConn.get_user_id_by_spotify_id(sess.get('spotify_id'))
     if current_user_id != user_id:
-        return jsonify({
+        return ({
             'error': 'Not authorized to fetch this user\'s listening history',
             'logged_in': False
-        }), 403
+        }, 403), None
 
     # Check if we've stored user's spotify_id locally
     spotify_id = dbConn.get_spotify_id_by_user_id(user_id)
-    print("Fetch listening history spotify_id:", spotify_id)
+    log.debug("Fetching listening history from Spotify", extra={"spotify_id": spotify_id})
     if spotify_id is None:
-        return jsonify({
+        return ({
             'error': 'Not authenticated: spotify id not in session',
             'logged_in': False
-        }), 401
+        }, 401), None
 
-    # Check if access token is expired
-    if datetime.now().timestamp() > session['expires_at']:
-        # If access token is expired, refresh token
-        return jsonify({
-            'error': 'Access token expired',
-            'logged_in': False,
-            'needs_refresh': True
-        }), 401
+    # Get a valid access token, refreshed server-side if it is about to expire
+    access_token = session_access_token(sess)
+    if access_token is None:
+        return access_token_expired(), None
 
-    try:
-        # Construct header
-        req_headers = {
-            "Authorization": f"Bearer {session['access_token']}"
-        }
+    req_params = {
+        "limit": 50
+    }
 
-        req_params = {
-            "limit": 50
-        }
+    # Only ask for plays newer than the last one we stored (Unix milliseconds)
+    cursor = dbConn.get_sync_cursor(spotify_id)
+    if cursor is not None:
+        req_params["after"] = cursor
+    return None, (spotify_id, access_token, req_params)
 
-        # Send GET request to Spotify API to get user information
-        response = requests.get(
-            f'{API_BASE_URL}/me/player/recently-played',
-            headers=req_headers,
-            params=req_params)
 
-        # Extract JSON from response
-        user_history = response.json()
+def history_fetch_response(body):
+    '''
+    Second half of /fetch-user-listening-history-by-id, from the raw recently-played response body.
+    Returns (the new plays as Listens, for ingestion, and the response).
+    '''
 
-        # Clean/Simplify the JSON data (create instance first)
-        simplifier = SimplifyJSON()
-        cleaned_user_info = simplifier.simplify_listening_history(user_history)
+    # Parse the raw response body once; the same records feed the response and the DB ingestion
+    listens = parse_recently_played(body)
+    cleaned_user_info = simplifier.simplify_listens(listens)
 
-        # Return the user_info
-        return jsonify({
-            'message': 'User listening history retrieved',
-            'user_listening_history': cleaned_user_info,
-            'logged_in': True,
-            'needs_refresh': False
-        }), 200
+    return listens, ({
+        'message': 'User listening history retrieved',
+        'user_listening_history': cleaned_user_info,
+        'logged_in': True,
+        'needs_refresh': False
+    }, 200)
+
+
+def refresh_token_response(sess):
+    '''Body of /refresh-user-token'''
+
+    # Check if refresh token is available
+    if 'refresh_token' not in sess:
+        # Return error message
+        return {'error': 'Refresh token not found'}, 200
+
+    try:
+        # Send refresh token to Spotify to get a new access token (through the token manager once
+        # we know who the user is, so the new token is shared with server-side refreshes)
+        if sess.get('spotify_id') and token_manager is not None:
+            access_token, expires_at, refresh_token = token_manager.refresh(
+                sess['spotify_id'], sess['refresh_token'])
+        else:
+            access_token, expires_at, refresh_token = spotify_auth.refresh_access_token(
+                sess['refresh_token'])
+
+        # Store new access token, expiry time (absolute timestamp) and possibly rotated refresh token in session
+        sess['access_token'] = access_token
+        sess['expires_at'] = expires_at
+        sess['refresh_token'] = refresh_token
 
+        # Return success message
+        return {'message': 'Access token refreshed'}, 200
     except Exception as e:
         # Return error message
-        return jsonify({'error': str(e)}), 400
-    finally:
-        threading.Thread(
-            target=dbConn.update_user_history,
-            args=(session['spotify_id'], response.text,
-                  session['access_token'])
-        ).start()
+        return {'error': str(e)}, 400
 
 
-# Refresh token route
-@app.route('/refresh-user-token')
-def refresh_token():
-    '''Refresh the access token using the refresh token.'''
+def song_of_the_day_response(song_of_the_day):
+    '''/get-song-of-the-day's response for the cached song of the day (None if there isn't one)'''
+    if song_of_the_day is None:
+        return {
+            'error': 'No song of the day available',
+            'song_of_the_day': None
+        }, 200
+
+    # Return formatted response
+    return {
+        'message': 'Song of the day retrieved',
+        'song_of_the_day': song_of_the_day,
+        'logged_in': True,
+        'needs_refresh': False
+    }, 200
+
+
+def format_spotify_profile(user_info, user_id):
+    '''The user_info payload /get-user-info and /dashboard return for a Spotify /me response'''
+    return {
+        'user_id': user_id,
+        'spotify_id': user_info.get('id'),
+        'user_name': user_info.get('display_name'),
+        'profile_image_url': user_info.get('images')[0]['url'] if user_info.get('images') else None,
+        'email': user_info.get('email')
+    }
+
+
+def cached_spotify_profile(spotify_id, access_token, refresh_token):
+    '''
+    What the profile cache can do for sync_spotify_profile: returns ((user_info, user_id), None) when
+    the cached profile is current, (None, (user_info, user_info_json)) when only the tokens changed (it
+    still has to be stored), and (None, None) when /me has to be fetched.
+    '''
+    cached = profile_cache.get(spotify_id) if spotify_id is not None else None
+    if cached is None:
+        return None, None
+    user_info, user_info_json, tokens, user_id = cached
+    if tokens == (access_token, refresh_token):
+        return (user_info, user_id), None
+    return None, (user_info, user_info_json)
+
+
+def store_spotify_profile(user_info, user_info_json, access_token, refresh_token):
+    '''Store/update the user from their /me profile and cache it; returns (user_info, user_id)'''
+    user_id = dbConn.add_user(user_info_json, access_token, refresh_token)
+    profile_cache.set(user_info['id'], (user_info, user_info_json, (access_token, refresh_token), user_id))
+    return user_info, user_id
+
+
+def refresh_own_scores(spotify_id, user_id):
+    '''Recompute the user's diversity score, then their taste score from the genres it just stored'''
+    update_diversity_score(spotify_id, user_id)
+    update_taste_score(spotify_id, user_id)
+
+
+def load_viewed_user(user_id):
+    '''Everything the dashboard shows about user_id, read from the database'''
+    rows = dbConn.get_user_info_by_id(user_id)
+    if not rows:
+        return None
+    row = rows[0]
+    return {
+        "user_id": row[0],
+        "spotify_id": row[1],
+        "user_name": row[2],
+        "profile_image_url": row[3],
+        "diversity_score": row[6]
+    }
+
+
+def fallback_profile(spotify_id, user_id):
+    '''
+    The user_info payload when syncing /me failed: from the cached /me profile, else the users table.
+    If neither is available only the IDs are filled in, so the dashboard still loads without a profile.
+    '''
+    cached = profile_cache.get(spotify_id)
+    if cached is not None:
+        return format_spotify_profile(cached[0], user_id)
+
+    profile = {'user_id': user_id, 'spotify_id': spotify_id, 'user_name': None,
+               'profile_image_url': None, 'email': None}
+    try:
+        stored = load_viewed_user(user_id)
+    except Exception as e:
+        log.warning("Could not load stored profile: %s", e)
+        stored = None
+    if stored:
+        profile['user_name'] = stored['user_name']
+        profile['profile_image_url'] = stored['profile_image_url']
+    return profile
 
-    # Check if refresh token is available
-    if 'refresh_token' not in session:
-        # Return error message
-        return jsonify({'error': 'Refresh token not found'})
 
+def submit(fn, *args):
+    '''Run fn on the dashboard pool, carrying over this request's logging context'''
+    return dashboard_pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def result_or_none(future, what):
+    '''A dashboard piece's result; a failed piece is logged and left empty rather than failing the page'''
     try:
-        # Send refresh token to get a new access token
-        req_body = {
-            'grant_type': 'refresh_token',
-            'refresh_token': session['refresh_token'],
-            'client_id': CLIENT_ID,
-            'client_secret': CLIENT_SECRET
-        }
+        return future.result()
+    except Exception as e:
+        log.warning("Could not load dashboard %s: %s", what, e)
+        return None
 
-        # Send POST request to Spotify API to refresh access token
-        response = requests.post(TOKEN_URL, data=req_body)
-        # Extract JSON from response
-        new_token_info = response.json()
 
-        # Store new access token and expiry time in session
-        session['access_token'] = new_token_info['access_token']
-        # Store expiry as an absolute timestamp
-        session['expires_at'] = datetime.now().timestamp() + \
-            int(new_token_info['expires_in'])
+def load_dashboard(spotify_id, own_user_id, user_id):
+    '''
+    Everything on the dashboard except the logged-in user's profile and the song of the day. The
+    viewed user's reads run concurrently on the dashboard pool while this thread refreshes our own scores.
+    '''
+
+    # The viewed user's rows don't depend on the score refresh, except their own scores
+    viewed_future = submit(load_viewed_user, user_id)
+    history_future = submit(dbConn.get_listening_history_by_user_id, user_id)
+    if user_id != own_user_id:
+        diversity_future = submit(dbConn.get_user_diversity_score_by_id, user_id)
+        taste_future = submit(dbConn.get_user_taste_score_by_id, user_id)
+
+    # Meanwhile, refresh our own scores on this thread (taste depends on the diversity refresh)
+    try:
+        refresh_own_scores(spotify_id, own_user_id)
+    except Exception as e:
+        log.warning("Could not refresh dashboard scores: %s", e)
+
+    if user_id == own_user_id:
+        # Read back after the refresh, so the page shows the scores just computed
+        diversity_future = submit(dbConn.get_user_diversity_score_by_id, user_id)
+        taste_future = submit(dbConn.get_user_taste_score_by_id, user_id)
+
+    return {
+        'viewed_user_info': result_or_none(viewed_future, "user info"),
+        'user_listening_history': result_or_none(history_future, "listening history"),
+        'diversity_score': result_or_none(diversity_future, "diversity score"),
+        'taste_score': result_or_none(taste_future, "taste score"),
+    }
+
+
+def dashboard_response(profile, spotify_id, own_user_id, dashboard, song_of_the_day):
+    '''/dashboard's response from our /me profile (None if syncing it failed) and load_dashboard's pieces'''
+    return {
+        'message': 'Dashboard retrieved',
+        'user_info': (format_spotify_profile(profile, own_user_id) if profile
+                      else fallback_profile(spotify_id, own_user_id)),
+        **dashboard,
+        'song_of_the_day': song_of_the_day,
+        'logged_in': True,
+        'needs_refresh': False
+    }, 200
+
+
+# --- FLASK ROUTES ---
+
+def user_id_for(spotify_id):
+    '''The user ID for spotify_id, looked up at most once per request (and cached process-wide by DBConnection)'''
+    memo = g.setdefault('user_ids', {})
+    if spotify_id not in memo:
+        memo[spotify_id] = dbConn.get_user_id_by_spotify_id(spotify_id)
+    return memo[spotify_id]
+
+
+def handle_error(error):
+    '''Handle an error by redirecting to the login page with the error parameter.'''
+    return redirect(login_error_url(error))
+
+
+def sync_spotify_profile(access_token, refresh_token, spotify_id=None):
+    '''
+    Return (Spotify /me JSON, user_id) for the user, storing/updating them in the database.
+    When spotify_id is known, a profile fetched in the last PROFILE_CACHE_SECONDS is reused instead of
+    calling /me, and nothing is written unless the tokens changed since it was stored.
+    '''
+    current, profile = cached_spotify_profile(spotify_id, access_token, refresh_token)
+    if current is not None:
+        return current
+    if profile is None:
+        response = timed_request("spotify", "GET", f'{API_BASE_URL}/me', headers=spotify_headers(access_token))
+        response.raise_for_status()
+        profile = (response.json(), response.text)
+    return store_spotify_profile(*profile, access_token, refresh_token)
+
+
+@api.route('/')
+def lander():
+    return "<div><h1>API lander<h1><div>"
+
+# Login route
+
+
+@api.route('/login')
+def login():
+    '''Redirect the user to Spotify's authorization URL to authorize the app.'''
+
+    # Check if user is already logged in
+    if 'access_token' in session:
+        # If already logged in, redirect to dashboard
+        log.debug("User already logged in, redirecting to dashboard")
+        return redirect('http://127.0.0.1:3000/dashboard')
+
+    try:
+        # Redirect the user to Spotify's authorization URL
+        return redirect(authorize_url())
+    except Exception as e:
+        # Handle error and redirect to login page with error parameter
+        return handle_error(e)
+
+# Callback route
+
+
+@api.route('/callback')
+def callback():
+    '''Handle the callback from Spotify's authorization server and exchange temporary code for access token.'''
+
+    try:
+        # Check if there is an error from Spotify (e.g., user denied access)
+        if 'error' in request.args:
+            # Throw an error
+            raise Exception(request.args['error'])
+
+        # If there is no error, get the temporary authorization code
+        # - When successful, auth server returns a temporary code in URL parameters
+        # - Need to exchange temp code for access token
+        assert (dbConn.connected)
+        if 'code' in request.args:
+            # Send the response body to get an access token
+            response = timed_request("spotify", "POST", TOKEN_URL, data=token_request_body(request.args['code']))
+            start_session(session, response.json())
+
+            # Return success message and redirect to the dashboard page
+            return redirect('http://127.0.0.1:3000/dashboard')
+    except Exception as e:
+        # Handle error and redirect to login page with error parameter
+        return handle_error(e)
+
+# User profile information endpoint
+
+
+@api.route('/get-user-info-by-id/<int:user_id>')
+def get_user_info_by_id(user_id):
+    '''Returns user info for a given user ID.'''
+    return user_info_by_id_response(session, user_id)
+
+@api.route('/get-user-info')
+def api_get_user_info():
+    '''Get the user's information from the Spotify API, using the access token.'''
+    access_token, error = logged_in_token(session)
+    if error is not None:
+        return error
+
+    try:
+        # Get the user's Spotify profile (cached for a few minutes once we know who they are) and
+        # store/update them in the database; the upsert returns their user_id, even for a new user
+        user_info, user_id = sync_spotify_profile(
+            access_token, session.get('refresh_token'), session.get('spotify_id'))
+        log.debug("Fetched user ID", extra={"spotify_id": user_info['id'], "user_id": user_id})
+        link_session(session, user_info['id'], access_token)
+        return user_info_response(user_info, user_id)
 
-        # Return success message
-        return jsonify({'message': 'Access token refreshed'}), 200
     except Exception as e:
         # Return error message
-        return jsonify({'error': str(e)}), 400
+        return {'error': str(e)}, 400
+
+
+@api.route('/get-leaderboard-data')
+def get_leaderboard_data():
+    '''Get profile pictures, usernames, diversity scores, and music taste ratings for all users.'''
+    return leaderboard_response(session)
+
+
+@api.route('/get-user-diversity-score-by-id/<int:user_id>')
+def get_user_diversity_score_by_user_id(user_id):
+    return diversity_score_by_id_response(session, user_id)
+
+@api.route('/get-user-diversity-score')
+def get_user_diversity_score():
+    '''Get the user's diversity score from their listening history.'''
+    return diversity_score_response(session)
+
+
+@api.route('/get-user-taste-score')
+def get_user_taste_score():
+    '''Get the user's taste score by comparing their genre distribution to the developers' (the reference cohort).'''
+    return taste_score_response(session)
+
+@api.route('/get-user-taste-score-by-id/<int:user_id>')
+def get_user_taste_score_by_user_id(user_id):
+    '''Returns the taste score for a given user ID.'''
+    return taste_score_by_id_response(session, user_id)
+
+@api.route('/get-user-listening-history-by-id/<int:user_id>')
+def get_user_listening_history_id(user_id):
+    '''Retrieve a user's listening history by their user ID.'''
+    return listening_history_by_id_response(session, user_id)
 
+@api.route('/get-similar-listeners-by-id/<int:user_id>')
+def get_similar_listeners_by_id(user_id):
+    '''Returns the listeners whose genre distributions are most similar to the given user's.'''
+    return similar_listeners_response(session, user_id, request.args.get('limit', default=10, type=int))
 
-@app.route('/get-song-of-the-day')
+@api.route('/is-user-history-updating') # Will also have the spotify id as a query parameter
+def is_user_history_updating():
+    '''Returns whether the user's listening history is currently being updated.'''
+    return history_updating_response(session, request.args.get('spotify_id'))
+
+@api.route('/get-user-listening-history')
+def get_user_listening_history():
+    '''Get the user's listening history from the SpotifyDB Database, using existing dbconnection'''
+    return stored_listening_history_response(session)
+
+# User listening history endpoint
+
+
+@api.route('/fetch-user-listening-history-by-id/<int:user_id>')
+def fetch_user_listening_history(user_id):
+    '''Fetch the user's plays since their last sync from the Spotify API, using the access token.'''
+    error, fetch = prepare_history_fetch(session, user_id)
+    if error is not None:
+        return error
+    spotify_id, access_token, req_params = fetch
+
+    try:
+        # Send GET request to Spotify API to get the plays since the cursor
+        response = timed_request(
+            "spotify", "GET",
+            f'{API_BASE_URL}/me/player/recently-played',
+            headers=spotify_headers(access_token),
+            params=req_params)
+        listens, result = history_fetch_response(response.content)
+
+        # Store the new plays in the background (nothing to do if there are none)
+        if listens:
+            threading.Thread(
+                target=dbConn.update_user_history,
+                args=(spotify_id, listens, access_token)
+            ).start()
+        return result
+
+    except Exception as e:
+        # Return error message
+        return {'error': str(e)}, 400
+
+
+# Refresh token route
+@api.route('/refresh-user-token')
+def refresh_token():
+    '''Refresh the access token using the refresh token.'''
+    return refresh_token_response(session)
+
+
+@api.route('/get-song-of-the-day')
 def get_song_of_the_day():
-    '''Get the song of the day. Refreshes it if it's older than 24 hours.'''
+    '''Get the song of the day. It is rolled over daily by a background scheduler.'''
+    _, error = logged_in_token(session)
+    if error is not None:
+        return error
 
-    # Check if user is logged in
-    if 'access_token' not in session:
-        return jsonify({
-            'error': 'Not authenticated',
-            'logged_in': False
-        }), 401
+    try:
+        # Pure cache read; the scheduler keeps it current (falls back to the DB if it is cold)
+        return song_of_the_day_response(song_of_the_day_cache.get())
 
-    # Check if access token is expired
-    if datetime.now().timestamp() > session['expires_at']:
-        return jsonify({
-            'error': 'Access token expired',
-            'logged_in': False,
-            'needs_refresh': True
-        }), 401
+    except Exception as e:
+        # Return error message
+        return {'error': str(e)}, 500
+
+
+@api.route('/dashboard')
+@api.route('/dashboard/<int:user_id>')
+def get_dashboard(user_id=None):
+    '''
+    Everything the dashboard needs in one request: the logged-in user's profile (with their scores
+    recomputed), and the viewed user's (default: the logged-in user's) info, history, and scores, and
+    the song of the day. Independent reads run concurrently; each piece is computed once.
+    '''
+    access_token, error = logged_in_token(session)
+    if error is not None:
+        return error
 
     try:
-        # Check if we need to refresh the song of the day
-        should_refresh = dbConn.should_refresh_song_of_the_day()
-
-        if should_refresh:
-            # Get all unique tracks from all users' listening histories
-            all_tracks = dbConn.get_all_unique_tracks()
-            
-            if not all_tracks or len(all_tracks) == 0:
-                # No tracks available
-                return jsonify({
-                    'error': 'No listening history available',
-                    'song_of_the_day': None
-                }), 200
-
-            # Get all previously selected track IDs
-            previously_selected = dbConn.get_all_previously_selected_track_ids()
-
-            # Filter out previously selected tracks
-            available_tracks = [
-                track for track in all_tracks
-                if track[0] not in previously_selected  # track[0] is track_id
-            ]
-
-            # If no tracks remain, clear history and restart
-            if len(available_tracks) == 0:
-                dbConn.clear_song_of_the_day_history()
-                available_tracks = all_tracks
-
-            # Randomly select one track from available tracks
-            if len(available_tracks) > 0:
-                selected_track = random.choice(available_tracks)
-                track_id = selected_track[0]
-                
-                # Update the song of the day
-                dbConn.update_song_of_the_day(track_id)
-
-        # Get the current song of the day (either existing or newly selected)
-        current_song = dbConn.get_current_song_of_the_day()
-
-        if current_song is None:
-            return jsonify({
-                'error': 'No song of the day available',
-                'song_of_the_day': None
-            }), 200
-
-        # Format the response to match frontend expectations
-        # * current_song format: (track_id, track_name, song_img_url, album_name, artist_names, artist_ids, selected_at)
-        track_id = current_song[0]
-        track_name = current_song[1]
-        song_img_url = current_song[2]
-        album_name = current_song[3] if len(current_song) > 3 else None
-        artist_names = current_song[4] if len(current_song) > 4 else []
-        artist_ids = current_song[5] if len(current_song) > 5 else []
-
-        # Format artist names as a string (comma-separated)
-        artists_str = ", ".join(artist_names) if artist_names else "Unknown Artist"
-
-        # Generate Spotify URL
-        from server_utils import get_track_url_from_id
-        spotify_url = get_track_url_from_id(track_id)
-
-        # Return formatted response
-        return jsonify({
-            'message': 'Song of the day retrieved',
-            'song_of_the_day': {
-                'id': track_id,
-                'track_name': track_name,
-                'artists': artists_str,
-                'artist_ids': artist_ids,
-                'album_image': song_img_url,
-                'spotify_url': spotify_url,
-                'album_name': album_name
-            },
-            'logged_in': True,
-            'needs_refresh': False
-        }), 200
+        refresh_token = session.get('refresh_token')
+        spotify_id = session.get('spotify_id')
+        own_user_id = user_id_for(spotify_id) if spotify_id else None
+
+        if own_user_id is None:
+            # First load after login (or a new user): we need /me to know who this is before anything else
+            profile, own_user_id = sync_spotify_profile(access_token, refresh_token)
+            spotify_id = profile['id']
+            link_session(session, spotify_id, access_token)
+            profile_future = None
+        else:
+            # Keep the stored profile current alongside the reads below
+            profile_future = submit(sync_spotify_profile, access_token, refresh_token, spotify_id)
+
+        dashboard = load_dashboard(spotify_id, own_user_id, own_user_id if user_id is None else user_id)
+
+        # Cache read; the scheduler keeps it current
+        song_of_the_day = song_of_the_day_cache.get()
+
+        if profile_future is not None:
+            profile = (result_or_none(profile_future, "profile") or (None, None))[0]
+        return dashboard_response(profile, spotify_id, own_user_id, dashboard, song_of_the_day)
 
     except Exception as e:
         # Return error message
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
 
 
-@app.before_request
+@api.before_request
 def check_db_connection():
-    if dbConn is None or not dbConn.connected:
+    db = get_db()
+    if db is None or not db.connected:
         return jsonify({
             "error": "Database connection failed. Please try again later."
         }), 501
@@ -813,4 +1178,4 @@ def check_db_connection():
 
 # Run the application
 if __name__ == "__main__":
-    app.run(debug=True, use_reloader=False)
+    create_app().run(debug=True, use_reloader=False)
@@ -1,7 +1,7 @@
 # Prologue
 # Name: server_utils.py
 # Description: Helper utilities for the Flask server, including genre flattening, diversity scoring,
-#              taste alignment scoring, Spotify date normalization, and track URL generation.
+#              taste alignment scoring, Spotify date normalization, history ingestion rows, and track URL generation.
 # Programmer: Logan Smith, Dellie Wright, Blake Carlson
 # Last revision date: 12/02/25
 # Revisions: 1.5
@@ -10,53 +10,52 @@
 #   - Post: Returns normalized values, computed scores, or formatted outputs.
 # Errors: All known errors should be handled gracefully.
 
-import math
-from flask import Flask, redirect, request, jsonify, session
-from icecream import ic
 import math
 import os
-import json
+from functools import lru_cache
+from helpers.genre_taxonomy import load_taxonomy
 
 # --- LOAD BUCKET DEFINITIONS ---
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 GENRE_PATH = os.path.join(BASE_DIR, "genres_dict.json")
+TAXONOMY_PATH = os.path.join(BASE_DIR, "genres_taxonomy.bin")
 
-with open(GENRE_PATH, "r", encoding="utf-8") as f:
-    GENRES = json.load(f)
-
-ROOTS = GENRES["genres"]
-GENRE_MAP = GENRES["genres_map"]
-
-# Build reverse lookup table:
-# "dance pop" → "Pop", "edm" → "Electronic", etc.
-REVERSE = {}
+# Compiled taxonomy: "dance pop" → index of "Pop", "edm" → index of "Electronic", etc.
+# Memory-mapped from a small binary artifact instead of holding the whole JSON in every worker,
+# and only loaded the first time something needs it.
+@lru_cache(maxsize=1)
+def get_taxonomy():
+    """Returns the compiled genre taxonomy, loading (and if needed building) it on first use."""
+    return load_taxonomy(GENRE_PATH, TAXONOMY_PATH)
 
-for root, subs in GENRE_MAP.items():
-    for s in subs:
-        REVERSE[s.lower()] = root
+def __getattr__(name):
+    """Lazily provides TAXONOMY and ROOTS (root genre names; a root genre's ID is its index)."""
+    if name == "TAXONOMY":
+        return get_taxonomy()
+    if name == "ROOTS":
+        return get_taxonomy().roots
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # --- GENRE CLASSIFICATION ---
 
-def classify_genre(genre: str):
-    g = genre.strip().lower()
-
-    # If genre matches a root exactly
-    for root in ROOTS:
-        if g == root.lower():
-            return root
-
-    # If genre is mapped inside genres_map
-    if g in REVERSE:
-        return REVERSE[g]
+@lru_cache(maxsize=8192)
+def classify_genre_id(genre: str):
+    """Returns the root genre ID for a genre tag, or None if it can't be classified."""
+    return get_taxonomy().lookup(genre.strip().lower())
 
-    return None
+def classify_genre(genre: str):
+    """Returns the root genre name for a genre tag, or None if it can't be classified."""
+    root_id = classify_genre_id(genre)
+    if root_id is None:
+        return None
+    return get_taxonomy().roots[root_id]
 
 def bucketize_genre_lists(list_of_lists):
     """
     Input:  [["djent", "progressive metal"], ["indie pop", "neo-synthpop"]]
-    Output: [["metal"], ["pop"]]
+    Output: [[6], [0]]  (root genre IDs, i.e. indexes into ROOTS: Metal, Pop)
     """
 
     # Define return list
@@ -78,10 +77,10 @@ def bucketize_genre_lists(list_of_lists):
                 continue
 
             # Run the bucketing algorithm on the genre
-            bucket = classify_genre(genre)
+            bucket = classify_genre_id(genre)
             
-            # If a root genre list is returned -> add it to the return list
-            if bucket:
+            # If a root genre ID is returned -> add it to the return list
+            if bucket is not None:
                 buckets.add(bucket)
 
         # Add only non-empty sets as list
@@ -112,7 +111,7 @@ def flatten_list(genre_lists):
 
 # --- DIVERSITY SCORE ---
 
-# Expecting genre lists to be a list of lists [[pop, dance], [punk], [rock, metal, prog metal]]
+# Expecting genre lists to be a list of lists of root genre IDs [[0, 1], [5], [5, 6]]
 def calculate_diversity_score(genre_lists):
     """Uses Shannon's Entropy formula to calculate normalized diversity relative to the full genre set.
        Score closer to 1 = High Diversity | Score closer to 0 = Low Diversity
@@ -125,19 +124,12 @@ def calculate_diversity_score(genre_lists):
     if len(user_genres) == 0:
         return 0.00
     
-    # Build frequency map (initialize all buckets with 0)
-    genre_counts = {}
-    for g in ROOTS:
-        genre_counts[g] = 0
-
-    # Count user listens (only for genres in our known set)
-    for genre in user_genres:
-        if genre in genre_counts:
-            genre_counts[genre] += 1
+    # Build frequency map (one bucket per root genre ID)
+    genre_counts = genre_distribution(genre_lists)
 
     # Compute total listens
     total = 0
-    for count in genre_counts.values():
+    for count in genre_counts:
         total = total + count
 
     if total == 0:
@@ -145,19 +137,35 @@ def calculate_diversity_score(genre_lists):
     
     # Calculate Shannon entropy
     entropy = 0.0
-    for count in genre_counts.values():
+    for count in genre_counts:
         if count > 0:
             p = count / total
             entropy = entropy - (p * math.log(p, 2))
 
     # Normalize entropy by the total number of genres
-    max_entropy = math.log(len(ROOTS), 2)
+    max_entropy = math.log(len(get_taxonomy().roots), 2)
     diversity = (entropy / max_entropy) * 100
 
     # Round to 2 places - (Can Be Adjusted)!
     return round(diversity, 2)
 
 
+# --- GENRE DISTRIBUTION ---
+
+def genre_distribution(genre_lists):
+    """
+    Counts bucketed genres per root genre, in ROOTS order (one entry per bucket).
+    Input:  [[6], [0, 5], [0]]  (root genre IDs)
+    Output: [2, 0, 0, 0, 0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0]
+    """
+
+    counts = [0] * len(get_taxonomy().roots)
+    for root_id in flatten_list(genre_lists):
+        counts[root_id] += 1
+
+    return counts
+
+
 # --- TASTE SCORE ---
 
 def calculate_taste_score(user_diversity, developer_diversities):
@@ -191,6 +199,19 @@ def calculate_taste_score(user_diversity, developer_diversities):
 
 
 # --- OTHER UTILITIES ---
+
+def get_developer_spotify_ids():
+    """
+    Returns the developer Spotify IDs used as the taste score cohort, from either
+    DEV_SPOTIFY_IDS (comma-separated, any length) or DEV1_SPOTIFY_ID ... DEV5_SPOTIFY_ID.
+    """
+
+    dev_ids = [dev_id.strip() for dev_id in os.getenv('DEV_SPOTIFY_IDS', '').split(',') if dev_id.strip()]
+    for n in range(1, 6):
+        dev_id = os.getenv(f'DEV{n}_SPOTIFY_ID')
+        if dev_id and dev_id not in dev_ids:
+            dev_ids.append(dev_id)
+    return dev_ids
   
 def get_track_url_from_id(track_id):
     return f"http://open.spotify.com/track/{track_id}"
@@ -215,6 +236,72 @@ def normalize_spotify_date(date_str):
         # Already valid yyyy-mm-dd
         return date_str
 
+def build_history_rows(spotify_id, listens):
+    """
+    Returns the batch insert rows for a user's parsed Listens (helpers/listening_records.py) as
+    (artist_rows, tracks_rows, listening_history_rows, artists_tracks_rows).
+    """
+
+    artist_rows = []
+    tracks_rows = []
+    listening_history_rows = []
+    artists_tracks_rows = []
+
+    # One row per distinct track (repeat plays share a Track object)
+    seen_tracks = set()
+
+    for listen in listens:
+        track = listen.track
+        artist_id = track.artists[0][0]  # just the first artist for now
+
+        # Add variables for batch listening_history update
+        listening_history_rows.append(
+            (spotify_id, track.id, listen.played_at, listen.context if listen.context else "NULL"))
+
+        if track.id in seen_tracks:
+            continue
+        seen_tracks.add(track.id)
+
+        # Add variables for batch tracks update
+        tracks_rows.append((track.id, track.name, artist_id, track.duration_ms, track.album_name,
+                            normalize_spotify_date(track.release_date), track.image_url))
+
+        for artist_id, artist_name in track.artists:
+            artists_tracks_rows.append((artist_id, track.id))
+            artist_rows.append((artist_id, artist_name))
+
+    # Deduplicate rows by play — a track played at the same moment is the same listen
+    dedup = {}
+    for row in listening_history_rows:
+        dedup[(row[1], row[2])] = row
+
+    # only unique rows go to Postgres
+    return artist_rows, tracks_rows, list(dedup.values()), artists_tracks_rows
+
+def format_song_of_the_day(current_song):
+    """Returns the song of the day in the JSON format the frontend expects, from DB output."""
+
+    # * current_song format: (track_id, track_name, song_img_url, album_name, artist_names, artist_ids, selected_at)
+    track_id = current_song[0]
+    track_name = current_song[1]
+    song_img_url = current_song[2]
+    album_name = current_song[3] if len(current_song) > 3 else None
+    artist_names = current_song[4] if len(current_song) > 4 else []
+    artist_ids = current_song[5] if len(current_song) > 5 else []
+
+    # Format artist names as a string (comma-separated)
+    artists_str = ", ".join(artist_names) if artist_names else "Unknown Artist"
+
+    return {
+        'id': track_id,
+        'track_name': track_name,
+        'artists': artists_str,
+        'artist_ids': artist_ids,
+        'album_image': song_img_url,
+        'spotify_url': get_track_url_from_id(track_id),
+        'album_name': album_name
+    }
+
 def clean_db_listening_history(db_output):
     """Returns listening history in JSON format from DB output."""
 
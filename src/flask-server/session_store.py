@@ -0,0 +1,240 @@
+# Prologue
+# Name: session_store.py
+# Description: Server-side Flask sessions. The cookie carries only a random session ID; the session
+#              data (Spotify tokens, spotify_id) lives in memory, in files, or in Postgres, so it never
+#              travels with each request and can be invalidated on the server.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.1
+# Pre/post conditions
+#   - Pre: SESSION_BACKEND is cookie (default, Flask's signed cookie), memory (single process only), file, or postgres.
+#   - Post: Sessions are only written when they change; emptied sessions are deleted with their cookie.
+# Errors: A session that can't be loaded (missing, expired, or the store is down) starts out empty.
+#         The memory store refuses to start when WEB_CONCURRENCY says there is more than one worker.
+
+import hashlib
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from app_logging import get_logger
+from helpers.ttl_cache import TTLCache
+
+log = get_logger("sessions")
+
+# Which store to use, and its settings. The default needs no shared storage, so it works with any
+# number of workers; memory sessions only exist in the worker that created them.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "cookie").lower()
+SESSION_FILE_DIR = os.getenv("SESSION_FILE_DIR", "flask_sessions")
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+
+# Postgres sessions are cached in-process this long, so most requests never query the database.
+# Another worker's change to the same session (e.g. logout) can take this long to be seen.
+POSTGRES_CACHE_SECONDS = 5
+
+# How often expired sessions are swept out of the file and Postgres stores
+SWEEP_INTERVAL_SECONDS = 3600
+
+
+def storage_key(sid):
+    """The key a session is stored under: a hash of its ID, so a leaked store doesn't leak live cookies"""
+    return hashlib.sha256(sid.encode("utf-8")).hexdigest()
+
+
+class MemorySessionStore:
+    def __init__(self, maxsize=SESSION_MAX_ENTRIES):
+        '''In-process LRU store; sessions are lost on restart and not shared between workers'''
+        self.sessions = TTLCache(ttl=None, maxsize=maxsize)
+
+    def load(self, key):
+        data = self.sessions.get(key)
+        return dict(data) if data is not None else None
+
+    def save(self, key, data, ttl):
+        self.sessions.set(key, dict(data), ttl=ttl)
+
+    def delete(self, key):
+        self.sessions.invalidate(key)
+
+
+class FileSessionStore:
+    def __init__(self, directory=SESSION_FILE_DIR):
+        '''One JSON file per session in directory; shared by every worker on the machine'''
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.swept_at = 0.0
+        self.sweep_lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        try:
+            with open(self.path(key), "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if stored["expires_at"] <= time.time():
+            self.delete(key)
+            return None
+        return stored["data"]
+
+    def save(self, key, data, ttl):
+        # Write to a temporary file and rename it over the old one, so readers never see half a session
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": time.time() + ttl, "data": data}, f)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.maybe_sweep()
+
+    def delete(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def maybe_sweep(self):
+        '''Remove expired session files, at most once per SWEEP_INTERVAL_SECONDS'''
+        now = time.time()
+        if now - self.swept_at < SWEEP_INTERVAL_SECONDS or not self.sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self.swept_at = now
+            for name in os.listdir(self.directory):
+                if not name.startswith(".tmp-"):
+                    self.load(name)  # deletes the file if it has expired
+        finally:
+            self.sweep_lock.release()
+
+
+class PostgresSessionStore:
+    def __init__(self, get_db):
+        '''Sessions in the http_sessions table, shared by every worker; get_db returns the DBConnection'''
+        self.get_db = get_db
+        self.table_ready = False
+        self.cache = TTLCache(ttl=POSTGRES_CACHE_SECONDS, maxsize=SESSION_MAX_ENTRIES)
+        self.swept_at = 0.0
+
+    def db(self):
+        db = self.get_db()
+        if db is None:
+            raise ConnectionError("Database unavailable for sessions")
+        if not self.table_ready:
+            db.create_http_sessions_table()
+            self.table_ready = True
+        return db
+
+    def load(self, key):
+        data = self.cache.get(key)
+        if data is None:
+            data = self.db().get_http_session(key)
+            if data is not None:
+                self.cache.set(key, data)
+        return dict(data) if data is not None else None
+
+    def save(self, key, data, ttl):
+        db = self.db()
+        db.save_http_session(key, data, ttl)
+        self.cache.set(key, dict(data))
+
+        # Sweep expired rows now and then (the indexed expires_at keeps this cheap)
+        if time.time() - self.swept_at >= SWEEP_INTERVAL_SECONDS:
+            self.swept_at = time.time()
+            db.delete_expired_http_sessions()
+
+    def delete(self, key):
+        self.cache.invalidate(key)
+        self.db().delete_http_session(key)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None):
+        '''A session dict that remembers whether it was changed, and the ID it is stored under'''
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.modified = False
+
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            try:
+                data = self.store.load(storage_key(sid))
+            except Exception as e:
+                log.warning("Could not load session: %s", e)
+                data = None
+            if data is not None:
+                return ServerSideSession(data, sid)
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # Emptied session (e.g. logout): forget it on the server and in the browser
+        if not session:
+            if session.modified and session.sid:
+                self.store.delete(storage_key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        # Unchanged sessions cost nothing to save; the browser already has the cookie
+        if not session.modified:
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        ttl = app.permanent_session_lifetime.total_seconds()
+        self.store.save(storage_key(session.sid), dict(session), ttl)
+
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def make_store(backend, get_db=None):
+    """Build the session store named by backend (memory, file or postgres)"""
+    if backend == "memory":
+        # Each worker would have its own sessions, so a login would only work on one of them
+        workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+        if workers > 1:
+            raise ValueError(f"SESSION_BACKEND 'memory' can't be shared by {workers} workers "
+                             "(WEB_CONCURRENCY); use cookie, file or postgres")
+        return MemorySessionStore()
+    if backend == "file":
+        return FileSessionStore()
+    if backend == "postgres":
+        return PostgresSessionStore(get_db)
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r} (expected memory, file, postgres or cookie)")
+
+
+def init_app(app, get_db=None, backend=None):
+    """Serve app's sessions from the configured server-side store (cookie keeps Flask's default)"""
+    backend = backend or SESSION_BACKEND
+    if backend == "cookie":
+        return
+    app.session_interface = ServerSideSessionInterface(make_store(backend, get_db))
@@ -0,0 +1,287 @@
+# Prologue
+# Name: similarity_index.py
+# Description: Offline and incremental "listeners like you" index. Turns every user's genre counts
+#              into a compact float32 matrix and stores each user's top-K most similar listeners.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.1
+# Pre/post conditions
+#   - Pre: user_metrics.genre_counts must be populated (done by the diversity score endpoint).
+#   - Post: The user_similarity table holds up to K neighbours per user, ranked by cosine similarity.
+#           Users with no genre counts have no neighbours and are nobody's neighbour.
+# Errors: Database errors are raised to the caller (background updates log them).
+
+import argparse
+import threading
+
+import numpy as np
+
+from app_logging import get_logger
+
+log = get_logger("similarity")
+
+# Default number of neighbours kept per user
+DEFAULT_K = 10
+
+# Rows compared at once in the exact search (block x N float32 similarities in memory)
+BLOCK_SIZE = 2048
+
+# Approximate mode: random-hyperplane hashing with this many tables / planes per table
+LSH_TABLES = 4
+LSH_PLANES = 8
+
+
+def to_unit_matrix(counts_rows):
+    """Genre count rows -> float32 matrix with unit-length rows (all-zero rows stay zero)"""
+    matrix = np.asarray(counts_rows, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def top_k_rows(matrix, rows, k, candidates=None):
+    """
+    Exact top-k cosine neighbours of the given rows of a unit-row matrix, optionally only among
+    candidates (a boolean mask over all rows). Returns (neighbour indices, similarities), both
+    len(rows) x min(k, N - 1), best first; slots without a candidate have similarity -inf.
+    """
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.empty((len(rows), 0), dtype=np.int64), np.empty((len(rows), 0), dtype=np.float32)
+
+    block = matrix[rows] @ matrix.T
+    if candidates is not None:
+        block[:, ~candidates] = -np.inf
+
+    # A user is not their own neighbour
+    block[np.arange(len(rows)), rows] = -np.inf
+
+    # Unordered top-k, then sort just those k
+    part = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    part_sims = np.take_along_axis(block, part, axis=1)
+    order = np.argsort(-part_sims, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_sims, order, axis=1)
+
+
+def exact_top_k(matrix, k, block_size=BLOCK_SIZE):
+    """
+    Exact top-k cosine neighbours of every row of a unit-row matrix, computed in blocks.
+    Returns (neighbour indices, similarities), both N x min(k, N - 1), best first.
+    """
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    indices = np.empty((n, max(k, 0)), dtype=np.int64)
+    sims = np.empty((n, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return indices, sims
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        indices[start:stop], sims[start:stop] = top_k_rows(matrix, np.arange(start, stop), k)
+
+    return indices, sims
+
+
+def approximate_top_k(matrix, k, tables=LSH_TABLES, planes=LSH_PLANES, block_size=BLOCK_SIZE, seed=581):
+    """
+    Approximate top-k neighbours for large N. Each hash table splits users by the signs of
+    random hyperplane projections; exact search runs only inside each bucket, and the best
+    k found across all tables are kept. Missing neighbours are padded with index -1.
+    """
+    n, dims = matrix.shape
+    rng = np.random.default_rng(seed)
+    best_indices = np.full((n, k), -1, dtype=np.int64)
+    best_sims = np.full((n, k), -np.inf, dtype=np.float32)
+    powers = 1 << np.arange(planes)
+
+    for _ in range(tables):
+        hyperplanes = rng.standard_normal((dims, planes)).astype(np.float32)
+        codes = ((matrix @ hyperplanes) > 0).astype(np.int64) @ powers
+
+        for code in np.unique(codes):
+            members = np.flatnonzero(codes == code)
+            if len(members) < 2:
+                continue
+
+            local_indices, local_sims = exact_top_k(matrix[members], k, block_size)
+            found = members[local_indices]
+
+            # Merge with what earlier tables found, dropping duplicates
+            merged_indices = np.concatenate([best_indices[members], found], axis=1)
+            merged_sims = np.concatenate([best_sims[members], local_sims], axis=1)
+            for row, user in enumerate(members):
+                _, first = np.unique(merged_indices[row], return_index=True)
+                keep = first[merged_indices[row][first] >= 0]
+                keep = keep[np.argsort(-merged_sims[row][keep])][:k]
+                best_indices[user] = -1
+                best_sims[user] = -np.inf
+                best_indices[user, :len(keep)] = merged_indices[row][keep]
+                best_sims[user, :len(keep)] = merged_sims[row][keep]
+
+    return best_indices, best_sims
+
+
+def neighbour_rows(user_ids, indices, sims, neighbour_ids=None):
+    """
+    (user_id, neighbor_user_id, similarity, rank) rows for the user_similarity table. indices point
+    into neighbour_ids (default: user_ids). Neighbours with nothing in common (similarity <= 0) are left out.
+    """
+    if neighbour_ids is None:
+        neighbour_ids = user_ids
+    rows = []
+    for row, user_id in enumerate(user_ids):
+        rank = 1
+        for index, sim in zip(indices[row], sims[row]):
+            if index < 0 or not np.isfinite(sim) or sim <= 0:
+                continue
+            rows.append((int(user_id), int(neighbour_ids[index]), round(float(sim), 4), rank))
+            rank += 1
+    return rows
+
+
+def similarity_floors(sims, k):
+    """
+    For each row of best-first similarities, the similarity a new neighbour has to beat to make
+    the top k: the k-th best when there are k positive ones, otherwise 0
+    """
+    if sims.shape[1] < k:
+        return np.zeros(sims.shape[0], dtype=np.float32)
+    kth = sims[:, k - 1]
+    return np.where(np.isfinite(kth) & (kth > 0), kth, 0).astype(np.float32)
+
+
+class SimilarityIndex:
+    def __init__(self, db, k=DEFAULT_K):
+        '''In-memory copy of every user's genre vector, kept in sync as users' counts change'''
+        self.db = db
+        self.k = k
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.matrix = None      # N x B float32, unit rows
+        self.positions = {}     # user_id -> row in matrix
+        self.active = np.empty(0, dtype=bool)       # Rows with any genre counts; all-zero users are never neighbours
+        self.floors = np.empty(0, dtype=np.float32)  # Similarity a newcomer must beat to enter each user's list
+        self.computed = set()   # user_ids whose stored list was computed (or loaded) for their current vector
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        '''Load every stored genre count vector, and each user's current neighbour floor, from the database'''
+        rows = self.db.get_all_genre_counts()
+        self.user_ids = np.asarray([user_id for (user_id, _, _) in rows], dtype=np.int64)
+        self.matrix = to_unit_matrix([counts for (_, _, counts) in rows]) if rows else None
+        self.positions = {int(user_id): i for i, user_id in enumerate(self.user_ids)}
+        self.active = self.matrix.any(axis=1) if rows else np.empty(0, dtype=bool)
+        self.floors = np.zeros(len(self.user_ids), dtype=np.float32)
+        self.computed = set()
+        for user_id, floor in self.db.get_similarity_floors(self.k):
+            position = self.positions.get(user_id)
+            if position is not None:
+                self.floors[position] = floor
+                self.computed.add(user_id)
+        self.loaded = True
+
+    def rebuild(self, approximate=False, block_size=BLOCK_SIZE):
+        '''Recompute every user's neighbours and replace the user_similarity table. Returns the row count.'''
+        with self.lock:
+            self.load()
+            if self.matrix is None:
+                return 0
+
+            # Users without genre counts neither get nor are neighbours
+            active = np.flatnonzero(self.active)
+            if approximate:
+                indices, sims = approximate_top_k(self.matrix[active], self.k, block_size=block_size)
+            else:
+                indices, sims = exact_top_k(self.matrix[active], self.k, block_size)
+            rows = neighbour_rows(self.user_ids[active], indices, sims)
+            self.floors[:] = 0
+            self.floors[active] = similarity_floors(sims, self.k)
+            self.computed = set(int(u) for u in self.user_ids)
+        self.db.replace_user_similarity(rows)
+        return len(rows)
+
+    def update_user(self, user_id, genre_counts):
+        '''
+        Incremental refresh after one user's genre counts change: updates their vector, recomputes
+        their neighbours, and recomputes every other list they now belong in (their similarity beats
+        that list's floor) or are already in. Returns False if unchanged.
+        '''
+        vector = to_unit_matrix(genre_counts)[0]
+
+        with self.lock:
+            if not self.loaded:
+                self.load()
+
+            position = self.positions.get(user_id)
+            # Skip only if their list was already computed for this vector; the first load may already
+            # hold counts written just before it, and a user without a stored list always gets one
+            if (position is not None and np.array_equal(self.matrix[position], vector)
+                    and user_id in self.computed):
+                return False
+
+            # Add or overwrite this user's row
+            if position is None:
+                self.user_ids = np.append(self.user_ids, np.int64(user_id))
+                self.matrix = vector[None, :] if self.matrix is None else np.vstack([self.matrix, vector])
+                self.active = np.append(self.active, False)
+                self.floors = np.append(self.floors, np.float32(0))
+                position = len(self.user_ids) - 1
+                self.positions[user_id] = position
+            else:
+                self.matrix[position] = vector
+            self.active[position] = vector.any()
+
+            # Lists that gain, lose or reorder this user, plus the user's own
+            sims = self.matrix @ vector
+            joining = np.flatnonzero(self.active & (sims > self.floors))
+            listing = [self.positions[u] for u in self.db.get_users_listing_neighbor(user_id) if u in self.positions]
+            affected = np.unique(np.concatenate([[position], joining, listing]).astype(np.int64))
+
+            rows = []
+            for start in range(0, len(affected), BLOCK_SIZE):
+                chunk = affected[start:start + BLOCK_SIZE]
+                indices, chunk_sims = top_k_rows(self.matrix, chunk, self.k, self.active)
+                chunk_sims[~self.active[chunk]] = -np.inf
+                rows.extend(neighbour_rows(self.user_ids[chunk], indices, chunk_sims, self.user_ids))
+                self.floors[chunk] = similarity_floors(chunk_sims, self.k)
+
+            # Written under the lock so overlapping updates can't store lists out of order
+            self.db.replace_user_neighbors(self.user_ids[affected].tolist(), rows)
+            self.computed.update(int(u) for u in self.user_ids[affected])
+        return True
+
+    def update_user_in_background(self, user_id, genre_counts):
+        '''Run update_user on a daemon thread so requests don't wait on it'''
+
+        def run():
+            try:
+                self.update_user(user_id, genre_counts)
+            except Exception as e:
+                log.error("Error updating similar listeners: %s", e, extra={"user_id": user_id})
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+# Offline rebuild of the whole index
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from DBConnection import DBConnection
+
+    parser = argparse.ArgumentParser(description="Rebuild the user_similarity (listeners like you) table.")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="neighbours to keep per user")
+    parser.add_argument("--approximate", action="store_true", help="use random-hyperplane hashing for large N")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="rows compared per batch")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = DBConnection()
+    try:
+        if not db.connected:
+            raise SystemExit("Database connection failed.")
+        count = SimilarityIndex(db, args.k).rebuild(args.approximate, args.block_size)
+        print(f"Stored {count} neighbour rows")
+    finally:
+        db.killCloudflare()
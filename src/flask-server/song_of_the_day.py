@@ -0,0 +1,153 @@
+# Prologue
+# Name: song_of_the_day.py
+# Description: Select, refresh, and cache the song of the day so most requests never touch the database
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.1
+# Pre/post conditions
+#   - Pre: The song_of_the_day table and candidate view must exist (created by DBConnection on connect).
+#   - Post: The formatted song of the day is cached in-process until its next rollover.
+# Errors: Database errors are raised to the caller (the scheduler logs them and retries).
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from server_utils import format_song_of_the_day
+from app_logging import get_logger
+
+log = get_logger("song_of_the_day")
+
+# How long to remember that there is no song of the day before asking the database again
+EMPTY_RETRY_SECONDS = 60
+
+# How long the scheduler waits before retrying a failed rollover
+SCHEDULER_RETRY_SECONDS = 60
+
+# Keep serving the previous song this long past the boundary while the scheduler swaps it in,
+# so requests never have to do the rollover themselves
+SCHEDULER_GRACE_SECONDS = 300
+
+
+class SongOfTheDay:
+    def __init__(self, db, rollover_hour=None):
+        '''
+        Initialize the song of the day cache on top of a DBConnection.
+        rollover_hour (0-23, UTC) switches from "24 hours after selection" to a fixed daily rollover.
+        '''
+        self.db = db
+        self.rollover_hour = rollover_hour
+        self.payload = None     # Formatted song of the day (None if there is none)
+        self.expires_at = 0.0   # time.time() at which the cached payload goes stale
+        self.lock = threading.Lock()  # Single-flight: one thread refreshes, the rest wait and reuse
+        self.scheduler = None
+        self.stop_event = threading.Event()
+
+    def get(self):
+        '''Return the formatted song of the day (a cache read unless the cache has gone stale)'''
+
+        # Serve from the cache until the next rollover
+        if time.time() < self.expires_at:
+            return self.payload
+
+        with self.lock:
+            # Another request may have refreshed the cache while we waited for the lock
+            if time.time() < self.expires_at:
+                return self.payload
+            return self.refresh_locked()
+
+    def cached(self):
+        '''(True, payload) while the cached payload is fresh, otherwise (False, None); never touches the database'''
+        payload, expires_at = self.payload, self.expires_at
+        if time.time() < expires_at:
+            return True, payload
+        return False, None
+
+    def refresh(self):
+        '''Roll the song over if it is due, then recompute and cache the formatted payload'''
+        with self.lock:
+            return self.refresh_locked()
+
+    def refresh_locked(self):
+        '''refresh() body; the caller must hold self.lock'''
+
+        since = self.last_rollover_time()
+
+        # One query tells us the current song and whether it needs replacing
+        current_song, is_stale, seconds_until_rollover = self.db.get_song_of_the_day_state(since)
+
+        if is_stale:
+            if self.rollover(since) is None:
+                # No tracks available -> don't ask again for a while
+                self.cache(None, EMPTY_RETRY_SECONDS)
+                return None
+            current_song, _, seconds_until_rollover = self.db.get_song_of_the_day_state(since)
+
+        if current_song is None:
+            self.cache(None, EMPTY_RETRY_SECONDS)
+            return None
+
+        # With a fixed schedule the song lives until the next boundary (plus the scheduler's grace)
+        if self.rollover_hour is not None:
+            seconds_until_rollover = self.next_rollover_time().timestamp() - time.time()
+            if self.scheduler is not None:
+                seconds_until_rollover += SCHEDULER_GRACE_SECONDS
+
+        self.cache(format_song_of_the_day(current_song), seconds_until_rollover)
+        return self.payload
+
+    def rollover(self, since=None):
+        '''Pick a new song of the day. Returns the current track_id afterwards, or None if there are no tracks.'''
+
+        # Atomic and guarded by an advisory lock, so other server processes can't flip it twice
+        return self.db.rollover_song_of_the_day(since)
+
+    def cache(self, payload, seconds):
+        '''Cache a formatted payload for the given number of seconds'''
+        self.payload = payload
+        self.expires_at = time.time() + max(seconds, 0)
+
+    def invalidate(self):
+        '''Forget the cached song so the next call goes back to the database'''
+        self.expires_at = 0.0
+
+    # --- SCHEDULED ROLLOVER ---
+
+    def last_rollover_time(self):
+        '''Most recent fixed rollover boundary (UTC), or None when using the 24 hour rule'''
+        if self.rollover_hour is None:
+            return None
+        now = datetime.now(timezone.utc)
+        boundary = now.replace(hour=self.rollover_hour, minute=0, second=0, microsecond=0)
+        if boundary > now:
+            boundary -= timedelta(days=1)
+        return boundary
+
+    def next_rollover_time(self):
+        '''Next fixed rollover boundary (UTC)'''
+        return self.last_rollover_time() + timedelta(days=1)
+
+    def start_scheduler(self):
+        '''Start a daemon thread that rolls the song over at rollover_hour and pre-warms the cache'''
+        if self.rollover_hour is None or self.scheduler is not None:
+            return
+        self.scheduler = threading.Thread(target=self.run_scheduler, name="song-of-the-day", daemon=True)
+        self.scheduler.start()
+
+    def stop_scheduler(self):
+        '''Ask the scheduler thread to exit'''
+        self.stop_event.set()
+
+    def run_scheduler(self):
+        '''Scheduler loop: refresh now, then sleep until each following boundary'''
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                log.error("Error rolling over song of the day: %s", e)
+                self.stop_event.wait(SCHEDULER_RETRY_SECONDS)
+                continue
+
+            # Sleep until the next boundary (waking early if asked to stop)
+            delay = self.next_rollover_time().timestamp() - time.time()
+            self.stop_event.wait(max(delay, 1))
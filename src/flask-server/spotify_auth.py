@@ -0,0 +1,171 @@
+# Prologue
+# Name: spotify_auth.py
+# Description: Spotify accounts service helpers shared by the login routes and background jobs, and a
+#              server-side per-user token cache that refreshes access tokens before they expire
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET are set (SPOTIFY_ACCOUNTS_URL is optional).
+#   - Post: None.
+# Errors: A refresh Spotify refuses raises TokenRefreshError.
+
+import os
+import threading
+import time
+import zlib
+
+from app_logging import get_logger
+from helpers.ttl_cache import TTLCache
+from metrics import timed_request
+
+log = get_logger("spotify_auth")
+
+
+class TokenRefreshError(Exception):
+    '''Spotify would not refresh the token (revoked or invalid refresh token, or the service failed)'''
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def token_url():
+    """Spotify's token endpoint (read on every call so .env values loaded after import still apply)"""
+    return f"{os.getenv('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com')}/api/token"
+
+
+def refresh_access_token(refresh_token):
+    """
+    Exchange a refresh token for a new access token.
+    Returns (access_token, expires_at, refresh_token); expires_at is a Unix timestamp, and
+    refresh_token is the rotated one if Spotify issued a new one, otherwise the one passed in.
+    """
+    req_body = {
+        'grant_type': 'refresh_token',
+        'refresh_token': refresh_token,
+        'client_id': os.getenv('SPOTIFY_CLIENT_ID'),
+        'client_secret': os.getenv('SPOTIFY_CLIENT_SECRET')
+    }
+    response = timed_request("spotify", "POST", token_url(), data=req_body)
+    if response.status_code != 200:
+        raise TokenRefreshError(f"Spotify token refresh failed with status {response.status_code}",
+                                response.status_code)
+
+    token_info = response.json()
+    return (token_info['access_token'],
+            time.time() + int(token_info['expires_in']),
+            token_info.get('refresh_token') or refresh_token)
+
+
+# Refresh synchronously when a token is this close to expiring...
+EXPIRY_MARGIN_SECONDS = 60
+
+# ...and in the background (while still handing out the current token) when it is this close
+REFRESH_AHEAD_SECONDS = 300
+
+# Per-user refresh locks are striped over this many locks to keep memory bounded
+LOCK_STRIPES = 64
+
+
+class TokenManager:
+    def __init__(self, db=None, maxsize=10000):
+        '''
+        Per-user Spotify access token cache that refreshes tokens before they expire.
+        db (a DBConnection) supplies stored refresh tokens and receives refreshed tokens.
+        '''
+        self.db = db
+        # spotify_id -> (access_token, expires_at, refresh_token), dropped once past the expiry margin
+        self.tokens = TTLCache(ttl=None, maxsize=maxsize)
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.refreshing = set()
+        self.refreshing_lock = threading.Lock()
+
+    def remember(self, spotify_id, access_token, expires_at, refresh_token=None):
+        '''Cache a token pair for the user (e.g. the one just issued at login)'''
+        self.tokens.set(spotify_id, (access_token, expires_at, refresh_token),
+                        ttl=max(expires_at - time.time() - EXPIRY_MARGIN_SECONDS, 0))
+
+    def invalidate(self, spotify_id):
+        '''Forget the user's cached token (e.g. after Spotify rejected it)'''
+        self.tokens.invalidate(spotify_id)
+
+    def needs_refresh(self, spotify_id):
+        '''True if get() would refresh the user's token (or start a background refresh) before returning it'''
+        entry = self.tokens.get(spotify_id)
+        return entry is None or time.time() >= entry[1] - REFRESH_AHEAD_SECONDS
+
+    def get(self, spotify_id, refresh_token=None, current=None):
+        '''
+        Return (access_token, expires_at, refresh_token) for the user, refreshing first if the cached
+        token is about to expire. current is a caller-held (access_token, expires_at) pair (such as the
+        session's) used when nothing is cached. Raises TokenRefreshError if a needed refresh fails.
+        '''
+        entry = self.get_cached(spotify_id, refresh_token, current)
+        if entry is None:
+            return self.refresh(spotify_id, refresh_token)
+        return entry
+
+    def get_cached(self, spotify_id, refresh_token=None, current=None):
+        '''
+        Like get(), but never refreshes on the caller's thread: returns None when the token has to be
+        refreshed before it can be used (for callers that do that elsewhere, e.g. off an event loop).
+        '''
+        entry = self.tokens.get(spotify_id)
+        if entry is None and current is not None and time.time() < current[1] - EXPIRY_MARGIN_SECONDS:
+            self.remember(spotify_id, current[0], current[1], refresh_token)
+            entry = (current[0], current[1], refresh_token)
+
+        if entry is None:
+            return None
+
+        # Still usable; renew it off the request path if it is getting close
+        if time.time() >= entry[1] - REFRESH_AHEAD_SECONDS:
+            self.refresh_in_background(spotify_id, entry[2] or refresh_token)
+        return entry
+
+    def refresh(self, spotify_id, refresh_token=None):
+        '''
+        Refresh the user's access token now (unless another thread just did) and return the new
+        (access_token, expires_at, refresh_token). Uses the newest refresh token known: the cached
+        one (Spotify may rotate it), then refresh_token, then the one stored in the database.
+        '''
+        with self.locks[zlib.crc32(spotify_id.encode("utf-8")) % LOCK_STRIPES]:
+            entry = self.tokens.get(spotify_id)
+            if entry is not None and time.time() < entry[1] - REFRESH_AHEAD_SECONDS:
+                return entry
+
+            refresh_token = (entry[2] if entry else None) or refresh_token
+            if refresh_token is None and self.db is not None:
+                refresh_token = self.db.get_refresh_token(spotify_id)
+            if refresh_token is None:
+                raise TokenRefreshError(f"No refresh token for {spotify_id}")
+
+            access_token, expires_at, refresh_token = refresh_access_token(refresh_token)
+            self.remember(spotify_id, access_token, expires_at, refresh_token)
+            if self.db is not None:
+                try:
+                    self.db.update_user_tokens(spotify_id, access_token, refresh_token)
+                except Exception as e:
+                    log.warning("Could not store refreshed tokens for %s: %s", spotify_id, e)
+            return access_token, expires_at, refresh_token
+
+    def refresh_in_background(self, spotify_id, refresh_token=None):
+        '''Start a refresh on a daemon thread unless one is already running for the user'''
+        with self.refreshing_lock:
+            if spotify_id in self.refreshing:
+                return
+            self.refreshing.add(spotify_id)
+        threading.Thread(target=self.run_background_refresh, args=(spotify_id, refresh_token),
+                         daemon=True).start()
+
+    def run_background_refresh(self, spotify_id, refresh_token):
+        try:
+            self.refresh(spotify_id, refresh_token)
+        except Exception as e:
+            # The current token is still valid; the next request past the margin retries synchronously
+            log.warning("Background token refresh failed for %s: %s", spotify_id, e)
+        finally:
+            with self.refreshing_lock:
+                self.refreshing.discard(spotify_id)
@@ -0,0 +1,82 @@
+# Prologue
+# Name: startup_profile.py
+# Description: Report how long the server takes to cold start, broken down by imported module
+#              (from python -X importtime), so cold-start regressions can be tracked in CI.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: Run from any directory; the server is imported from this file's directory.
+#   - Post: Prints the slowest imports and the total; exits 1 if --budget-ms is exceeded.
+# Errors: Exits 2 if the server fails to import.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# What a worker does at startup: import the server and build the app (no DB connection)
+STARTUP_CODE = (
+    "import time; start = time.perf_counter(); "
+    "import server; server.create_app(); "
+    "print(f'STARTUP_MS {(time.perf_counter() - start) * 1000:.3f}')"
+)
+
+
+def profile_startup():
+    """Run a fresh interpreter with -X importtime. Returns (total ms, [(module, self ms, cumulative ms)])."""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(2)
+
+    total_ms = None
+    for line in result.stdout.splitlines():
+        if line.startswith("STARTUP_MS "):
+            total_ms = float(line.split()[1])
+
+    # Lines look like "import time:       600 |     155110 | server" (microseconds)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+
+    return total_ms, modules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the server's cold start (import + create_app).")
+    parser.add_argument("--top", type=int, default=25, help="number of modules to list")
+    parser.add_argument("--sort", choices=("cumulative", "self"), default="cumulative")
+    parser.add_argument("--json", action="store_true", help="print a machine-readable report")
+    parser.add_argument("--budget-ms", type=float, default=None, help="exit 1 if startup takes longer")
+    args = parser.parse_args()
+
+    total_ms, modules = profile_startup()
+    key = 2 if args.sort == "cumulative" else 1
+    slowest = sorted(modules, key=lambda m: m[key], reverse=True)[:args.top]
+
+    if args.json:
+        print(json.dumps({
+            "total_ms": total_ms,
+            "modules": [{"module": m, "self_ms": s, "cumulative_ms": c} for (m, s, c) in slowest],
+        }, indent=2))
+    else:
+        print(f"{'self ms':>10} {'cumul ms':>10}  module")
+        for name, self_ms, cumulative_ms in slowest:
+            print(f"{self_ms:>10.1f} {cumulative_ms:>10.1f}  {name}")
+        print(f"\nTotal startup (import server + create_app): {total_ms:.1f} ms")
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"Startup took {total_ms:.1f} ms, over the {args.budget_ms:.1f} ms budget", file=sys.stderr)
+        raise SystemExit(1)
@@ -0,0 +1,141 @@
+# Prologue
+# Name: taste_engine.py
+# Description: Cohort-based taste scoring. Compares users' full genre distributions (one count per
+#              root genre bucket) to a reference cohort using Jensen-Shannon distance or cosine similarity.
+# Programmer: Scorify Team
+# Creation date: 10/19/26
+# Last revision date: 10/19/26
+# Revisions: 1.0
+# Pre/post conditions
+#   - Pre: Genre count vectors must all have one entry per root genre, in ROOTS order.
+#   - Post: Returns taste scores between 0 and 100 (higher = closer to the cohort).
+# Errors: Raises ValueError for an empty cohort or an unknown metric.
+
+import argparse
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# Supported ways of comparing distributions
+METRICS = ("jensen-shannon", "cosine")
+
+# Which metric the server uses by default
+DEFAULT_METRIC = os.getenv("TASTE_METRIC", "jensen-shannon")
+
+# Score users in blocks of this many rows to bound memory (block x cohort x buckets floats)
+BLOCK_SIZE = 65536
+
+
+def normalize_rows(matrix):
+    """Scales each row to sum to 1 (all-zero rows stay zero)"""
+    totals = matrix.sum(axis=1, keepdims=True)
+    return np.divide(matrix, totals, out=np.zeros_like(matrix), where=totals > 0)
+
+
+def unit_rows(matrix):
+    """Scales each row to unit length (all-zero rows stay zero)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def jensen_shannon_distances(p, q):
+    """
+    Pairwise Jensen-Shannon distances (base 2, so in [0, 1]) between the rows of
+    p (N x B) and q (M x B), both already normalized to distributions. Returns N x M.
+    """
+    p = p[:, None, :]
+    q = q[None, :, :]
+    m = (p + q) / 2
+
+    # 0 * log(0) is taken as 0; m > 0 wherever p or q is
+    def kl(a):
+        ratio = np.divide(a, m, out=np.ones_like(m), where=a > 0)
+        return (a * np.log2(ratio)).sum(axis=2)
+
+    divergence = (kl(p) + kl(q)) / 2
+    return np.sqrt(np.clip(divergence, 0.0, 1.0))
+
+
+class TasteEngine:
+    def __init__(self, cohort_counts, metric=DEFAULT_METRIC):
+        '''Precompute the cohort's vectors from its genre counts (one row per cohort member)'''
+
+        if metric not in METRICS:
+            raise ValueError(f"Unknown taste metric {metric!r}; expected one of {METRICS}")
+
+        cohort = np.asarray(cohort_counts, dtype=np.float64)
+        if cohort.ndim != 2 or cohort.shape[0] == 0:
+            raise ValueError("Taste cohort must contain at least one genre count vector")
+
+        self.metric = metric
+        self.cohort_distributions = normalize_rows(cohort) # For Jensen-Shannon
+        self.cohort_units = unit_rows(cohort)              # For cosine (transposed once for matmul)
+        self.cohort_units_t = np.ascontiguousarray(self.cohort_units.T)
+
+    def similarities(self, users):
+        '''Similarity (0-1) of every user row to every cohort member -> N x M'''
+        if self.metric == "cosine":
+            return unit_rows(users) @ self.cohort_units_t
+        return 1.0 - jensen_shannon_distances(normalize_rows(users), self.cohort_distributions)
+
+    def score_many(self, counts_matrix):
+        '''Taste scores (0-100, rounded to 2 places) for every row of an N x B genre count matrix'''
+
+        users = np.asarray(counts_matrix, dtype=np.float64)
+        if users.ndim == 1:
+            users = users[None, :]
+
+        scores = np.empty(users.shape[0], dtype=np.float64)
+        for start in range(0, users.shape[0], BLOCK_SIZE):
+            block = users[start:start + BLOCK_SIZE]
+            scores[start:start + BLOCK_SIZE] = self.similarities(block).mean(axis=1)
+
+        # Users without any bucketed genres can't be compared
+        scores[users.sum(axis=1) <= 0] = 0.0
+        return np.round(np.clip(scores * 100, 0.0, 100.0), 2)
+
+    def score(self, counts):
+        '''Taste score (0-100) for one user's genre counts'''
+        return float(self.score_many([counts])[0])
+
+
+@lru_cache(maxsize=8)
+def engine_for(cohort_counts, metric=DEFAULT_METRIC):
+    """Returns a (cached) TasteEngine for a cohort given as a tuple of genre count tuples"""
+    return TasteEngine(cohort_counts, metric)
+
+
+def rescore_all_users(db, developer_ids, metric=DEFAULT_METRIC):
+    """Recompute and store every user's taste score against the developer cohort. Returns the count."""
+
+    rows = db.get_all_genre_counts()
+    cohort = db.get_developer_genre_counts(developer_ids)
+    if len(rows) == 0 or len(cohort) == 0:
+        return 0
+
+    # Score everyone at once
+    scores = engine_for(cohort, metric).score_many([counts for (_, _, counts) in rows])
+    db.update_taste_scores([(user_id, float(score)) for (user_id, _, _), score in zip(rows, scores)])
+    return len(rows)
+
+
+# Recompute every stored taste score, e.g. after the developer cohort changes
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from DBConnection import DBConnection
+    from server_utils import get_developer_spotify_ids
+
+    parser = argparse.ArgumentParser(description="Recompute all users' taste scores against the developer cohort.")
+    parser.add_argument("--metric", choices=METRICS, default=DEFAULT_METRIC)
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = DBConnection()
+    try:
+        if not db.connected:
+            raise SystemExit("Database connection failed.")
+        count = rescore_all_users(db, get_developer_spotify_ids(), args.metric)
+        print(f"Rescored {count} users with {args.metric}")
+    finally:
+        db.killCloudflare()